@@ -11,23 +11,44 @@ import matplotlib
 matplotlib.use('Agg')  # 使用非交互式后端
 import numpy as np
 
+from src import casting, hexagram, llm_client
+from src.startup_report import format_report
 
-# 导入增强问答系统
+# 导入增强问答系统（首次使用时才创建实例，并在全部会话间共享）
 try:
-    from src.enhanced_qa_system import enhanced_qa
+    from src.enhanced_qa_system import get_enhanced_qa
     ENHANCED_QA_AVAILABLE = True
 except ImportError:
     ENHANCED_QA_AVAILABLE = False
     print("增强问答系统不可用，使用默认问答")
 
-# 导入增强解卦系统
+# 导入增强解卦系统（首次使用时才创建实例，并在全部会话间共享）
 try:
-    from src.enhanced_divination_system import enhanced_divination
+    from src.enhanced_divination_system import get_enhanced_divination
     ENHANCED_DIVINATION_AVAILABLE = True
 except ImportError:
     ENHANCED_DIVINATION_AVAILABLE = False
     print("增强解卦系统不可用，使用默认解卦")
 
+
+@st.cache_resource(show_spinner="正在加载问答知识库...")
+def load_enhanced_qa():
+    """增强问答系统（跨会话共享的资源缓存）"""
+    return get_enhanced_qa()
+
+
+@st.cache_resource(show_spinner="正在加载解卦知识库...")
+def load_enhanced_divination():
+    """增强解卦系统（跨会话共享的资源缓存）"""
+    return get_enhanced_divination()
+
+
+@st.cache_resource(show_spinner="正在加载RAG知识库...")
+def load_rag_system(knowledge_base_dir):
+    """RAG问答系统（按知识库目录跨会话共享，不再每次提问都重新加载）"""
+    from src.rag_qa_system import IChingRAGSystem
+    return IChingRAGSystem(knowledge_base_path=knowledge_base_dir)
+
 # 设置页面配置
 st.set_page_config(
     page_title="盈在易测系统",
@@ -730,10 +751,10 @@ gua_data = [
     {"id": 4, "name": "蒙卦", "symbol": "010001", "description": "山下出泉，蒙；君子以果行育德", 
      "text": "亨。匪我求童蒙，童蒙求我", "interpretation": "蒙卦象征启蒙教育，需要启发引导，循序渐进。教育者应当有耐心，被教育者应当主动求学。"},
     
-    {"id": 5, "name": "需卦", "symbol": "111011", "description": "云上于天，需；君子以饮食宴乐", 
+    {"id": 5, "name": "需卦", "symbol": "111010", "description": "云上于天，需；君子以饮食宴乐", 
      "text": "有孚，光亨，贞吉，利涉大川", "interpretation": "需卦象征等待，需要耐心和信心，时机成熟自然成功。君子应当保持诚信，等待时机，不可急躁。"},
     
-    {"id": 6, "name": "讼卦", "symbol": "011111", "description": "天与水违行，讼；君子以作事谋始", 
+    {"id": 6, "name": "讼卦", "symbol": "010111", "description": "天与水违行，讼；君子以作事谋始", 
      "text": "有孚窒惕，中吉，终凶", "interpretation": "讼卦象征争讼，提醒人们做事要谨慎，避免争端。君子应当从开始就避免争端，以和为贵。"},
     
     {"id": 7, "name": "师卦", "symbol": "010000", "description": "地中有水，师；君子以容民畜众", 
@@ -742,19 +763,22 @@ gua_data = [
     {"id": 8, "name": "比卦", "symbol": "000010", "description": "水在地上，比；先王以建万国，亲诸侯", 
      "text": "吉。原筮元永贞，无咎", "interpretation": "比卦象征亲近、团结，强调和谐关系。君子应当亲近贤人，团结众人，建立良好的关系。"},
     
-    {"id": 9, "name": "小畜卦", "symbol": "110111", "description": "风行天上，小畜；君子以懿文德", 
+    {"id": 9, "name": "小畜卦", "symbol": "111011", "description": "风行天上，小畜；君子以懿文德", 
      "text": "亨。密云不雨，自我西郊", "interpretation": "小畜卦象征小有积蓄，需要继续努力。君子应当修养品德，积蓄力量，为更大的发展做准备。"},
     
-    {"id": 10, "name": "履卦", "symbol": "111011", "description": "天泽履，君子以辨上下，定民志", 
+    {"id": 10, "name": "履卦", "symbol": "110111", "description": "天泽履，君子以辨上下，定民志", 
      "text": "履虎尾，不咥人，亨", "interpretation": "履卦象征谨慎行事，如履薄冰。君子应当明辨是非，谨慎行事，避免危险。"},
     
-    {"id": 11, "name": "泰卦", "symbol": "000111", "description": "天地交，泰；后以财成天地之道，辅相天地之宜", 
+    {"id": 11, "name": "泰卦", "symbol": "111000", "description": "天地交，泰；后以财成天地之道，辅相天地之宜", 
      "text": "小往大来，吉亨", "interpretation": "泰卦象征通泰，天地交合，万物亨通。君子应当顺应自然，把握时机，实现和谐发展。"},
     
-    {"id": 12, "name": "否卦", "symbol": "111000", "description": "天地不交，否；君子以俭德辟难，不可荣以禄", 
+    {"id": 12, "name": "否卦", "symbol": "000111", "description": "天地不交，否；君子以俭德辟难，不可荣以禄", 
      "text": "否之匪人，不利君子贞，大往小来", "interpretation": "否卦象征闭塞，天地不交，万物不通。君子应当节俭修身，避免奢华，等待时机。"}
 ]
 
+# 卦名 -> 详细卦辞数据（其余卦由卦象核心生成基本信息）
+gua_data_by_name = {gua["name"]: gua for gua in gua_data}
+
 # 爻的类型
 yao_types = {
     "老阳": {"symbol": "111", "value": 1, "name": "老阳"},
@@ -764,9 +788,9 @@ yao_types = {
 }
 
 def render_gua_symbol(symbol):
-    """渲染卦象符号 - 真实卦象效果"""
+    """渲染卦象符号 - 真实卦象效果（符号自下而上书写，显示时上爻在上）"""
     lines = []
-    for char in symbol:
+    for char in reversed(symbol):
         if char == '1':
             lines.append('<div class="yang-line"></div>')
         else:
@@ -777,14 +801,18 @@ def render_hexagram_display(gua, show_loading=False):
     """渲染完整的卦象显示"""
     symbol_html = render_gua_symbol(gua["symbol"])
     
-    # 生成变卦（随机改变一爻）
-    changing_symbol = list(gua["symbol"])
-    change_pos = random.randint(0, 5)
-    changing_symbol[change_pos] = '0' if changing_symbol[change_pos] == '1' else '1'
-    changing_symbol_html = render_gua_symbol(''.join(changing_symbol))
-    
-    # 获取变卦名称
-    changing_gua_name = f"{gua['name']}变卦"
+    # 生成变卦（摇卦得到的变爻，掩码为0即无变爻、不显示变卦；没有变爻信息时随机改变一爻）
+    moving_mask = gua["moving_mask"] if "moving_mask" in gua else 1 << random.randint(0, 5)
+    changing_html = ""
+    if moving_mask:
+        changing_code = hexagram.CHANGED[hexagram.symbol_to_code(gua["symbol"]), moving_mask]
+        changing_html = f'''
+        <div class="hexagram">
+            <div class="hexagram-title">{hexagram.NAMES[changing_code]} (变卦)</div>
+            <div class="hexagram-lines">
+                {render_gua_symbol(hexagram.code_to_symbol(changing_code))}
+            </div>
+        </div>'''
     
     # 如果显示加载提示，在卦象容器内显示
     loading_html = ""
@@ -803,34 +831,14 @@ def render_hexagram_display(gua, show_loading=False):
                 {symbol_html}
             </div>
         </div>
-        <div class="hexagram">
-            <div class="hexagram-title">{changing_gua_name} (变卦)</div>
-            <div class="hexagram-lines">
-                {changing_symbol_html}
-            </div>
-        </div>
+        {changing_html}
         {loading_html}
     </div>
     '''
 
 def toss_coins(divination_content=""):
-    """投掷三枚硬币 - 基于占卜内容和日期生成确定性结果"""
-    # 获取今天的日期字符串
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    # 基于占卜内容和日期生成确定性种子
-    seed_str = f"{today}_{divination_content}"
-    seed_hash = hash(seed_str)
-    random.seed(seed_hash)
-    
-    results = []
-    for i in range(3):
-        result = random.choice([0, 1])  # 0为阴，1为阳
-        results.append(result)
-    
-    # 重置随机种子
-    random.seed()
-    return results
+    """投掷三枚硬币 - 基于占卜内容和日期生成确定性结果（0为阴，1为阳）"""
+    return casting.toss_coins(divination_content, 0)
 
 def get_yao_type(coin_results):
     """根据硬币结果确定爻的类型"""
@@ -844,36 +852,58 @@ def get_yao_type(coin_results):
     else:
         return "老阴"
 
+def get_gua_by_code(code):
+    """根据卦码获取卦的数据：有详细卦辞的卦直接返回，其余卦由卦象核心生成基本信息"""
+    info = hexagram.describe(code)
+    gua = gua_data_by_name.get(info["name"])
+    if gua:
+        return gua
+    return {
+        "id": info["id"],
+        "name": info["name"],
+        "symbol": info["symbol"],
+        "description": f"{info['image']}，上卦为{info['upper_trigram']}，下卦为{info['lower_trigram']}",
+        "text": f"{info['name']}（第{info['id']}卦）",
+        "interpretation": f"{info['name']}{info['image']}，错卦为{info['cuo']}，综卦为{info['zong']}，互卦为{info['hu']}。"
+    }
+
+
 def calculate_gua(yao_results, divination_content=""):
     """根据六爻结果计算卦象 - 如果同一天内相同问题，结果一致"""
-    gua_symbol = ""
-    for yao in yao_results:
-        if yao in ["老阳", "少阳"]:
-            gua_symbol += "1"
-        else:
-            gua_symbol += "0"
+    cast = hexagram.evaluate_cast(yao_results)
     
     # 调试信息
     print(f"六爻结果: {yao_results}")
-    print(f"生成的卦象符号: {gua_symbol}")
-    
-    # 查找对应的卦
-    for gua in gua_data:
-        if gua["symbol"] == gua_symbol:
-            print(f"找到匹配的卦: {gua['name']}")
-            return gua
-    
-    # 如果没有找到精确匹配，尝试找到最接近的卦
-    print(f"未找到精确匹配的卦象: {gua_symbol}")
-    
-    # 如果找不到匹配的卦，返回一个默认的卦
-    if gua_symbol == "111111":
-        return gua_data[0]  # 乾卦
-    elif gua_symbol == "000000":
-        return gua_data[1]  # 坤卦
-    else:
-        # 返回一个通用的卦
-        return gua_data[2]  # 屯卦
+    print(f"生成的卦象符号: {cast['primary_symbol']}")
+    
+    # 复制一份再记录变爻，避免修改共享的卦数据
+    gua = dict(get_gua_by_code(cast["primary"]))
+    gua["moving_mask"] = cast["moving_mask"]
+    print(f"找到匹配的卦: {gua['name']}")
+    return gua
+
+
+def get_gua_relations(gua):
+    """查卦象关系图获取之卦、互卦、错卦、综卦（无变爻时之卦即本卦）"""
+    return hexagram.relations(hexagram.symbol_to_code(gua["symbol"]), gua.get("moving_mask", 0))
+
+
+def format_gua_relations(gua):
+    """卦象关系的文字描述"""
+    return "，".join(f"{item['label']}{item['name']}" for item in get_gua_relations(gua).values())
+
+
+def show_gua_relations(gua):
+    """显示卦象关系（之卦、互卦、错卦、综卦）"""
+    meanings = {
+        "changed": "事情的发展趋势",
+        "hu": "事情内部的隐含因素",
+        "cuo": "对立面与反向的可能",
+        "zong": "换个立场看待问题",
+    }
+    st.markdown("##### 卦象关系")
+    for kind, item in get_gua_relations(gua).items():
+        st.markdown(f"• **{item['label']}：** {item['name']} - {meanings[kind]}")
 
 
 def show_thinking_process(message="正在处理中..."):
@@ -922,95 +952,73 @@ def show_thinking_process(message="正在处理中..."):
     # 短暂延迟以显示思考过程
     time.sleep(0.5)
 
-def call_deepseek_api(prompt, max_tokens=3000):
-    """调用DeepSeek API（优化版：支持更丰满的内容生成）"""
+# 解卦类调用共用的系统提示词
+GUA_EXPERT_PROMPT = "你是一位精通易经的专家，擅长详细、深入、全面地解读卦象的含义。请提供详细、丰富、实用的解答，每个方面200-300字，内容要精炼但有深度。"
+
+# 卦象解读只取决于卦象与提示词，回答写入持久化缓存，保留30天（秒）
+GUA_RESPONSE_TTL = 30 * 24 * 3600
+
+def call_llm_api(provider, label, prompt, max_tokens=3000):
+    """通过共享的连接池客户端调用大模型，失败或超时返回None"""
     try:
-        from src.api_config import APIConfig
-        import requests
-        
-        api_key = APIConfig.DEEPSEEK_API_KEY
-        api_url = APIConfig.DEEPSEEK_API_URL
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": "你是一位精通易经的专家，擅长详细、深入、全面地解读卦象的含义。请提供详细、丰富、实用的解答，每个方面200-300字，内容要精炼但有深度。"},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.8,
-            "max_tokens": max_tokens
-        }
-        
-        # 优化超时时间到15秒以加快响应速度
-        response = requests.post(api_url, headers=headers, json=data, timeout=15)
-        response.raise_for_status()
-        result = response.json()
-        
-        if "choices" in result and len(result["choices"]) > 0:
-            return result["choices"][0]["message"]["content"]
-        else:
-            return None
+        # 超时15秒以加快响应速度
+        return llm_client.chat(provider, GUA_EXPERT_PROMPT, prompt, temperature=0.8, max_tokens=max_tokens, timeout=15,
+                               use_cache=True, ttl=GUA_RESPONSE_TTL)
     except requests.Timeout:
-        print("DeepSeek API调用超时（15秒）")
+        print(f"{label} API调用超时（15秒）")
         return None
     except Exception as e:
-        print(f"DeepSeek API调用失败: {e}")
+        print(f"{label} API调用失败: {e}")
         return None
 
-def call_qwen_api(prompt, max_tokens=3000):
-    """调用Qwen API（通义千问）- 支持更丰满的内容生成"""
+# 对冲请求的等待时间（秒），None 表示使用首选服务商近期的p90延迟
+HEDGE_DELAY = None
+
+def call_hedged_api(prompt, max_tokens=3000, providers=("deepseek", "qwen"), accept=None):
+    """对冲调用：先请求首选服务商，超过对冲延迟仍无合格回答时再请求备用服务商，先到的合格回答胜出，失败返回None"""
     try:
-        from src.api_config import APIConfig
-        import requests
-        
-        api_key = APIConfig.QWEN_API_KEY
-        # DashScope API 标准格式
-        api_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        # DashScope 标准格式
-        data = {
-            "model": "qwen-turbo",
-            "input": {
-                "messages": [
-                    {"role": "system", "content": "你是一位精通易经的专家，擅长详细、深入、全面地解读卦象的含义。请提供详细、丰富、实用的解答，每个方面200-300字，内容要精炼但有深度。"},
-                    {"role": "user", "content": prompt}
-                ]
-            },
-            "parameters": {
-                "temperature": 0.8,
-                "max_tokens": max_tokens
-            }
-        }
-        
-        # 优化超时时间到15秒以加快响应速度
-        response = requests.post(api_url, headers=headers, json=data, timeout=15)
-        response.raise_for_status()
-        result = response.json()
-        
-        # DashScope 返回格式
-        if "output" in result:
-            if "choices" in result["output"] and len(result["output"]["choices"]) > 0:
-                return result["output"]["choices"][0]["message"]["content"]
-            elif "text" in result["output"]:
-                return result["output"]["text"]
-        return None
-    except requests.Timeout:
-        print("Qwen API调用超时（15秒）")
+        provider, content = llm_client.hedged_chat(providers, GUA_EXPERT_PROMPT, prompt, temperature=0.8,
+                                                   max_tokens=max_tokens, timeout=15, hedge_delay=HEDGE_DELAY,
+                                                   accept=accept, use_cache=True, ttl=GUA_RESPONSE_TTL)
+        if content:
+            print(f"{provider}成功生成内容，长度: {len(content)}")
+        return content
+    except Exception as e:
+        print(f"对冲调用失败: {e}")
         return None
+
+def stream_to(placeholder, interval=0.1):
+    """返回流式回调：把累计文本渲染到 st.empty() 占位符（末尾加光标，按 interval 秒节流）"""
+    last_render = [0.0]
+    def on_text(text):
+        now = time.perf_counter()
+        if now - last_render[0] >= interval:
+            placeholder.markdown(text + "▌")
+            last_render[0] = now
+    return on_text
+
+def call_streaming_api(prompt, placeholder, max_tokens=3000, providers=("deepseek", "qwen")):
+    """流式调用大模型，边生成边显示到占位符，失败时按顺序改用下一个服务商；全部失败返回None"""
+    try:
+        provider, content = llm_client.stream_with_fallback(providers, GUA_EXPERT_PROMPT, prompt, stream_to(placeholder),
+                                                            temperature=0.8, max_tokens=max_tokens, timeout=15,
+                                                            use_cache=True, ttl=GUA_RESPONSE_TTL)
+        if content:
+            placeholder.markdown(content)
+            print(f"{provider}流式生成内容，长度: {len(content)}")
+        return content or None
     except Exception as e:
-        print(f"Qwen API调用失败: {e}")
+        print(f"流式调用失败: {e}")
         return None
 
+def call_deepseek_api(prompt, max_tokens=3000):
+    """调用DeepSeek API（优化版：支持更丰满的内容生成）"""
+    return call_llm_api("deepseek", "DeepSeek", prompt, max_tokens)
+
+def call_qwen_api(prompt, max_tokens=3000):
+    """调用Qwen API（通义千问）- 支持更丰满的内容生成"""
+    return call_llm_api("qwen", "Qwen", prompt, max_tokens)
+
 def identify_relevant_categories(divination_event):
     """根据占卜问题识别相关的解卦方面"""
     if not divination_event:
@@ -1097,7 +1105,7 @@ def generate_conclusion(gua_name, gua_text, gua_description, divination_event=""
     
     return summary
 
-def get_enriched_divination_content(gua_name, gua_symbol, gua_text, gua_description, divination_event=""):
+def get_enriched_divination_content(gua_name, gua_symbol, gua_text, gua_description, divination_event="", placeholder=None):
     """根据占卜问题生成相关方面的解卦内容（只生成相关方面，内容更丰满）"""
     # 识别需要生成的相关方面
     relevant_categories = identify_relevant_categories(divination_event)
@@ -1134,27 +1142,17 @@ def get_enriched_divination_content(gua_name, gua_symbol, gua_text, gua_descript
     content = None
     max_tokens = 2000  # 优化token数量以支持精简但完整的内容（200-300字），加快响应速度
     
-    # 优先使用DeepSeek
-    try:
-        content = call_deepseek_api(prompt, max_tokens=max_tokens)
-        if content:
-            print(f"DeepSeek成功生成内容，长度: {len(content)}")
-    except Exception as e:
-        print(f"DeepSeek调用失败或超时: {e}")
-    
-    # 如果DeepSeek失败或内容不够丰满，使用Qwen
-    if not content or len(content) < 200:
-        try:
-            content = call_qwen_api(prompt, max_tokens=max_tokens)
-            if content:
-                print(f"Qwen成功生成内容，长度: {len(content)}")
-        except Exception as e:
-            print(f"Qwen调用失败或超时: {e}")
+    if placeholder is not None:
+        # 流式生成，边生成边显示到占位符（DeepSeek优先，失败时改用Qwen）
+        content = call_streaming_api(prompt, placeholder, max_tokens=max_tokens)
+    else:
+        # 优先使用DeepSeek，超过对冲延迟仍无足够丰满的内容时同时请求Qwen，先到者胜
+        content = call_hedged_api(prompt, max_tokens=max_tokens, accept=lambda text: len(text) >= 200)
     
     # 如果两个都失败了，尝试再次调用（备用方案）
     if not content or len(content) < 200:
         try:
-            # 使用简化的prompt再次尝试Qwen
+            # 使用简化的prompt再次尝试（Qwen优先）
             simplified_prompt = f"""请详细解读{gua_name}关于"{divination_event}"这个问题的含义。
 
 卦名：{gua_name}
@@ -1170,11 +1168,11 @@ def get_enriched_divination_content(gua_name, gua_symbol, gua_text, gua_descript
 请按照以下格式输出，每个类别用"##"分隔：
 {chr(10).join([f'## {cat}{chr(10)}[详细解读内容]{chr(10)}' for cat in relevant_categories])}
 """
-            content = call_qwen_api(simplified_prompt, max_tokens=max_tokens)
+            content = call_hedged_api(simplified_prompt, max_tokens=max_tokens, providers=("qwen", "deepseek"))
             if content:
-                print(f"Qwen备用方案成功生成内容，长度: {len(content)}")
+                print(f"备用方案成功生成内容，长度: {len(content)}")
         except Exception as e:
-            print(f"Qwen备用方案调用失败: {e}")
+            print(f"备用方案调用失败: {e}")
     
     # 解析返回的内容
     if content and content.strip():
@@ -1332,15 +1330,12 @@ def generate_follow_up_questions(question, answer):
 def rag_qa_answer(question):
     """RAG问答系统"""
     try:
-        # 尝试导入RAG系统
-        from src.rag_qa_system import IChingRAGSystem
-        
         # 获取知识库路径（相对于 app.py 的位置）
         base_dir = os.path.dirname(os.path.abspath(__file__))
         knowledge_base_dir = os.path.join(base_dir, "knowledge_base")
         
-        # 初始化RAG系统（会自动加载知识库）
-        rag_system = IChingRAGSystem(knowledge_base_path=knowledge_base_dir)
+        # 获取RAG系统（首次调用时加载知识库，之后跨会话复用）
+        rag_system = load_rag_system(knowledge_base_dir)
         
         # 生成答案
         answer = rag_system.answer_question(question)
@@ -1431,6 +1426,17 @@ def main():
     ''', unsafe_allow_html=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
+    
+    # 各子系统首次初始化的耗时（侧边栏，默认收起）
+    with st.sidebar.expander("系统启动耗时"):
+        st.text(format_report())
+        for metrics in llm_client.client_metrics():
+            st.text(f"{metrics['provider']}: {metrics['requests']}次请求，新建{metrics['connections_opened']}个连接，"
+                    f"复用率{metrics['reuse_ratio']:.0%}，平均{metrics['avg_seconds']:.2f}秒")
+        cache_stats = llm_client.cache_metrics()
+        if cache_stats:
+            st.text(f"回答缓存: {cache_stats['entries']}条，命中{cache_stats['hits']}/{cache_stats['lookups']}次"
+                    f"（{cache_stats['hit_rate']:.0%}）")
 
 def show_navigation_bar():
     """显示导航栏"""
@@ -1798,42 +1804,13 @@ def show_number_divination():
         st.rerun()
 
 def generate_gua_by_number(number, divination_content=""):
-    """根据数字生成确定性的卦象 - 基于日期+数字+占卜内容生成1天内一致的结果"""
-    # 获取今天的日期字符串
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    # 基于日期+数字+占卜内容生成确定性种子
-    seed_str = f"{today}_{number}_{divination_content}"
-    seed_hash = hash(seed_str)
-    random.seed(seed_hash)
-    
-    # 根据数字映射到64卦（使用模运算支持任意数字）
-    gua_index = (number - 1) % len(gua_data)
-    gua = gua_data[gua_index]
-    
-    # 重置随机种子，避免影响其他功能
-    random.seed()
-    
-    return gua
+    """根据数字生成确定性的卦象 - 相同数字始终得到同一卦"""
+    # 根据数字映射到64卦（使用模运算支持任意数字，按文王卦序）
+    return get_gua_by_code(hexagram.CODE_BY_NUMBER[(number - 1) % 64 + 1])
 
 def toss_coins_deterministic(divination_content, toss_index):
-    """基于占卜内容和投掷次数生成确定性的硬币结果"""
-    # 获取今天的日期字符串
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    # 基于日期+占卜内容+投掷次数生成确定性种子
-    seed_str = f"{today}_{divination_content}_{toss_index}"
-    seed_hash = hash(seed_str)
-    random.seed(seed_hash)
-    
-    results = []
-    for i in range(3):
-        result = random.choice([0, 1])  # 0为阴，1为阳
-        results.append(result)
-    
-    # 重置随机种子
-    random.seed()
-    return results
+    """基于占卜内容和投掷次数生成确定性的硬币结果（同一天内相同问题在任何进程中结果一致，不影响全局随机数状态）"""
+    return casting.toss_coins(divination_content, toss_index)
 
 def show_divination_result():
     """显示占卜结果 - 增强版（立即跳转到结果页，生成完成后一次性显示）"""
@@ -1916,18 +1893,24 @@ def show_divination_result():
                     
                     if ENHANCED_DIVINATION_AVAILABLE:
                         try:
-                            enhanced_result = enhanced_divination.get_enhanced_divination_result(
-                                gua["name"], gua["symbol"], st.session_state.get("divination_event", "")
+                            # 传入摇卦得到的变爻，变卦分析与卦象关系面板一致
+                            moving_lines = None
+                            if "moving_mask" in gua:
+                                moving_lines = [i + 1 for i in range(6) if gua["moving_mask"] >> i & 1]
+                            enhanced_result = load_enhanced_divination().get_enhanced_divination_result(
+                                gua["name"], gua["symbol"], st.session_state.get("divination_event", ""),
+                                moving_lines=moving_lines
                             )
                             
-                            # 生成大模型丰富内容
+                            # 生成大模型丰富内容（流式显示生成过程）
                             try:
                                 enriched_content = get_enriched_divination_content(
                                     gua["name"], 
                                     gua["symbol"], 
                                     gua["text"], 
                                     gua["description"],
-                                    st.session_state.get("divination_event", "")
+                                    st.session_state.get("divination_event", ""),
+                                    placeholder=st.empty()
                                 )
                             except Exception as e:
                                 print(f"大模型生成内容时出错: {e}")
@@ -2049,7 +2032,8 @@ def show_smart_guide_card(gua):
         "gua_text": gua["text"],
         "gua_description": gua["description"],
         "divination_event": divination_event,
-        "symbol": gua["symbol"]
+        "symbol": gua["symbol"],
+        "moving_mask": gua.get("moving_mask", 0)
     }
     st.session_state.gua_summary = gua_summary
     
@@ -2411,18 +2395,31 @@ def get_gua_detailed_analysis(gua_name, gua_symbol, gua_text, gua_description):
         return gua_details[gua_name]
     else:
         # 通用解析
+        yao_interpretations = [
+            {"position": "初爻", "text": "基础阶段", "meaning": "宜稳固基础"},
+            {"position": "二爻", "text": "发展阶段", "meaning": "稳步前进"},
+            {"position": "三爻", "text": "转折阶段", "meaning": "谨慎决策"},
+            {"position": "四爻", "text": "上升阶段", "meaning": "把握时机"},
+            {"position": "五爻", "text": "鼎盛阶段", "meaning": "保持优势"},
+            {"position": "上爻", "text": "完成阶段", "meaning": "总结反思"}
+        ]
+        gua_structure = "根据卦象结构分析"
+        try:
+            code = hexagram.symbol_to_code(gua_symbol)
+        except ValueError:
+            code = None
+        if code is not None:
+            gua_structure = hexagram.describe(code)["image"]
+            # 爻题与爻辞直接查知识库的卦象实体索引（入库时标注），查不到的爻保留通用说明
+            for yao, title in zip(yao_interpretations, hexagram.line_titles(code)):
+                yao["position"] = title
+                if ENHANCED_DIVINATION_AVAILABLE:
+                    yao["text"] = load_enhanced_divination().get_line_text(gua_name, title) or yao["text"]
         return {
-            "gua_structure": "根据卦象结构分析",
+            "gua_structure": gua_structure,
             "symbol_meaning": gua_description,
             "current_state": "需要根据具体卦象分析",
-            "yao_interpretations": [
-                {"position": "初爻", "text": "基础阶段", "meaning": "宜稳固基础"},
-                {"position": "二爻", "text": "发展阶段", "meaning": "稳步前进"},
-                {"position": "三爻", "text": "转折阶段", "meaning": "谨慎决策"},
-                {"position": "四爻", "text": "上升阶段", "meaning": "把握时机"},
-                {"position": "五爻", "text": "鼎盛阶段", "meaning": "保持优势"},
-                {"position": "上爻", "text": "完成阶段", "meaning": "总结反思"}
-            ],
+            "yao_interpretations": yao_interpretations,
             "wuxing": "需根据卦象确定五行属性",
             "trend_analysis": "需要结合具体卦象分析趋势",
             "action_advice": "建议根据卦象特性采取相应行动",
@@ -2477,6 +2474,8 @@ def show_next_question_page():
             st.markdown(f"• **运势走势：** {detailed_analysis['trend_analysis']}")
             st.markdown(f"• **行动建议：** {detailed_analysis['action_advice']}")
             st.markdown(f"• **时间周期：** {detailed_analysis['time_cycle']}")
+            
+            show_gua_relations(current_gua)
     elif gua_summary:
         # 如果没有current_gua，显示简化版摘要（使用Streamlit原生格式）
         st.markdown("### 上一次占卜结果摘要")
@@ -2663,7 +2662,7 @@ def show_next_question_page():
                 try:
                     # 构建完整的问题上下文
                     full_question = f"{context}\n当前问题：{last_question}"
-                    result = enhanced_qa.answer_question(full_question)
+                    result = load_enhanced_qa().answer_question(full_question)
                     answer = result.get("answer", "抱歉，暂时无法回答这个问题。")
                     
                     # 更新对话历史
@@ -2759,6 +2758,12 @@ def generate_recommended_questions(gua_summary):
         recommended.append("如何改善健康状况？")
         recommended.append("需要注意哪些健康问题？")
     
+    # 基于之卦的推荐问题（查卦象关系图，有变爻时才推荐）
+    gua_symbol = gua_summary.get("symbol", "")
+    if gua_symbol and gua_summary.get("moving_mask"):
+        changed = get_gua_relations(gua_summary)["changed"]["name"]
+        recommended.insert(min(2, len(recommended)), f"本卦变为{changed}，事情后续会如何发展？")
+    
     # 去重并限制数量
     unique_questions = []
     for q in recommended:
@@ -2780,6 +2785,8 @@ def show_deep_analysis_result(gua_summary, question, current_gua):
         gua_summary.get("gua_text", ""), 
         gua_summary.get("gua_description", "")
     )
+    if gua_symbol:
+        detailed_analysis["gua_relations"] = format_gua_relations(current_gua)
     
     # 根据问题类型生成针对性分析
     analysis_content = generate_targeted_analysis(gua_name, question, detailed_analysis)
@@ -2787,6 +2794,8 @@ def show_deep_analysis_result(gua_summary, question, current_gua):
     # 使用Streamlit原生格式显示
     st.markdown("#### 卦象深度分析")
     st.markdown(analysis_content["gua_analysis"])
+    if gua_symbol:
+        show_gua_relations(current_gua)
     
     st.markdown("#### 具体把握策略")
     
@@ -2836,6 +2845,7 @@ def generate_targeted_analysis(gua_name, question, detailed_analysis):
     current_state = detailed_analysis.get('current_state', '')
     action_advice = detailed_analysis.get('action_advice', '')
     time_cycle = detailed_analysis.get('time_cycle', '')
+    gua_relations = detailed_analysis.get('gua_relations', '')
     
     prompt = f"""你是一位精通易经的专家。请基于以下信息，针对用户的具体问题生成详细的深化解卦分析。
 
@@ -2855,6 +2865,7 @@ def generate_targeted_analysis(gua_name, question, detailed_analysis):
 - 当前状态：{current_state}
 - 行动建议：{action_advice}
 - 时间周期：{time_cycle}
+- 卦象关系：{gua_relations}
 
 用户问题：{question}
 
@@ -2886,12 +2897,8 @@ def generate_targeted_analysis(gua_name, question, detailed_analysis):
 
 请确保所有内容都紧密结合用户的问题"{question}"，给出针对性的建议。所有时间建议必须基于当前实际日期。"""
     
-    # 调用DeepSeek API生成分析
-    deepseek_result = call_deepseek_api(prompt, max_tokens=2000)
-    
-    # 如果DeepSeek失败，尝试Qwen
-    if not deepseek_result:
-        deepseek_result = call_qwen_api(prompt, max_tokens=2000)
+    # 调用DeepSeek API生成分析，响应慢时对冲请求Qwen，先到者胜
+    deepseek_result = call_hedged_api(prompt, max_tokens=2000)
     
     # 解析AI返回的内容
     analysis = None
@@ -3214,7 +3221,7 @@ def show_qa_analysis_state(current_question, analysis_content, original_question
             try:
                 # 构建完整的问题上下文
                 full_question = f"{context}\n当前问题：{last_question}"
-                result = enhanced_qa.answer_question(full_question)
+                result = load_enhanced_qa().answer_question(full_question)
                 answer = result.get("answer", "抱歉，暂时无法回答这个问题。")
                 
                 # 更新对话历史
@@ -3342,7 +3349,7 @@ def show_qa_page():
                 elif any(keyword in question for keyword in ["健康", "饮食", "运动", "工作", "学习", "情感", "家庭", "朋友", "爱情"]):
                     question_type_detected = "日常提问"
                 
-                thinking_process = enhanced_qa.generate_thinking_process(question, question_type_detected)
+                thinking_process = load_enhanced_qa().generate_thinking_process(question, question_type_detected)
                 thinking_steps = thinking_process.split("\n\n")
                 
                 # 逐步显示思考过程
@@ -3375,10 +3382,10 @@ def show_qa_page():
                 if original_question and original_question != question and is_dream_or_divination and not is_fengshui:
                     # 如果是解梦/占卜类问题的深入分析，构建包含原始问题的上下文
                     context_question = f"原始问题：{original_question}\n\n当前分析问题：{question}\n\n请基于原始问题，针对当前分析问题进行深度专业化分析。"
-                    result = enhanced_qa.answer_question(context_question)
+                    result = load_enhanced_qa().answer_question(context_question, on_text=stream_to(answer_placeholder))
                 else:
                     # 风水问题或其他问题直接回答，不传递原始问题上下文
-                    result = enhanced_qa.answer_question(question)
+                    result = load_enhanced_qa().answer_question(question, on_text=stream_to(answer_placeholder))
                 
                 # 清除加载提示
                 loading_placeholder.empty()
@@ -3477,7 +3484,7 @@ def show_qa_page():
                     elif any(keyword in question for keyword in ["健康", "饮食", "运动", "工作", "学习", "情感", "家庭", "朋友", "爱情"]):
                         question_type_detected = "日常提问"
                     
-                    thinking_process = enhanced_qa.generate_thinking_process(question, question_type_detected)
+                    thinking_process = load_enhanced_qa().generate_thinking_process(question, question_type_detected)
                     thinking_steps = thinking_process.split("\n\n")
                     
                     # 逐步显示思考过程
@@ -3505,9 +3512,9 @@ def show_qa_page():
                     if original_question and original_question != question:
                         # 如果是相关问题的深入分析，构建包含原始问题的上下文
                         context_question = f"原始问题：{original_question}\n\n当前分析问题：{question}\n\n请基于原始问题，针对当前分析问题进行深度专业化分析。"
-                        result = enhanced_qa.answer_question(context_question)
+                        result = load_enhanced_qa().answer_question(context_question, on_text=stream_to(answer_placeholder))
                     else:
-                        result = enhanced_qa.answer_question(question)
+                        result = load_enhanced_qa().answer_question(question, on_text=stream_to(answer_placeholder))
                     
                     # 清除加载提示
                     loading_placeholder.empty()
@@ -3637,7 +3644,7 @@ def show_qa_page():
                 elif any(keyword in question for keyword in ["健康", "饮食", "运动", "工作", "学习", "情感", "家庭", "朋友", "爱情"]):
                     question_type_detected = "日常提问"
                 
-                thinking_process = enhanced_qa.generate_thinking_process(question, question_type_detected)
+                thinking_process = load_enhanced_qa().generate_thinking_process(question, question_type_detected)
                 thinking_steps = thinking_process.split("\n\n")
                 
                 # 逐步显示思考过程
@@ -3660,8 +3667,8 @@ def show_qa_page():
                 loading_placeholder = st.empty()
                 loading_placeholder.markdown("🔄 正在调用AI模型进行分析...")
                 
-                # 调用增强问答系统
-                result = enhanced_qa.answer_question(question)
+                # 调用增强问答系统（流式显示生成过程）
+                result = load_enhanced_qa().answer_question(question, on_text=stream_to(answer_placeholder))
                 
                 # 清除加载提示
                 loading_placeholder.empty()
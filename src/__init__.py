@@ -15,16 +15,14 @@
 __version__ = "1.0.0"
 __author__ = "周易预测系统"
 
-# 导入主要模块
-from . import data
-from . import models
-from . import pipeline
-from . import utils
-from . import stock_data
-from . import news_crawler
-from . import stock_prediction_system
-from . import iching_enhanced_models
-from . import iching_enhanced_system
+import importlib
 
 __all__ = ['data', 'models', 'pipeline', 'utils', 'stock_data', 'news_crawler', 'stock_prediction_system', 'iching_enhanced_models', 'iching_enhanced_system']
 
+
+def __getattr__(name):
+    # 主要模块在首次访问时才导入（依赖pandas与机器学习库，导入开销大，易测应用并不需要）
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
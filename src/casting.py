@@ -0,0 +1,88 @@
+"""
+起卦引擎 - 由 (日期, 占卜内容) 确定性地生成六爻，跨进程、跨重启结果一致
+种子用 blake2b 对日期与占卜内容求摘要得到（内置 hash 每个进程随机化，不同 Streamlit 进程会得到不同的卦），
+每枚硬币的正反由种子与投掷序号经 splitmix64 混合后取最高位决定：
+不读写全局随机数状态，线程安全，且成千上万次起卦可用 NumPy 一次算完，单次与批量结果一致
+"""
+
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from . import hexagram
+
+# 每爻投掷三枚硬币，一卦六爻
+COINS_PER_LINE = 3
+LINES_PER_CAST = 6
+
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+# 三枚硬币中阳面的数量 -> 爻的数值（0老阴、1少阴、2少阳、3老阳，与 app.get_yao_type 一致）
+_LINE_BY_HEADS = np.array([6, 8, 7, 9], dtype=np.int64)
+
+
+def today() -> str:
+    """当天日期字符串，作为默认的起卦日期"""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def stable_seed(*parts: Any) -> int:
+    """对各部分求 blake2b 摘要得到64位种子（与进程、平台无关）"""
+    message = "\x1f".join(str(part) for part in parts).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(message, digest_size=8).digest(), 'little')
+
+
+def _splitmix64(values: np.ndarray) -> np.ndarray:
+    values = values ^ (values >> np.uint64(30))
+    values = values * _MIX_1
+    values = values ^ (values >> np.uint64(27))
+    values = values * _MIX_2
+    return values ^ (values >> np.uint64(31))
+
+
+def coin_tosses(seeds: Sequence[int], tosses: int = LINES_PER_CAST) -> np.ndarray:
+    """批量投掷硬币：返回形状为 (种子数, tosses, 3) 的0/1数组（1为阳），第 i 次投掷对应自下而上第 i+1 爻"""
+    seeds = np.asarray(seeds, dtype=np.uint64).reshape(-1, 1)
+    counters = np.arange(1, tosses * COINS_PER_LINE + 1, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        mixed = _splitmix64(seeds + counters * _GOLDEN_GAMMA)
+    return (mixed >> np.uint64(63)).astype(np.int64).reshape(-1, tosses, COINS_PER_LINE)
+
+
+def cast_lines(seeds: Sequence[int]) -> np.ndarray:
+    """批量起卦：返回形状为 (种子数, 6) 的爻数值数组（6-9）"""
+    return _LINE_BY_HEADS[coin_tosses(seeds).sum(axis=2)]
+
+
+def reading_seed(question: str, date: Optional[str] = None) -> int:
+    """一次占卜的种子：同一天内相同的占卜内容得到相同的种子"""
+    return stable_seed(date or today(), question)
+
+
+def toss_coins(question: str, toss_index: int, date: Optional[str] = None) -> List[int]:
+    """第 toss_index 次（从0计，自下而上）投掷的三枚硬币结果"""
+    coins = coin_tosses([reading_seed(question, date)], toss_index + 1)
+    return coins[0, toss_index].tolist()
+
+
+def cast_readings(questions: Sequence[str], date: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """为多个占卜内容一次起卦，返回爻数值与本卦、变爻、之卦（见 hexagram.evaluate_casts）"""
+    date = date or today()
+    lines = cast_lines([stable_seed(date, question) for question in questions])
+    result = hexagram.evaluate_casts(lines)
+    result["lines"] = lines
+    return result
+
+
+@lru_cache(maxsize=4096)
+def cast_reading(question: str, date: str) -> Dict[str, Any]:
+    """单次起卦结果（同一 (日期, 占卜内容) 结果固定，进程内缓存；返回的字典为共享对象，调用方不应修改）"""
+    lines = cast_lines([stable_seed(date, question)])[0]
+    result = hexagram.evaluate_cast(lines.tolist())
+    result["lines"] = lines.tolist()
+    return result
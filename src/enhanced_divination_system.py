@@ -1,108 +1,168 @@
 """
 增强解卦系统 - 结合本地知识库提供丰富的解卦内容
 """
-import json
-import os
+import copy
+import numbers
 import random
-from typing import Dict, List, Any, Optional
+import re
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Sequence
 from datetime import datetime
 
+import numpy as np
+
+from .passage_corpus import get_shared_corpus, passage_text, resolve_knowledge_base_dir
+from .query_cache import get_query_cache
+from .startup_report import timed
+from . import hexagram
+from .gua_entities import gua_sections
+from .gua_interpretations import compute_sections, load_table, table_path
+
+logger = logging.getLogger(__name__)
+
 class EnhancedDivinationSystem:
     """增强解卦系统"""
     
     def __init__(self):
-        self.knowledge_base = {}
+        self.corpus = None
+        self.knowledge_base_dir = None
         self.load_knowledge_base()
+        # 检索结果缓存：进程内共享，知识库文件变化或语料库新增段落时自动失效
+        self.query_cache = get_query_cache("divination", self.knowledge_base_dir or "knowledge_base")
+        # 六十四卦解读表：离线预计算的各卦解读，表缺失或过期时按卦实时检索并记入内存
+        self.interpretations = self.load_interpretations()
     
     def load_knowledge_base(self):
-        """加载本地知识库"""
+        """加载本地知识库（问答集与书籍段落来自进程内共享的统一语料库，与RAG问答共用同一份索引）"""
         try:
-            # 获取项目根目录（向上两级：src -> yingzaiyice -> 项目根目录）
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            # 尝试多个可能的知识库路径
-            knowledge_base_paths = [
-                os.path.join(base_dir, "knowledge_base"),
-                os.path.join(os.path.dirname(base_dir), "knowledge_base"),
-                "knowledge_base"
-            ]
-            
-            knowledge_base_dir = None
-            for path in knowledge_base_paths:
-                if os.path.exists(path):
-                    knowledge_base_dir = path
-                    break
-            
+            knowledge_base_dir = resolve_knowledge_base_dir()
             if not knowledge_base_dir:
                 print("警告: 未找到知识库目录")
                 return
-            
-            # 加载QA格式的知识库
-            qa_file = os.path.join(knowledge_base_dir, "《六爻古籍经典合集》_qa.json")
-            if os.path.exists(qa_file):
-                with open(qa_file, 'r', encoding='utf-8') as f:
-                    qa_data = json.load(f)
-                    self.knowledge_base['qa'] = qa_data
-            
-            # 加载其他知识库文件
-            knowledge_files = [
-                "《京氏易傳》_processed.json",
-                "京氏易精粹  1  京氏易传、火珠林、黄金策_processed.json",
-                "京氏易精粹  2  易林补遗_processed.json",
-                "京氏易精粹  3  增删卜易·海底眼_processed.json",
-                "京氏易精粹  4  野鹤老人占卜全书_processed.json"
-            ]
-            
-            for filename in knowledge_files:
-                file_path = os.path.join(knowledge_base_dir, filename)
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        self.knowledge_base[filename] = data
-                        
+            self.knowledge_base_dir = knowledge_base_dir
+            self.corpus = get_shared_corpus(knowledge_base_dir)
         except Exception as e:
             print(f"加载知识库时出错: {e}")
     
+    def load_interpretations(self) -> Dict[str, Dict[str, Any]]:
+        """加载预计算的六十四卦解读表（由 python -m src.gua_interpretations 生成）"""
+        if self.corpus is None:
+            return {}
+        table = load_table(table_path(self.knowledge_base_dir), self.corpus.fingerprint())
+        return table or {}
+    
+    def get_gua_sections(self, gua_name: str) -> Dict[str, Any]:
+        """按卦名查表获取只取决于卦名的解读部分，返回副本供调用方修改"""
+        sections = self.interpretations.get(gua_name)
+        if sections is None:
+            sections = compute_sections(self, gua_name)
+            self.interpretations[gua_name] = sections
+        return copy.deepcopy(sections)
+    
     def search_knowledge(self, query: str, max_results: int = 5) -> List[Dict]:
-        """在知识库中搜索相关内容"""
+        """在知识库中搜索相关内容（相同查询直接复用缓存结果）"""
+        cache_key = self.query_cache.make_key(query, max_results, self.corpus.version if self.corpus is not None else 0)
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
+        results = self._search_knowledge(query, max_results)
+        self.query_cache.set(cache_key, results)
+        return list(results)
+    
+    def _match_passages(self, query: str, limit: int, sources: tuple) -> List[Dict]:
+        """按词检索段落：先要求包含全部词（AND），不足时补充包含任一词的段落（OR）"""
+        passages = [passage for passage, _ in self.corpus.match_terms(query, limit, sources, mode='and')]
+        if len(passages) < limit:
+            seen = {passage['id'] for passage in passages}
+            for passage, _ in self.corpus.match_terms(query, limit + len(seen), sources, mode='or'):
+                if passage['id'] not in seen and len(passages) < limit:
+                    passages.append(passage)
+        return passages
+    
+    def _search_knowledge(self, query: str, max_results: int) -> List[Dict]:
+        """在知识库中按词检索相关内容：先查问答集，再查书籍与知识库段落"""
         results = []
+        if self.corpus is None:
+            return results
         
         # 在QA知识库中搜索
-        if 'qa' in self.knowledge_base:
-            qa_data = self.knowledge_base['qa']
-            if 'qa_pairs' in qa_data:
-                for qa_pair in qa_data['qa_pairs']:
-                    if query in qa_pair.get('question', '') or query in qa_pair.get('answer', ''):
-                        results.append({
-                            'type': 'qa',
-                            'question': qa_pair.get('question', ''),
-                            'answer': qa_pair.get('answer', ''),
-                            'source': qa_pair.get('source', '')
-                        })
-                        if len(results) >= max_results:
-                            break
+        for passage in self._match_passages(query, max_results, ('qa',)):
+            results.append(self._format_passage(passage))
         
         # 在其他知识库中搜索
-        for filename, data in self.knowledge_base.items():
-            if filename == 'qa':
-                continue
-            
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict):
-                        text = item.get('processed_text', '') or item.get('raw_text', '')
-                        if query in text:
-                            results.append({
-                                'type': 'text',
-                                'content': text[:500] + '...' if len(text) > 500 else text,
-                                'source': filename
-                            })
-                            if len(results) >= max_results:
-                                break
+        if len(results) < max_results:
+            for passage in self._match_passages(query, max_results - len(results), ('book', 'jsonl')):
+                results.append(self._format_passage(passage))
         
         return results
     
-    def get_enhanced_divination_result(self, gua_name: str, gua_symbol: str, event: str = "") -> Dict[str, Any]:
-        """获取增强的解卦结果"""
+    @staticmethod
+    def _format_passage(passage: Dict[str, Any]) -> Dict[str, Any]:
+        """段落转为检索结果：问答段落给出问题与答案，其余段落截取前500字"""
+        if passage['source'] == 'qa':
+            return {
+                'type': 'qa',
+                'question': passage.get('question', ''),
+                'answer': passage.get('answer', ''),
+                'source': passage['book'],
+                'passage_id': passage['id']
+            }
+        text = passage['text']
+        return {
+            'type': 'text',
+            'content': text[:500] + '...' if len(text) > 500 else text,
+            'source': passage['book'] or passage['id'],
+            'passage_id': passage['id']
+        }
+    
+    def get_gua_passages(self, gua_name: str, line: Optional[str] = None, max_results: int = 5) -> List[Dict]:
+        """按入库时标注的实体直接取提到某卦（及某爻，如"初九"）的段落，问答集在前"""
+        if self.corpus is None:
+            return []
+        passages = self.corpus.passages_about(gua=gua_name, line=line, limit=max_results, sources=('qa',))
+        if len(passages) < max_results:
+            passages += self.corpus.passages_about(gua=gua_name, line=line, limit=max_results - len(passages),
+                                                   sources=('book', 'jsonl'))
+        return [self._format_passage(passage) for passage in passages]
+    
+    # 经文段内至少按顺序列出几个爻题，才视为该卦的经文（而非注疏中顺带提到的爻题）
+    MIN_LISTED_LINES = 3
+    
+    def get_line_text(self, gua_name: str, line: str) -> str:
+        """某卦某爻的爻辞：只在该卦自己的经文段内查找（该卦卦题之后、下一卦卦题之前，
+        且段内按爻序列出了该卦的爻题，如"初六：履霜，坚冰至。六二：直方大……"），找不到时返回空"""
+        if self.corpus is None:
+            return ""
+        try:
+            code = hexagram.name_to_code(gua_name)
+        except ValueError:
+            return ""
+        titles = hexagram.line_titles(code)
+        if code in (0, 63):
+            titles.append("用六" if code == 0 else "用九")
+        if line not in titles:
+            return ""
+        full_name = hexagram.NAMES[code]
+        # 爻题须位于句首（段首、空白或句末标点之后），且后接标点
+        pattern = re.compile(r'(?:^|(?<=[\s。；】」]))(' + '|'.join(titles) + r')[，,：:]\s*([^。；【\n]+)')
+        for passage in self.corpus.passages_about(gua=gua_name, line=line):
+            for section_gua, section in gua_sections(passage_text(passage)):
+                if section_gua != full_name:
+                    continue
+                entries = [(titles.index(match.group(1)), match.group(2).strip()) for match in pattern.finditer(section)]
+                order = [index for index, _ in entries]
+                if len(set(order)) < self.MIN_LISTED_LINES or order != sorted(order):
+                    continue
+                text = dict(entries).get(titles.index(line), "")
+                if text:
+                    return text
+        return ""
+    
+    def get_enhanced_divination_result(self, gua_name: str, gua_symbol: str, event: str = "",
+                                       moving_lines: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+        """获取增强的解卦结果（moving_lines 为摇卦得到的变爻位置1-6，见 get_changing_gua_analysis）"""
         
         # 基础解卦信息
         base_result = {
@@ -112,29 +172,48 @@ class EnhancedDivinationSystem:
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        # 1. 白话文解释
-        base_result["plain_explanation"] = self.get_plain_explanation(gua_name, gua_symbol)
-        
-        # 2. 象辞解释
-        base_result["xiang_ci"] = self.get_xiang_ci(gua_name, gua_symbol)
-        
-        # 3. 邵雍河洛理数爻辞解释
-        base_result["shao_yong_explanation"] = self.get_shao_yong_explanation(gua_name, gua_symbol)
-        
-        # 4. 傅佩荣解卦手册
-        base_result["fu_peirong_handbook"] = self.get_fu_peirong_handbook(gua_name, gua_symbol)
-        
-        # 5. 卦辞参考
-        base_result["gua_ci_reference"] = self.get_gua_ci_reference(gua_name, gua_symbol)
+        # 1-5. 白话文解释、象辞、邵雍河洛理数、傅佩荣解卦手册、卦辞参考（查六十四卦解读表）
+        base_result.update(self.get_gua_sections(gua_name))
         
         # 6. 变卦分析
-        base_result["changing_gua"] = self.get_changing_gua_analysis(gua_name, gua_symbol)
+        base_result["changing_gua"] = self.get_changing_gua_analysis(gua_name, gua_symbol, moving_lines)
         
         # 7. 解卦步骤
         base_result["divination_steps"] = self.get_divination_steps()
         
         return base_result
     
+    def get_enhanced_divination_results(self, casts: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量解卦：casts 中每项为 {"event": 占卜事项, "yao_results": 自下而上六爻（老阳/少阳/少阴/老阴或6-9）}，
+        按 (本卦, 变爻) 分组，每组只计算一次解读与变卦分析，再按输入顺序分发给各条请求"""
+        if not casts:
+            return []
+        lines = np.stack([hexagram.line_values(cast["yao_results"]) for cast in casts])
+        evaluated = hexagram.evaluate_casts(lines)
+        groups = evaluated["primary"] * 64 + evaluated["moving_mask"]
+        distinct, inverse = np.unique(groups, return_inverse=True)
+        
+        group_results = []
+        for group in distinct.tolist():
+            code, mask = divmod(group, 64)
+            gua_name, gua_symbol = hexagram.NAMES[code], hexagram.code_to_symbol(code)
+            group_result = {"gua_name": gua_name, "gua_symbol": gua_symbol}
+            group_result.update(self.get_gua_sections(gua_name))
+            moving_lines = [i + 1 for i in range(6) if mask >> i & 1]
+            group_result["changing_gua"] = self.get_changing_gua_analysis(gua_name, gua_symbol, moving_lines)
+            group_result["divination_steps"] = self.get_divination_steps()
+            group_results.append(group_result)
+        logger.info(f"批量解卦：{len(casts)}条请求，{len(distinct)}个不同的卦象与变爻组合")
+        
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        results = []
+        for cast, group_index in zip(casts, inverse.tolist()):
+            result = copy.deepcopy(group_results[group_index])
+            result["event"] = cast.get("event", "")
+            result["timestamp"] = timestamp
+            results.append(result)
+        return results
+    
     def get_plain_explanation(self, gua_name: str, gua_symbol: str) -> str:
         """获取白话文解释"""
         # 搜索相关知识
@@ -164,7 +243,7 @@ class EnhancedDivinationSystem:
     
     def get_xiang_ci(self, gua_name: str, gua_symbol: str) -> str:
         """获取象辞解释"""
-        search_results = self.search_knowledge(f"{gua_name} 象辞", 2)
+        search_results = self.get_gua_passages(gua_name) + self.search_knowledge(f"{gua_name} 象辞", 2)
         
         if search_results:
             for result in search_results:
@@ -243,7 +322,7 @@ class EnhancedDivinationSystem:
     
     def get_gua_ci_reference(self, gua_name: str, gua_symbol: str) -> Dict[str, str]:
         """获取卦辞参考"""
-        search_results = self.search_knowledge(f"{gua_name} 卦辞", 3)
+        search_results = self.get_gua_passages(gua_name) + self.search_knowledge(f"{gua_name} 卦辞", 3)
         
         reference = {
             "main_gua": {
@@ -273,45 +352,61 @@ class EnhancedDivinationSystem:
         
         return reference
     
-    def get_changing_gua_analysis(self, gua_name: str, gua_symbol: str) -> Dict[str, str]:
-        """获取变卦分析"""
-        # 生成变卦
-        changing_symbol = self.generate_changing_symbol(gua_symbol)
-        changing_gua_name = self.get_gua_name_by_symbol(changing_symbol)
+    def get_changing_gua_analysis(self, gua_name: str, gua_symbol: str,
+                                  moving_lines: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+        """获取变卦分析（moving_lines 为自下而上的变爻位置1-6；未给出时随机改变一爻），
+        之卦与互卦、错卦、综卦均直接查卦象关系图；变爻位置无效时抛出 ValueError"""
+        code = hexagram.symbol_to_code(gua_symbol)
+        if moving_lines is None:
+            mask = 1 << random.randint(0, 5)
+        else:
+            invalid = [line for line in moving_lines
+                       if isinstance(line, bool) or not isinstance(line, numbers.Integral) or not 1 <= line <= 6]
+            if invalid:
+                raise ValueError(f"无效的变爻位置: {invalid}，应为1-6的整数")
+            moving_lines = sorted(set(int(line) for line in moving_lines))
+            mask = sum(1 << (line - 1) for line in moving_lines)
+        related = hexagram.relations(code, mask)
+        changing_gua_name = related["changed"]["name"]
         
-        return {
+        result = {
             "changing_gua_name": changing_gua_name,
-            "changing_symbol": changing_symbol,
-            "analysis": f"本卦{gua_name}变卦为{changing_gua_name}，表示事物的发展变化趋势。本卦代表当前状况，变卦代表未来趋势。"
+            "changing_symbol": related["changed"]["symbol"],
+            "hu_gua": related["hu"]["name"],
+            "cuo_gua": related["cuo"]["name"],
+            "zong_gua": related["zong"]["name"],
         }
+        if moving_lines is None:
+            result["analysis"] = f"本卦{gua_name}变卦为{changing_gua_name}，表示事物的发展变化趋势。本卦代表当前状况，变卦代表未来趋势。"
+            return result
+        
+        # 按变爻数量选用解卦步骤（乾坤六爻皆变时看用九、用六）
+        step_index = 7 if mask == 63 and code in (0, 63) else len(moving_lines)
+        if mask:
+            analysis = f"本卦{gua_name}第{'、'.join(map(str, moving_lines))}爻动，变卦为{changing_gua_name}。本卦代表当前状况，变卦代表未来趋势。"
+        else:
+            analysis = f"本卦{gua_name}无变爻，以本卦卦辞为断。"
+        titles = hexagram.line_titles(code)
+        result.update({
+            "moving_lines": moving_lines,
+            # 变爻爻辞（按实体标注直接查段落，找不到时为空）
+            "moving_line_texts": {titles[line - 1]: self.get_line_text(gua_name, titles[line - 1]) for line in moving_lines},
+            "applicable_step": self.get_divination_steps()[step_index],
+            "analysis": analysis
+        })
+        return result
     
     def generate_changing_symbol(self, symbol: str) -> str:
-        """生成变卦符号"""
-        symbol_list = list(symbol)
-        # 随机改变一爻
-        change_pos = random.randint(0, len(symbol_list) - 1)
-        symbol_list[change_pos] = '0' if symbol_list[change_pos] == '1' else '1'
-        return ''.join(symbol_list)
+        """生成变卦符号（随机改变一爻）"""
+        code = hexagram.symbol_to_code(symbol)
+        return hexagram.code_to_symbol(hexagram.CHANGED[code, 1 << random.randint(0, 5)])
     
     def get_gua_name_by_symbol(self, symbol: str) -> str:
-        """根据符号获取卦名"""
-        # 这里应该有一个完整的64卦映射表
-        gua_mapping = {
-            "111111": "乾卦",
-            "000000": "坤卦",
-            "100010": "屯卦",
-            "010001": "蒙卦",
-            "111010": "需卦",
-            "010111": "讼卦",
-            "010000": "师卦",
-            "000010": "比卦",
-            "110111": "小畜卦",
-            "111011": "履卦",
-            "111000": "泰卦",
-            "000111": "否卦"
-        }
-        
-        return gua_mapping.get(symbol, f"未知卦象({symbol})")
+        """根据符号获取卦名（查六十四卦表）"""
+        try:
+            return hexagram.gua_name(symbol)
+        except ValueError:
+            return f"未知卦象({symbol})"
     
     def get_divination_steps(self) -> List[str]:
         """获取解卦步骤"""
@@ -326,5 +421,23 @@ class EnhancedDivinationSystem:
             "⑧ 六个都是变爻：乾坤两卦看用九、用六"
         ]
 
-# 创建全局实例
-enhanced_divination = EnhancedDivinationSystem()
+_instance: Optional[EnhancedDivinationSystem] = None
+_instance_lock = threading.Lock()
+
+
+def get_enhanced_divination() -> EnhancedDivinationSystem:
+    """获取进程内共享的增强解卦系统（首次调用时创建，避免导入模块即加载知识库）"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                with timed("增强解卦系统"):
+                    _instance = EnhancedDivinationSystem()
+    return _instance
+
+
+def __getattr__(name: str):
+    # 兼容原来的模块级全局实例 enhanced_divination：首次访问时才创建
+    if name == "enhanced_divination":
+        return get_enhanced_divination()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
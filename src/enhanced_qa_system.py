@@ -3,19 +3,29 @@
 专门处理日常生活风水、周公解梦、日常提问等问题
 """
 
-import requests
 import json
 import random
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 from datetime import datetime
 import os
 import re
+import threading
 from urllib.parse import quote
 from .api_config import APIConfig
+from . import llm_client
+from .passage_corpus import get_shared_corpus
+from .startup_report import timed
 
 class EnhancedQASystem:
     """增强智能问答系统"""
     
+    # 注册到统一语料库的结构化知识来源
+    KNOWLEDGE_SOURCES = ("fengshui", "dream", "daily")
+    
+    # 股票问题同时询问两个模型：回答选取策略（见 llm_client.ANSWER_POLICIES）与等待的截止时间（秒）
+    STOCK_ANSWER_POLICY = "first"
+    STOCK_ANSWER_DEADLINE = 15.0
+    
     def __init__(self):
         # 设置环境变量
         APIConfig.setup_environment_variables()
@@ -38,6 +48,16 @@ class EnhancedQASystem:
         self.dream_knowledge = self.load_dream_knowledge()
         self.daily_knowledge = self.load_daily_knowledge()
         
+        # 结构化知识展平为段落，注册到进程内共享的统一语料库，与周易知识共用一份索引
+        self.corpus = None
+        try:
+            self.corpus = get_shared_corpus()
+            for name, knowledge in zip(self.KNOWLEDGE_SOURCES,
+                                       (self.fengshui_knowledge, self.dream_knowledge, self.daily_knowledge)):
+                self.corpus.register_knowledge(name, knowledge)
+        except Exception as e:
+            print(f"注册统一语料库失败: {e}")
+        
         # 搜索API配置
         self.search_apis = {
             "baidu": "https://www.baidu.com/s?wd=",
@@ -375,88 +395,60 @@ class EnhancedQASystem:
             }
         }
     
-    def call_qwen_api(self, question: str, context: str = "") -> str:
-        """调用qwen API - 优化版"""
+    def _system_prompt(self, context: str) -> str:
+        return f"你是一个专业的智能助手，专门回答日常生活风水、周公解梦、日常提问等问题。请提供专业、详细的回答。{context}"
+    
+    def call_qwen_api(self, question: str, context: str = "", cancel: Optional[threading.Event] = None) -> str:
+        """调用qwen API - 优化版（共享连接池客户端）"""
         try:
             if not self.api_keys["qwen"]:
                 return ""
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_keys['qwen']}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "qwen-turbo",
-                "input": {
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": f"你是一个专业的智能助手，专门回答日常生活风水、周公解梦、日常提问等问题。请提供专业、详细的回答。{context}"
-                        },
-                        {
-                            "role": "user",
-                            "content": question
-                        }
-                    ]
-                },
-                "parameters": {
-                    "temperature": 0.7,
-                    "max_tokens": 800  # 减少token数量以提高速度
-                }
-            }
-            
-            response = requests.post(self.api_endpoints["qwen"], headers=headers, json=data, timeout=15)  # 减少超时时间
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["output"]["text"]
-            else:
-                return ""
-                
+            # 减少token数量与超时时间以提高速度
+            return llm_client.chat("qwen", self._system_prompt(context), question,
+                                   temperature=0.7, max_tokens=800, timeout=15, cancel=cancel) or ""
         except Exception as e:
             print(f"Qwen API调用失败: {e}")
             return ""
     
-    def call_deepseek_api(self, question: str, context: str = "") -> str:
-        """调用deep seek API - 优化版"""
+    def call_deepseek_api(self, question: str, context: str = "", cancel: Optional[threading.Event] = None) -> str:
+        """调用deep seek API - 优化版（共享连接池客户端）"""
         try:
             if not self.api_keys["deepseek"]:
                 return ""
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_keys['deepseek']}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": f"你是一个专业的智能助手，专门回答日常生活风水、周公解梦、日常提问等问题。请提供专业、详细的回答。{context}"
-                    },
-                    {
-                        "role": "user",
-                        "content": question
-                    }
-                ],
-                "temperature": 0.7,
-                "max_tokens": 800  # 减少token数量以提高速度
-            }
-            
-            response = requests.post(self.api_endpoints["deepseek"], headers=headers, json=data, timeout=15)  # 减少超时时间
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
-            else:
-                return ""
-                
+            # 减少token数量与超时时间以提高速度
+            return llm_client.chat("deepseek", self._system_prompt(context), question,
+                                   temperature=0.7, max_tokens=800, timeout=15, cancel=cancel) or ""
         except Exception as e:
             print(f"DeepSeek API调用失败: {e}")
             return ""
     
+    def stream_api_answer(self, question: str, context: str, on_text: Callable[[str], None]) -> str:
+        """流式调用大模型（DeepSeek优先，失败时改用Qwen），每收到一段即以累计文本回调 on_text"""
+        providers = [name for name in ("deepseek", "qwen") if self.api_keys[name]]
+        _, answer = llm_client.stream_with_fallback(providers, self._system_prompt(context), question, on_text,
+                                                    temperature=0.7, max_tokens=800, timeout=15)
+        return answer
+    
+    def get_api_answer(self, question: str, context: str,
+                       on_text: Optional[Callable[[str], None]] = None) -> str:
+        """大模型回答：传入 on_text 时流式生成（见 stream_api_answer），边生成边显示的回答即最终回答；
+        否则分别调用Qwen与DeepSeek，取更详细（更长）的回答"""
+        if on_text:
+            return self.stream_api_answer(question, context, on_text)
+        qwen_answer = self.call_qwen_api(question, context)
+        deepseek_answer = self.call_deepseek_api(question, context)
+        return qwen_answer if len(qwen_answer) > len(deepseek_answer) else deepseek_answer
+    
+    def get_knowledge_context(self, question: str, top_k: int = 3) -> str:
+        """从统一语料库检索与问题相关的本地知识条目，作为大模型的参考资料"""
+        if self.corpus is None:
+            return ""
+        hits = self.corpus.search(question, top_k, sources=self.KNOWLEDGE_SOURCES)
+        if not hits:
+            return ""
+        parts = [f"【{passage['path']}】\n{passage['text']}" for passage, _ in hits]
+        return "\n\n参考资料：\n" + "\n\n".join(parts)
+    
     def get_fallback_answer(self, question: str) -> str:
         """获取备用答案"""
         # 基于本地知识库的智能回答
@@ -1424,38 +1416,21 @@ class EnhancedQASystem:
             if search_results:
                 network_context = "\n\n网络实时数据：\n" + "\n".join([f"{i+1}. {r}" for i, r in enumerate(search_results[:3])])
             
-            # 调用DeepSeek API进行专业分析
-            deepseek_answer = ""
-            try:
-                if self.api_keys["deepseek"]:
-                    deepseek_answer = self.call_deepseek_api(
-                        stock_prompt + network_context,
-                        context="你是一个专业的股票分析师，擅长基于实时数据提供投资建议。请直接给出专业、简洁的答案，不要废话。"
-                    )
-            except Exception as e:
-                print(f"DeepSeek API调用失败: {e}")
-            
-            # 调用Qwen API进行补充分析
-            qwen_answer = ""
-            try:
-                if self.api_keys["qwen"]:
-                    qwen_answer = self.call_qwen_api(
-                        stock_prompt + network_context,
-                        context="你是一个专业的股票分析师，擅长基于实时数据提供投资建议。请直接给出专业、简洁的答案，不要废话。"
-                    )
-            except Exception as e:
-                print(f"Qwen API调用失败: {e}")
-            
-            # 合并两个模型的回答，优先使用更详细的
-            if deepseek_answer and qwen_answer:
-                if len(deepseek_answer) > len(qwen_answer):
-                    final_answer = deepseek_answer
-                else:
-                    final_answer = qwen_answer
-            elif deepseek_answer:
-                final_answer = deepseek_answer
-            elif qwen_answer:
-                final_answer = qwen_answer
+            # 同时调用DeepSeek与Qwen，按策略选取回答（最先返回 / 截止前最长 / 合并），其余请求取消
+            analyst_context = "你是一个专业的股票分析师，擅长基于实时数据提供投资建议。请直接给出专业、简洁的答案，不要废话。"
+            prompt = stock_prompt + network_context
+            providers = {"deepseek": self.call_deepseek_api, "qwen": self.call_qwen_api}
+            calls = {
+                name: (lambda cancel, call=call: call(prompt, context=analyst_context, cancel=cancel))
+                for name, call in providers.items() if self.api_keys[name]
+            }
+            answers = llm_client.gather_answers(calls, policy=self.STOCK_ANSWER_POLICY,
+                                                deadline=self.STOCK_ANSWER_DEADLINE)
+            if len(answers) > 1:
+                final_answer = "\n\n".join(f"【{'DeepSeek' if name == 'deepseek' else 'Qwen'}】\n{answer}"
+                                             for name, answer in answers)
+            elif answers:
+                final_answer = answers[0][1]
             else:
                 # 如果API调用失败，使用本地知识库
                 final_answer = self.get_fallback_answer(question)
@@ -1496,8 +1471,9 @@ class EnhancedQASystem:
             # 回退到通用方法
             return self.answer_question(question)
     
-    def answer_question(self, question: str) -> Dict[str, Any]:
-        """回答用户问题 - 全面增强版：确保所有回答都包含完整结构"""
+    def answer_question(self, question: str, on_text: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """回答用户问题 - 全面增强版：确保所有回答都包含完整结构
+        给出 on_text 时大模型回答改为流式生成，每收到一段即以累计文本回调（供界面边生成边显示）"""
         # 1) 先获取本地回答
         base_answer = self.get_fallback_answer(question)
         search_results = self.search_online(question, max_results=3)
@@ -1543,24 +1519,10 @@ class EnhancedQASystem:
                 context = ""
                 current_question = question
             
-            # 尝试同时调用 Qwen 和 DeepSeek，选择更好的回答
+            # 调用大模型（流式时边生成边显示，否则比较 Qwen 和 DeepSeek 选择更好的回答）
             api_answer = ""
             try:
-                # 尝试调用 Qwen
-                qwen_answer = self.call_qwen_api(current_question, context)
-                # 尝试调用 DeepSeek
-                deepseek_answer = self.call_deepseek_api(current_question, context)
-                
-                # 选择更详细的回答
-                if qwen_answer and deepseek_answer:
-                    if len(qwen_answer) > len(deepseek_answer):
-                        api_answer = qwen_answer
-                    else:
-                        api_answer = deepseek_answer
-                elif qwen_answer:
-                    api_answer = qwen_answer
-                elif deepseek_answer:
-                    api_answer = deepseek_answer
+                api_answer = self.get_api_answer(current_question, context, on_text)
             except Exception as e:
                 print(f"API调用出错: {e}")
             
@@ -1571,22 +1533,9 @@ class EnhancedQASystem:
         elif need_api and not has_comprehensive_structure:
             # 如果需要API且本地回答结构不完整，尝试调用API
             try:
-                # 尝试同时调用两个模型
-                qwen_answer = self.call_qwen_api(question)
-                deepseek_answer = self.call_deepseek_api(question)
-                
-                # 选择更详细的回答
-                if qwen_answer and deepseek_answer:
-                    if len(qwen_answer) > len(deepseek_answer):
-                        api_answer = qwen_answer
-                    else:
-                        api_answer = deepseek_answer
-                elif qwen_answer:
-                    api_answer = qwen_answer
-                elif deepseek_answer:
-                    api_answer = deepseek_answer
-                else:
-                    api_answer = ""
+                # 尝试同时调用两个模型，附上统一语料库中检索到的本地知识
+                knowledge_context = self.get_knowledge_context(question)
+                api_answer = self.get_api_answer(question, knowledge_context, on_text)
                 
                 if api_answer and len(api_answer) > 200:
                     # 如果API回答足够详细，使用API回答
@@ -1658,5 +1607,23 @@ class EnhancedQASystem:
             "has_search_results": len(search_results) > 0
         }
 
-# 创建全局实例
-enhanced_qa = EnhancedQASystem()
+_instance: Optional[EnhancedQASystem] = None
+_instance_lock = threading.Lock()
+
+
+def get_enhanced_qa() -> EnhancedQASystem:
+    """获取进程内共享的增强问答系统（首次调用时创建，避免导入模块即构建知识库）"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                with timed("增强问答系统"):
+                    _instance = EnhancedQASystem()
+    return _instance
+
+
+def __getattr__(name: str):
+    # 兼容原来的模块级全局实例 enhanced_qa：首次访问时才创建
+    if name == "enhanced_qa":
+        return get_enhanced_qa()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
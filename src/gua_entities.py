@@ -0,0 +1,119 @@
+"""
+卦象实体标注 - 入库时标注段落提到的卦名、经卦与爻位，并建立 实体 -> 段落ID 的倒排表
+卦名按"屯卦"等全称与"乾为天"等八纯卦别称匹配，两字卦名如"既济""明夷"也匹配简称，
+单字简称歧义太大，只在"屯："这类卦题位置匹配，
+经卦按"坎上""下震""离宫"等上下卦表述匹配，爻位匹配"初九""六二""上六""用九"等爻题；
+按卦查段落因此是一次字典查找，不再需要对全部语料做模糊检索
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .hexagram import GUA_NAMES, TRIGRAM_NAMES
+
+# 实体类别
+GUA, TRIGRAM, LINE = "gua", "trigram", "line"
+ENTITY_KINDS = (GUA, TRIGRAM, LINE)
+
+# 可按简称匹配的两字卦名（"大有""家人"等常用词容易误标，不在此列）
+_BARE_GUA_NAMES = ("小畜", "同人", "噬嗑", "无妄", "大畜", "大过", "大壮", "明夷", "归妹", "中孚", "小过", "既济", "未济")
+
+_GUA_ALIASES = {name: name for name in GUA_NAMES}
+_GUA_ALIASES.update({name: name + "卦" for name in _BARE_GUA_NAMES})
+_GUA_ALIASES.update({
+    "乾为天": "乾卦", "坤为地": "坤卦", "震为雷": "震卦", "巽为风": "巽卦",
+    "坎为水": "坎卦", "离为火": "离卦", "艮为山": "艮卦", "兑为泽": "兑卦",
+})
+# 长名优先，避免"小过卦"先匹配到"过卦"之类的片段
+_GUA_PATTERN = re.compile("|".join(sorted(map(re.escape, _GUA_ALIASES), key=len, reverse=True)))
+
+# 卦题：前面不是汉字、后面紧跟冒号的卦名简称（如段首的"屯：元亨利贞"）
+_GUA_HEADING_PATTERN = re.compile(
+    "(?<![\u4e00-\u9fff])(" + "|".join(sorted((name[:-1] for name in GUA_NAMES), key=len, reverse=True)) + ")(?=[：:])"
+)
+
+_TRIGRAM_CHARS = "".join(TRIGRAM_NAMES)
+_TRIGRAM_PATTERN = re.compile(f"([{_TRIGRAM_CHARS}])(?=[上下宫])|(?<=[上下内外])([{_TRIGRAM_CHARS}])")
+
+# 爻题：初九/初六、九二至九五/六二至六五、上九/上六、用九/用六
+LINE_NAMES = ["初九", "初六", "九二", "六二", "九三", "六三", "九四", "六四", "九五", "六五", "上九", "上六", "用九", "用六"]
+_LINE_PATTERN = re.compile("|".join(LINE_NAMES))
+
+
+def tag_text(text: str) -> Dict[str, List[str]]:
+    """标注文本提到的卦名、经卦与爻位（各类按首次出现顺序去重）"""
+    text = text or ''
+    matches = [(match.start(), _GUA_ALIASES[match.group()]) for match in _GUA_PATTERN.finditer(text)]
+    matches += [(match.start(), match.group(1) + "卦") for match in _GUA_HEADING_PATTERN.finditer(text)]
+    guas = [name for _, name in sorted(matches)]
+    trigrams = [match.group(1) or match.group(2) for match in _TRIGRAM_PATTERN.finditer(text)]
+    lines = _LINE_PATTERN.findall(text)
+    return {
+        GUA: list(dict.fromkeys(guas)),
+        TRIGRAM: list(dict.fromkeys(trigrams)),
+        LINE: list(dict.fromkeys(lines)),
+    }
+
+
+def gua_sections(text: str) -> List[Tuple[str, str]]:
+    """按卦题（如"屯："）切分文本：[(卦名全称, 该卦卦题之后到下一个卦题之前的正文)]"""
+    text = text or ''
+    headings = list(_GUA_HEADING_PATTERN.finditer(text))
+    sections = []
+    for i, match in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        sections.append((match.group(1) + "卦", text[match.end() + 1:end]))
+    return sections
+
+
+def normalize_gua_name(name: str) -> str:
+    """卦名统一为带"卦"字的全称（"屯" -> "屯卦"）"""
+    return name if name.endswith("卦") else name + "卦"
+
+
+class EntityIndex:
+    """实体倒排表：(类别, 名称) -> 段落ID列表（按入库顺序）"""
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, List[str]]] = {kind: defaultdict(list) for kind in ENTITY_KINDS}
+
+    def add(self, passage_id: str, entities: Dict[str, List[str]]):
+        for kind, names in entities.items():
+            postings = self._postings[kind]
+            for name in names:
+                postings[name].append(passage_id)
+
+    def lookup(self, kind: str, name: str) -> List[str]:
+        """提到某个实体的段落ID"""
+        if kind == GUA:
+            name = normalize_gua_name(name)
+        return list(self._postings[kind].get(name, ()))
+
+    def query(self, gua: Optional[str] = None, line: Optional[str] = None,
+              trigram: Optional[str] = None) -> List[str]:
+        """同时提到给定卦名、爻位、经卦的段落ID（未给出的条件不限制，全部未给出时返回空）"""
+        conditions = [(kind, name) for kind, name in ((GUA, gua), (LINE, line), (TRIGRAM, trigram)) if name]
+        if not conditions:
+            return []
+        postings = sorted((self.lookup(kind, name) for kind, name in conditions), key=len)
+        matched = set(postings[0])
+        for passage_ids in postings[1:]:
+            matched.intersection_update(passage_ids)
+        return [passage_id for passage_id in postings[0] if passage_id in matched]
+
+    def names(self, kind: str) -> List[str]:
+        """某类实体中至少被一个段落提到的名称"""
+        return [name for name, passage_ids in self._postings[kind].items() if passage_ids]
+
+    def counts(self) -> Dict[str, int]:
+        """各类实体的不同名称数"""
+        return {kind: len(postings) for kind, postings in self._postings.items()}
+
+
+def build_entity_index(passages: Iterable[Dict]) -> EntityIndex:
+    """由已标注的段落（entities 字段）建立实体倒排表"""
+    index = EntityIndex()
+    for passage in passages:
+        index.add(passage['id'], passage.get('entities', {}))
+    return index
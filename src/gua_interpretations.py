@@ -0,0 +1,92 @@
+"""
+六十四卦解读表 - 离线预计算各卦的解读内容
+白话文解释、象辞、邵雍河洛理数、傅佩荣解卦手册、卦辞参考五部分只取决于卦名，
+构建步骤为全部64卦各检索一次知识库，结果写成紧凑的JSON表（附知识库指纹），
+运行时 get_enhanced_divination_result 只需按卦名查表，每次请求只填写时间、事件与变卦
+
+用法：
+    python -m src.gua_interpretations         # 生成 knowledge_base/compiled/gua_interpretations.json
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from .hexagram import GUA_NAMES
+from .kb_store import COMPILED_DIR
+
+logger = logging.getLogger(__name__)
+
+TABLE_FILE = "gua_interpretations.json"
+TABLE_VERSION = 3
+
+# 表中每卦保存的解读部分（与 get_enhanced_divination_result 的结果字段同名）
+SECTIONS = ("plain_explanation", "xiang_ci", "shao_yong_explanation", "fu_peirong_handbook", "gua_ci_reference")
+
+
+def table_path(knowledge_base_dir: str) -> str:
+    """解读表路径：knowledge_base/compiled/gua_interpretations.json"""
+    return os.path.join(knowledge_base_dir, COMPILED_DIR, TABLE_FILE)
+
+
+def compute_sections(system: Any, gua_name: str) -> Dict[str, Any]:
+    """检索知识库计算一卦的全部解读部分（各部分与卦象符号无关，符号传空）"""
+    return {
+        "plain_explanation": system.get_plain_explanation(gua_name, ""),
+        "xiang_ci": system.get_xiang_ci(gua_name, ""),
+        "shao_yong_explanation": system.get_shao_yong_explanation(gua_name, ""),
+        "fu_peirong_handbook": system.get_fu_peirong_handbook(gua_name, ""),
+        "gua_ci_reference": system.get_gua_ci_reference(gua_name, ""),
+    }
+
+
+def build_table(system: Any, output_path: str, fingerprint: str = "") -> str:
+    """为全部64卦计算解读并写出紧凑JSON表"""
+    table = {
+        "version": TABLE_VERSION,
+        "fingerprint": fingerprint,
+        "gua": {gua_name: compute_sections(system, gua_name) for gua_name in GUA_NAMES},
+    }
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, output_path)
+    logger.info(f"六十四卦解读表已生成: {output_path}")
+    return output_path
+
+
+def load_table(path: str, fingerprint: str = "") -> Optional[Dict[str, Dict[str, Any]]]:
+    """读取解读表；不存在、版本不符或知识库已变化时返回None，由调用方回退到实时检索"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            table = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取六十四卦解读表失败 {path}: {e}")
+        return None
+    if table.get("version") != TABLE_VERSION or table.get("fingerprint") != fingerprint:
+        logger.info(f"六十四卦解读表已过期，回退到实时检索: {path}")
+        return None
+    return table.get("gua", {})
+
+
+def main():
+    """主函数 - 生成六十四卦解读表"""
+    logging.basicConfig(level=logging.INFO)
+    from .enhanced_divination_system import EnhancedDivinationSystem
+
+    print("生成六十四卦解读表")
+    print("=" * 50)
+    system = EnhancedDivinationSystem()
+    if system.corpus is None:
+        print("未找到知识库目录")
+        return
+    output = build_table(system, table_path(system.knowledge_base_dir), system.corpus.fingerprint())
+    print(f"生成完成: {output}")
+
+
+if __name__ == "__main__":
+    main()
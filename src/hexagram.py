@@ -0,0 +1,190 @@
+"""
+卦象核心 - 以6位整数表示卦象，查表完成卦名、经卦与各种变换
+第 i 位（从0计）表示自下而上第 i+1 爻，1为阳、0为阴；卦象符号字符串同样自下而上书写，
+下卦为低3位、上卦为高3位。卦名、经卦、错卦、综卦、互卦与变爻结果均预先计算为64项数组，
+单卦查询是数组下标，多次起卦可用 NumPy 数组一次完成；
+卦象关系图 RELATION_GRAPH[卦码, 变爻掩码] 一次下标即得之卦、互卦、错卦、综卦
+"""
+
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+# 八经卦（按3位编码排列，第0位为初爻）
+TRIGRAM_NAMES = ["坤", "震", "坎", "兑", "艮", "离", "巽", "乾"]
+TRIGRAM_IMAGES = ["地", "雷", "水", "泽", "山", "火", "风", "天"]
+_TRIGRAM_CODES = {name: code for code, name in enumerate(TRIGRAM_NAMES)}
+
+# 文王卦序：(卦名, 上卦, 下卦)
+_KING_WEN = [
+    ("乾卦", "乾", "乾"), ("坤卦", "坤", "坤"), ("屯卦", "坎", "震"), ("蒙卦", "艮", "坎"),
+    ("需卦", "坎", "乾"), ("讼卦", "乾", "坎"), ("师卦", "坤", "坎"), ("比卦", "坎", "坤"),
+    ("小畜卦", "巽", "乾"), ("履卦", "乾", "兑"), ("泰卦", "坤", "乾"), ("否卦", "乾", "坤"),
+    ("同人卦", "乾", "离"), ("大有卦", "离", "乾"), ("谦卦", "坤", "艮"), ("豫卦", "震", "坤"),
+    ("随卦", "兑", "震"), ("蛊卦", "艮", "巽"), ("临卦", "坤", "兑"), ("观卦", "巽", "坤"),
+    ("噬嗑卦", "离", "震"), ("贲卦", "艮", "离"), ("剥卦", "艮", "坤"), ("复卦", "坤", "震"),
+    ("无妄卦", "乾", "震"), ("大畜卦", "艮", "乾"), ("颐卦", "艮", "震"), ("大过卦", "兑", "巽"),
+    ("坎卦", "坎", "坎"), ("离卦", "离", "离"), ("咸卦", "兑", "艮"), ("恒卦", "震", "巽"),
+    ("遁卦", "乾", "艮"), ("大壮卦", "震", "乾"), ("晋卦", "离", "坤"), ("明夷卦", "坤", "离"),
+    ("家人卦", "巽", "离"), ("睽卦", "离", "兑"), ("蹇卦", "坎", "艮"), ("解卦", "震", "坎"),
+    ("损卦", "艮", "兑"), ("益卦", "巽", "震"), ("夬卦", "兑", "乾"), ("姤卦", "乾", "巽"),
+    ("萃卦", "兑", "坤"), ("升卦", "坤", "巽"), ("困卦", "兑", "坎"), ("井卦", "坎", "巽"),
+    ("革卦", "兑", "离"), ("鼎卦", "离", "巽"), ("震卦", "震", "震"), ("艮卦", "艮", "艮"),
+    ("渐卦", "巽", "艮"), ("归妹卦", "震", "兑"), ("丰卦", "震", "离"), ("旅卦", "离", "艮"),
+    ("巽卦", "巽", "巽"), ("兑卦", "兑", "兑"), ("涣卦", "巽", "坎"), ("节卦", "坎", "兑"),
+    ("中孚卦", "巽", "兑"), ("小过卦", "震", "艮"), ("既济卦", "坎", "离"), ("未济卦", "离", "坎"),
+]
+
+# 六十四卦卦名（文王卦序）
+GUA_NAMES = [name for name, _, _ in _KING_WEN]
+
+_CODES = np.arange(64, dtype=np.int64)
+
+# 文王卦序号（1-64）-> 卦码，以及反查表
+CODE_BY_NUMBER = np.array(
+    [0] + [_TRIGRAM_CODES[lower] | (_TRIGRAM_CODES[upper] << 3) for _, upper, lower in _KING_WEN],
+    dtype=np.int64,
+)
+KING_WEN_NUMBER = np.zeros(64, dtype=np.int64)
+KING_WEN_NUMBER[CODE_BY_NUMBER[1:]] = np.arange(1, 65)
+
+# 卦码 -> 卦名 / 下卦 / 上卦
+NAMES = np.array([GUA_NAMES[number - 1] for number in KING_WEN_NUMBER], dtype=object)
+LOWER = _CODES & 7
+UPPER = _CODES >> 3
+
+# 错卦：六爻阴阳全反
+CUO = _CODES ^ 63
+# 综卦：上下颠倒（位序反转）
+ZONG = np.array([int(format(code, '06b')[::-1], 2) for code in range(64)], dtype=np.int64)
+# 互卦：二三四爻为下卦，三四五爻为上卦
+HU = ((_CODES >> 1) & 7) | (((_CODES >> 2) & 7) << 3)
+# 变爻结果：CHANGED[卦码, 变爻掩码] 为之卦卦码
+CHANGED = _CODES[:, None] ^ _CODES[None, :]
+
+# 卦象关系图：RELATION_GRAPH[卦码, 变爻掩码] = (之卦, 互卦, 错卦, 综卦) 的卦码
+RELATION_KINDS = ("changed", "hu", "cuo", "zong")
+RELATION_LABELS = {"changed": "之卦", "hu": "互卦", "cuo": "错卦", "zong": "综卦"}
+RELATION_GRAPH = np.stack(
+    [CHANGED] + [np.broadcast_to(table[:, None], (64, 64)) for table in (HU, CUO, ZONG)], axis=-1
+)
+RELATION_GRAPH.setflags(write=False)
+
+_CODE_BY_NAME = {name: int(code) for code, name in enumerate(NAMES)}
+_CODE_BY_NAME.update({name[:-1]: code for name, code in list(_CODE_BY_NAME.items())})
+
+# 爻的类型 -> 数值（六为老阴、七为少阳、八为少阴、九为老阳；奇数为阳，六与九为变爻）
+YAO_VALUES = {"老阴": 6, "少阳": 7, "少阴": 8, "老阳": 9}
+
+_LINE_WEIGHTS = 1 << np.arange(6, dtype=np.int64)
+
+
+def symbol_to_code(symbol: str) -> int:
+    """卦象符号（自下而上的6个'0'/'1'）-> 卦码"""
+    if len(symbol) != 6 or set(symbol) - {'0', '1'}:
+        raise ValueError(f"无效的卦象符号: {symbol}")
+    return int(symbol[::-1], 2)
+
+
+def code_to_symbol(code: int) -> str:
+    """卦码 -> 卦象符号（自下而上）"""
+    return format(int(code) & 63, '06b')[::-1]
+
+
+def name_to_code(name: str) -> int:
+    """卦名（带或不带"卦"字）-> 卦码"""
+    if name not in _CODE_BY_NAME:
+        raise ValueError(f"未知的卦名: {name}")
+    return _CODE_BY_NAME[name]
+
+
+def gua_name(symbol: str) -> str:
+    """根据卦象符号获取卦名"""
+    return NAMES[symbol_to_code(symbol)]
+
+
+def trigrams(code: int) -> Tuple[str, str]:
+    """(上卦, 下卦) 名称"""
+    return TRIGRAM_NAMES[UPPER[code]], TRIGRAM_NAMES[LOWER[code]]
+
+
+def describe(code: int) -> Dict[str, Any]:
+    """卦的基本信息：文王卦序号、卦名、符号、上下卦及错综互卦"""
+    code = int(code)
+    upper, lower = int(UPPER[code]), int(LOWER[code])
+    return {
+        "id": int(KING_WEN_NUMBER[code]),
+        "name": NAMES[code],
+        "symbol": code_to_symbol(code),
+        "upper_trigram": TRIGRAM_NAMES[upper],
+        "lower_trigram": TRIGRAM_NAMES[lower],
+        "image": f"上{TRIGRAM_IMAGES[upper]}下{TRIGRAM_IMAGES[lower]}",
+        "cuo": NAMES[CUO[code]],
+        "zong": NAMES[ZONG[code]],
+        "hu": NAMES[HU[code]],
+    }
+
+
+def line_titles(code: int) -> List[str]:
+    """六爻爻题（自下而上，如屯卦为 初九、六二、六三、六四、九五、上六）"""
+    titles = []
+    for position in range(6):
+        number = "九" if int(code) >> position & 1 else "六"
+        if position == 0:
+            titles.append("初" + number)
+        elif position == 5:
+            titles.append("上" + number)
+        else:
+            titles.append(number + "二三四五"[position - 1])
+    return titles
+
+
+def relations(code: int, moving_mask: int = 0) -> Dict[str, Dict[str, Any]]:
+    """本卦在给定变爻下的相关卦：{"changed"/"hu"/"cuo"/"zong": {"label", "code", "name", "symbol"}}"""
+    related = RELATION_GRAPH[int(code) & 63, int(moving_mask) & 63]
+    return {
+        kind: {
+            "label": RELATION_LABELS[kind],
+            "code": int(related_code),
+            "name": NAMES[related_code],
+            "symbol": code_to_symbol(related_code),
+        }
+        for kind, related_code in zip(RELATION_KINDS, related)
+    }
+
+
+def line_values(yao_results: Iterable[Union[str, int]]) -> np.ndarray:
+    """爻的类型（老阳/少阳/少阴/老阴）或数值（6-9）-> 数值数组"""
+    return np.array([YAO_VALUES.get(yao, yao) for yao in yao_results], dtype=np.int64)
+
+
+def evaluate_casts(lines: Union[np.ndarray, Sequence[Sequence[int]]]) -> Dict[str, np.ndarray]:
+    """批量计算起卦结果：lines 形状为 (n, 6)，每行自下而上六爻的数值（6-9），
+    返回本卦卦码、变爻掩码、之卦卦码以及对应卦名（均为长度n的数组）"""
+    lines = np.asarray(lines, dtype=np.int64).reshape(-1, 6)
+    primary = (lines & 1) @ _LINE_WEIGHTS
+    moving = ((lines == 6) | (lines == 9)) @ _LINE_WEIGHTS
+    changed = CHANGED[primary, moving]
+    return {
+        "primary": primary,
+        "moving_mask": moving,
+        "changed": changed,
+        "primary_names": NAMES[primary],
+        "changed_names": NAMES[changed],
+    }
+
+
+def evaluate_cast(yao_results: Iterable[Union[str, int]]) -> Dict[str, Any]:
+    """单次起卦结果：本卦、变爻位置（1-6，自下而上）与之卦"""
+    result = evaluate_casts(line_values(yao_results)[None, :])
+    primary, moving, changed = int(result["primary"][0]), int(result["moving_mask"][0]), int(result["changed"][0])
+    return {
+        "primary": primary,
+        "primary_name": NAMES[primary],
+        "primary_symbol": code_to_symbol(primary),
+        "moving_lines": [i + 1 for i in range(6) if moving >> i & 1],
+        "moving_mask": moving,
+        "changed": changed,
+        "changed_name": NAMES[changed],
+        "changed_symbol": code_to_symbol(changed),
+    }
@@ -0,0 +1,281 @@
+"""
+编译型知识库存储 - 将JSON/JSONL知识库编译为可内存映射的二进制文件
+文件由偏移表、UTF-8文本块和元数据数组组成，读取时通过 mmap 映射，无需解析整份JSON，
+只有访问到的记录字段才解码文本；段落语料库建索引时会解码每条记录用到的文本字段（见 passage_corpus），
+解码后的文本不在进程间共享
+
+文件布局（小端序）：
+    魔数 b'KBS1' | 头部长度 uint32 | 头部JSON
+    文本偏移表 uint64[记录数 * 字段数 + 1]
+    元数据偏移表 uint64[记录数 + 1]
+    文本块（各记录各文本字段的UTF-8字节，依次相连）
+    元数据块（各记录非文本字段的JSON）
+    附加数据块（文件顶层的其他字段，JSON）
+
+用法：
+    python -m src.kb_store            # 编译 knowledge_base/ 下的知识库文件
+"""
+
+import os
+import json
+import mmap
+import struct
+import logging
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'KBS1'
+COMPILED_DIR = "compiled"
+COMPILED_SUFFIX = ".kbs"
+
+# 各类知识库文件中需要按文本块存储的字段
+JSONL_TEXT_FIELDS = ("question", "answer", "source_text")
+QA_TEXT_FIELDS = ("question", "answer")
+PROCESSED_TEXT_FIELDS = ("raw_text", "processed_text", "translated_text")
+
+
+def source_fingerprint(paths: Sequence[str]) -> str:
+    """根据源文件的路径、大小和修改时间生成指纹，用于判断编译产物是否过期"""
+    parts = []
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def compiled_path(source_path: str) -> str:
+    """源文件对应的编译产物路径：knowledge_base/compiled/<文件名>.kbs"""
+    directory, filename = os.path.split(source_path)
+    return os.path.join(directory, COMPILED_DIR, filename + COMPILED_SUFFIX)
+
+
+def _align(size: int) -> int:
+    return (size + 7) // 8 * 8
+
+
+def compile_store(records: Sequence[Dict[str, Any]], output_path: str, text_fields: Sequence[str],
+                  extra: Optional[Dict[str, Any]] = None, fingerprint: str = "") -> str:
+    """将记录列表编译为二进制存储文件"""
+    text_fields = tuple(text_fields)
+    text_offsets = [0]
+    text_chunks: List[bytes] = []
+    meta_offsets = [0]
+    meta_chunks: List[bytes] = []
+
+    for record in records:
+        for field in text_fields:
+            chunk = str(record.get(field) or '').encode('utf-8')
+            text_chunks.append(chunk)
+            text_offsets.append(text_offsets[-1] + len(chunk))
+        meta = {key: value for key, value in record.items() if key not in text_fields}
+        chunk = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        meta_chunks.append(chunk)
+        meta_offsets.append(meta_offsets[-1] + len(chunk))
+
+    extra_bytes = json.dumps(extra or {}, ensure_ascii=False).encode('utf-8')
+    text_size = text_offsets[-1]
+    meta_size = meta_offsets[-1]
+
+    header = {
+        "count": len(records),
+        "text_fields": list(text_fields),
+        "fingerprint": fingerprint,
+        "text_size": text_size,
+        "meta_size": meta_size,
+        "extra_size": len(extra_bytes),
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * (_align(8 + len(header_bytes)) - 8 - len(header_bytes))
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(np.asarray(text_offsets, dtype='<u8').tobytes())
+        f.write(np.asarray(meta_offsets, dtype='<u8').tobytes())
+        for chunk in text_chunks:
+            f.write(chunk)
+        for chunk in meta_chunks:
+            f.write(chunk)
+        f.write(extra_bytes)
+    os.replace(tmp_path, output_path)
+
+    logger.info(f"知识库已编译: {output_path}，共{len(records)}条记录，文本{text_size}字节")
+    return output_path
+
+
+class LazyRecord(Mapping):
+    """按需解码的记录：元数据和文本字段只在访问时从映射内存中解码"""
+
+    __slots__ = ("_store", "_index", "_meta")
+
+    def __init__(self, store: "CompiledStore", index: int):
+        self._store = store
+        self._index = index
+        self._meta: Optional[Dict[str, Any]] = None
+
+    def _metadata(self) -> Dict[str, Any]:
+        if self._meta is None:
+            self._meta = self._store.meta(self._index)
+        return self._meta
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._store.field_positions:
+            return self._store.text(self._index, key)
+        return self._metadata()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._store.text_fields
+        yield from self._metadata()
+
+    def __len__(self) -> int:
+        return len(self._store.text_fields) + len(self._metadata())
+
+    def __repr__(self) -> str:
+        return f"LazyRecord({self._store.path!r}, {self._index})"
+
+
+class CompiledStore(Sequence):
+    """内存映射的编译型知识库读取器"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:4] != MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的编译知识库文件: {path}")
+        header_len = struct.unpack_from('<I', self._mm, 4)[0]
+        header = json.loads(self._mm[8:8 + header_len].decode('utf-8'))
+
+        self.count = header["count"]
+        self.text_fields = tuple(header["text_fields"])
+        self.field_positions = {field: i for i, field in enumerate(self.text_fields)}
+        self.fingerprint = header.get("fingerprint", "")
+
+        n_fields = len(self.text_fields)
+        position = 8 + header_len
+        self._text_offsets = np.frombuffer(self._mm, dtype='<u8', count=self.count * n_fields + 1, offset=position)
+        position += self._text_offsets.nbytes
+        self._meta_offsets = np.frombuffer(self._mm, dtype='<u8', count=self.count + 1, offset=position)
+        position += self._meta_offsets.nbytes
+        self._text_base = position
+        self._meta_base = self._text_base + header["text_size"]
+        self._extra_base = self._meta_base + header["meta_size"]
+        self._extra_size = header["extra_size"]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [LazyRecord(self, i) for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return LazyRecord(self, index)
+
+    def text(self, index: int, field: str) -> str:
+        """解码单条记录的一个文本字段"""
+        slot = index * len(self.text_fields) + self.field_positions[field]
+        start = self._text_base + int(self._text_offsets[slot])
+        end = self._text_base + int(self._text_offsets[slot + 1])
+        return self._mm[start:end].decode('utf-8')
+
+    def meta(self, index: int) -> Dict[str, Any]:
+        """解码单条记录的元数据"""
+        start = self._meta_base + int(self._meta_offsets[index])
+        end = self._meta_base + int(self._meta_offsets[index + 1])
+        return json.loads(self._mm[start:end].decode('utf-8'))
+
+    def extra(self) -> Dict[str, Any]:
+        """解码文件顶层的附加字段"""
+        return json.loads(self._mm[self._extra_base:self._extra_base + self._extra_size].decode('utf-8'))
+
+    def close(self):
+        """关闭映射"""
+        self._text_offsets = self._meta_offsets = None
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+
+def open_compiled(source_path: str) -> Optional[CompiledStore]:
+    """打开源文件对应的编译产物；不存在或已过期时返回None，由调用方回退到JSON解析"""
+    path = compiled_path(source_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        store = CompiledStore(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"打开编译知识库失败 {path}: {e}")
+        return None
+    if store.fingerprint != source_fingerprint([source_path]):
+        logger.info(f"编译知识库已过期，回退到JSON解析: {path}")
+        store.close()
+        return None
+    return store
+
+
+def compile_source(source_path: str) -> Optional[str]:
+    """根据文件类型编译单个知识库文件"""
+    fingerprint = source_fingerprint([source_path])
+    output_path = compiled_path(source_path)
+
+    if source_path.endswith('.jsonl'):
+        with open(source_path, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return compile_store(records, output_path, JSONL_TEXT_FIELDS, fingerprint=fingerprint)
+
+    with open(source_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict) and isinstance(data.get('qa_pairs'), list) and 'raw_text' not in data:
+        # 问答集：每个问答对一条记录，其余顶层字段作为附加数据
+        extra = {key: value for key, value in data.items() if key != 'qa_pairs'}
+        return compile_store(data['qa_pairs'], output_path, QA_TEXT_FIELDS, extra=extra, fingerprint=fingerprint)
+    if isinstance(data, dict):
+        # 单本书籍的处理结果：整本书为一条记录
+        return compile_store([data], output_path, PROCESSED_TEXT_FIELDS, fingerprint=fingerprint)
+    logger.warning(f"无法识别的知识库格式，跳过: {source_path}")
+    return None
+
+
+def compile_knowledge_base(knowledge_base_dir: str = "knowledge_base") -> List[str]:
+    """编译目录下全部 JSON/JSONL 知识库文件"""
+    outputs = []
+    for filename in sorted(os.listdir(knowledge_base_dir)):
+        if not filename.endswith(('.json', '.jsonl')):
+            continue
+        if filename in ('discovery_result.json',) or filename.startswith('processing_stats'):
+            continue
+        try:
+            output = compile_source(os.path.join(knowledge_base_dir, filename))
+            if output:
+                outputs.append(output)
+        except Exception as e:
+            logger.error(f"编译知识库失败 {filename}: {e}")
+    return outputs
+
+
+def main():
+    """主函数 - 编译知识库"""
+    logging.basicConfig(level=logging.INFO)
+    print("编译知识库")
+    print("=" * 50)
+    outputs = compile_knowledge_base()
+    print(f"编译完成，共生成 {len(outputs)} 个文件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+知识库倒排索引 - 为RAG检索提供快速的词项查找与BM25排序
+加载知识库时一次性建立 词项 -> 倒排列表（记录ID, 词频），查询时只访问包含查询词项的记录
+中文按字的一元和二元组切分，无需词典，任意措辞的问题都能参与检索
+SegmentedIndex 由不可变的基础段和若干增量段组成，新入库的记录追加为增量段即可检索，
+增量段数量超过阈值后在后台线程合并，查询始终读取当前快照，不受合并影响
+单条查询使用 MaxScore 动态剪枝：按各词项的得分上界划分必要/非必要词项，
+只从必要词项的倒排列表中取候选记录，得分上界无法进入当前top_k的记录直接跳过
+"""
+
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Iterable
+from collections import Counter, defaultdict
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 中文字符连续片段 / 英文数字词
+_TOKEN_PATTERN = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf]+|[A-Za-z0-9]+')
+
+# 查询中的常见疑问虚词，不参与打分
+QUERY_STOPWORDS = {
+    '的', '是', '了', '吗', '呢', '什', '么', '请', '问', '和', '与', '在', '中',
+    '什么', '么是', '如何', '怎么', '怎样', '为什', '为何', '哪些', '请问'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """切分文本：中文片段切为单字和相邻二字组，英文数字按整词小写"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text or ''):
+        piece = match.group()
+        if piece.isascii():
+            tokens.append(piece.lower())
+            continue
+        tokens.extend(piece)
+        tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return tokens
+
+
+def tokenize_query(text: str) -> List[str]:
+    """切分查询文本并去除疑问虚词"""
+    return [token for token in tokenize(text) if token not in QUERY_STOPWORDS]
+
+
+class InvertedIndex:
+    """倒排索引段：词项 -> [(记录ID, 词频), ...]，附带BM25所需的文档长度与IDF（打分与检索见 SegmentedIndex）"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: Dict[int, int] = {}
+        self.doc_count = 0
+        self.avg_doc_length = 0.0
+        self.idf: Dict[str, float] = {}
+        self._doc_norms: Dict[int, float] = {}
+        # 各词项在本段内BM25词频项（不含IDF）的最大值，作为动态剪枝的得分上界
+        self.max_scores: Dict[str, float] = {}
+        # 按分段索引全局平均长度计算的长度归一项：(全局平均长度, 记录ID -> 归一项)
+        self._global_norms: Optional[Tuple[float, Dict[int, float]]] = None
+
+    def add_document(self, doc_id: int, term_freqs: Dict[str, int]):
+        """添加一条记录的词频统计（记录ID需递增添加，倒排列表因此保持有序）"""
+        for term, tf in term_freqs.items():
+            if tf > 0:
+                self.postings[term].append((doc_id, tf))
+        self.doc_lengths[doc_id] = sum(term_freqs.values())
+        self.doc_count += 1
+
+    def add_text(self, doc_id: int, text: str):
+        """切分文本并添加为一条记录"""
+        self.add_document(doc_id, Counter(tokenize(text)))
+
+    def finalize(self):
+        """预先计算平均文档长度、各文档的长度归一项和各词项IDF"""
+        if not self.doc_count:
+            return
+        self.avg_doc_length = sum(self.doc_lengths.values()) / self.doc_count or 1.0
+        self._doc_norms = {
+            doc_id: self.k1 * (1 - self.b + self.b * length / self.avg_doc_length)
+            for doc_id, length in self.doc_lengths.items()
+        }
+        self.idf = {
+            term: math.log(1 + (self.doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        k1_plus_1 = self.k1 + 1
+        self.max_scores = {
+            term: max(tf * k1_plus_1 / (tf + self._doc_norms[doc_id]) for doc_id, tf in postings)
+            for term, postings in self.postings.items()
+        }
+
+    def norms_for(self, avg_doc_length: float) -> Dict[int, float]:
+        """各记录在给定（全局）平均长度下的长度归一项：与本段平均长度相同时直接用 finalize 的预计算结果，
+        否则计算一次并缓存，平均长度变化（分段索引快照更新）时重建"""
+        if avg_doc_length == self.avg_doc_length and len(self._doc_norms) == len(self.doc_lengths):
+            return self._doc_norms
+        cached = self._global_norms
+        if cached is not None and cached[0] == avg_doc_length:
+            return cached[1]
+        k1, b = self.k1, self.b
+        norms = {doc_id: k1 * (1 - b + b * length / avg_doc_length) for doc_id, length in self.doc_lengths.items()}
+        self._global_norms = (avg_doc_length, norms)
+        return norms
+
+    def get_postings(self, term: str) -> List[Tuple[int, int]]:
+        """获取词项的倒排列表"""
+        return self.postings.get(term, [])
+
+    @classmethod
+    def merge(cls, segments: Sequence["InvertedIndex"]) -> "InvertedIndex":
+        """合并多个段为一个新段（各段记录ID区间按顺序递增，倒排列表直接拼接即保持有序）"""
+        merged = cls(k1=segments[0].k1, b=segments[0].b) if segments else cls()
+        for segment in segments:
+            for term, postings in segment.postings.items():
+                merged.postings[term].extend(postings)
+            merged.doc_lengths.update(segment.doc_lengths)
+            merged.doc_count += segment.doc_count
+        merged.finalize()
+        return merged
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+
+class _PostingCursor:
+    """跨段遍历一个词项的倒排列表（各段记录ID区间递增，顺序拼接即整体有序）
+    doc_id 为当前记录ID，遍历结束时为无穷大"""
+
+    __slots__ = ("lists", "order", "segment", "position", "weight", "upper_bound", "doc_id")
+
+    def __init__(self, lists: List[Tuple[List[Tuple[int, int]], Dict[int, float]]], order: int,
+                 weight: float, upper_bound: float):
+        self.lists = lists
+        self.order = order
+        self.segment = 0
+        self.position = 0
+        self.weight = weight
+        self.upper_bound = upper_bound
+        self.doc_id = lists[0][0][0][0]
+
+    def current(self) -> Tuple[int, float]:
+        """当前记录的 (词频, 长度归一项)"""
+        postings, norms = self.lists[self.segment]
+        return postings[self.position][1], norms[self.doc_id]
+
+    def _update(self):
+        if self.segment < len(self.lists):
+            self.doc_id = self.lists[self.segment][0][self.position][0]
+        else:
+            self.doc_id = math.inf
+
+    def next(self):
+        self.position += 1
+        if self.position >= len(self.lists[self.segment][0]):
+            self.segment += 1
+            self.position = 0
+        self._update()
+
+    def seek(self, target: int):
+        """前进到第一个记录ID >= target 的位置：整段跳过末尾小于target的段，段内二分查找"""
+        if self.doc_id >= target:
+            return
+        while self.segment < len(self.lists):
+            postings = self.lists[self.segment][0]
+            if postings[-1][0] >= target:
+                self.position = bisect.bisect_left(postings, (target,), self.position)
+                break
+            self.segment += 1
+            self.position = 0
+        self._update()
+
+
+class _Snapshot(NamedTuple):
+    """索引快照：段列表与全局统计量，整体替换以保证查询读到一致的状态；
+    idf 为按全局文档频率计算的词项IDF，查询时按需填入，随快照一起失效"""
+    segments: Tuple[InvertedIndex, ...]
+    doc_count: int
+    total_length: int
+    idf: Dict[str, float]
+
+    @property
+    def avg_doc_length(self) -> float:
+        if not self.doc_count:
+            return 1.0
+        return self.total_length / self.doc_count or 1.0
+
+    def term_idf(self, term: str) -> Optional[float]:
+        """词项的全局IDF（任何段都不包含该词项时返回None）"""
+        idf = self.idf.get(term)
+        if idf is None:
+            doc_freq = sum(len(segment.get_postings(term)) for segment in self.segments)
+            if not doc_freq:
+                return None
+            idf = math.log(1 + (self.doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            self.idf[term] = idf
+        return idf
+
+
+class SegmentedIndex:
+    """分段索引：不可变的基础段 + 追加的增量段，BM25统计量在各段之间全局计算"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, merge_threshold: int = 4):
+        self.k1 = k1
+        self.b = b
+        self.merge_threshold = merge_threshold
+        self._snapshot = _Snapshot((), 0, 0, {})
+        self._write_lock = threading.Lock()
+        self._merge_thread = None
+
+    @staticmethod
+    def _make_snapshot(segments: Sequence[InvertedIndex]) -> _Snapshot:
+        return _Snapshot(
+            tuple(segments),
+            sum(segment.doc_count for segment in segments),
+            sum(sum(segment.doc_lengths.values()) for segment in segments),
+            {}
+        )
+
+    @property
+    def segments(self) -> Tuple[InvertedIndex, ...]:
+        return self._snapshot.segments
+
+    def set_base(self, segment: InvertedIndex):
+        """设置基础段（替换全部已有段）"""
+        with self._write_lock:
+            self._snapshot = self._make_snapshot([segment])
+
+    def add_segment(self, segment: InvertedIndex):
+        """追加一个增量段，超过阈值时启动后台合并"""
+        with self._write_lock:
+            self._snapshot = self._make_snapshot(self._snapshot.segments + (segment,))
+            if len(self._snapshot.segments) - 1 >= self.merge_threshold and not self.is_merging():
+                self._merge_thread = threading.Thread(target=self._merge_segments, daemon=True)
+                self._merge_thread.start()
+
+    def is_merging(self) -> bool:
+        return self._merge_thread is not None and self._merge_thread.is_alive()
+
+    def _merge_segments(self):
+        """后台合并：基于开始时的快照构建新段，完成后原子替换，合并期间追加的增量段保留"""
+        merging = self._snapshot.segments
+        try:
+            merged = InvertedIndex.merge(merging)
+        except Exception as e:
+            logger.error(f"合并索引段失败: {e}")
+            return
+        with self._write_lock:
+            remaining = self._snapshot.segments[len(merging):]
+            self._snapshot = self._make_snapshot((merged,) + remaining)
+        logger.info(f"索引段合并完成，合并{len(merging)}个段，共{merged.doc_count}条记录")
+
+    def wait_for_merge(self, timeout: float = None):
+        """等待后台合并完成"""
+        if self._merge_thread is not None:
+            self._merge_thread.join(timeout)
+
+    def matching_documents(self, terms: Iterable[str]) -> List[int]:
+        """包含全部词项的记录ID（升序），从文档频率最低的词项开始求交集"""
+        segments = self._snapshot.segments
+        postings = sorted(
+            ([doc_id for segment in segments for doc_id, _ in segment.get_postings(term)] for term in set(terms)),
+            key=len
+        )
+        if not postings:
+            return []
+        matched = set(postings[0])
+        for doc_ids in postings[1:]:
+            if not matched:
+                break
+            matched.intersection_update(doc_ids)
+        return sorted(matched)
+
+    @staticmethod
+    def _upper_bound(term: str, snapshot: _Snapshot, avg_doc_length: float) -> float:
+        """词项BM25词频项在全部段中的上界：各段预计算的最大值按段内与全局平均长度之比放大
+        （全局平均长度为段内的 1/r 倍时，长度归一项至少缩小为 r 倍，词频项至多放大 1/r 倍）"""
+        bound = 0.0
+        for segment in snapshot.segments:
+            max_score = segment.max_scores.get(term)
+            if max_score is not None:
+                ratio = min(1.0, segment.avg_doc_length / avg_doc_length)
+                bound = max(bound, max_score / ratio)
+        return bound
+
+    def search(self, terms: Iterable[str], top_k: int = 5,
+               doc_filter: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """BM25检索（MaxScore动态剪枝），排序与穷举打分（search_many）相同，得分在浮点舍入误差内相等"""
+        snapshot = self._snapshot
+        if not snapshot.doc_count or top_k <= 0:
+            return []
+        avg_doc_length = snapshot.avg_doc_length
+        k1_plus_1 = self.k1 + 1
+
+        cursors: List[_PostingCursor] = []
+        for order, (term, query_tf) in enumerate(Counter(terms).items()):
+            idf = snapshot.term_idf(term)
+            if idf is None:
+                continue
+            lists = [(segment.get_postings(term), segment.norms_for(avg_doc_length))
+                     for segment in snapshot.segments if segment.get_postings(term)]
+            weight = query_tf * idf
+            cursors.append(_PostingCursor(lists, order, weight, weight * self._upper_bound(term, snapshot, avg_doc_length)))
+        if not cursors:
+            return []
+
+        # 按上界升序排列，prefix_bounds[i] 为前 i 个词项的上界之和
+        cursors.sort(key=lambda cursor: cursor.upper_bound)
+        prefix_bounds = [0.0]
+        for cursor in cursors:
+            prefix_bounds.append(prefix_bounds[-1] + cursor.upper_bound)
+
+        heap: List[Tuple[float, int]] = []  # (得分, -记录ID) 的小顶堆
+        threshold = -math.inf
+        essential = 0  # cursors[essential:] 为必要词项
+        essential_cursors = cursors
+        while True:
+            doc_id = min([cursor.doc_id for cursor in essential_cursors])
+            if doc_id == math.inf:
+                break
+
+            contributions: List[Tuple[int, float]] = []
+            score = 0.0
+            for cursor in essential_cursors:
+                if cursor.doc_id == doc_id:
+                    tf, norm = cursor.current()
+                    weight = cursor.weight * tf * k1_plus_1 / (tf + norm)
+                    contributions.append((cursor.order, weight))
+                    score += weight
+                    cursor.next()
+            # 非必要词项按上界从大到小补分，剩余上界不足以超过阈值时提前放弃该记录
+            pruned = False
+            for i in range(essential - 1, -1, -1):
+                if score + prefix_bounds[i + 1] <= threshold:
+                    pruned = True
+                    break
+                cursor = cursors[i]
+                cursor.seek(doc_id)
+                if cursor.doc_id == doc_id:
+                    tf, norm = cursor.current()
+                    weight = cursor.weight * tf * k1_plus_1 / (tf + norm)
+                    contributions.append((cursor.order, weight))
+                    score += weight
+
+            if pruned or (doc_filter is not None and not doc_filter(doc_id)):
+                continue
+            # 按查询词项顺序重新累加，不受剪枝时补分顺序的影响（同一查询的得分与访问顺序无关）
+            score = 0.0
+            for _, weight in sorted(contributions):
+                score += weight
+            entry = (score, -doc_id)
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            else:
+                continue
+            if len(heap) == top_k:
+                threshold = heap[0][0]
+                # 上界之和不超过阈值的词项单独出现的记录不可能进入top_k（同分时ID更大者排后），降为非必要词项
+                while essential < len(cursors) and prefix_bounds[essential + 1] <= threshold:
+                    essential += 1
+                    essential_cursors = cursors[essential:]
+                if essential == len(cursors):
+                    break
+
+        return [(-neg_doc_id, score) for score, neg_doc_id in sorted(heap, reverse=True)]
+
+    def search_many(self, term_lists: Sequence[Iterable[str]], top_k: int = 5,
+                    doc_filter: Optional[Callable[[int], bool]] = None) -> List[List[Tuple[int, float]]]:
+        """批量BM25检索：各词项在每个段中的倒排列表只遍历一次，IDF与平均长度取全部段的全局值；
+        doc_filter 用于在选取top_k前排除不需要的记录；按词项累加得分，与 search 的得分可能在末位浮点数字上不同"""
+        snapshot = self._snapshot
+        scores: List[Dict[int, float]] = [defaultdict(float) for _ in term_lists]
+        if not snapshot.doc_count:
+            return [[] for _ in term_lists]
+
+        term_queries: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for query_id, terms in enumerate(term_lists):
+            for term, query_tf in Counter(terms).items():
+                term_queries[term].append((query_id, query_tf))
+
+        avg_doc_length = snapshot.avg_doc_length
+        k1_plus_1 = self.k1 + 1
+        for term, queries in term_queries.items():
+            idf = snapshot.term_idf(term)
+            if idf is None:
+                continue
+            for segment in snapshot.segments:
+                norms = segment.norms_for(avg_doc_length)
+                for doc_id, tf in segment.get_postings(term):
+                    weight = idf * tf * k1_plus_1 / (tf + norms[doc_id])
+                    for query_id, query_tf in queries:
+                        scores[query_id][doc_id] += query_tf * weight
+
+        return [
+            heapq.nlargest(top_k, (item for item in query_scores.items() if doc_filter is None or doc_filter(item[0])),
+                           key=lambda item: (item[1], -item[0]))
+            for query_scores in scores
+        ]
+
+    def __len__(self) -> int:
+        return self._snapshot.doc_count
@@ -0,0 +1,482 @@
+"""
+大模型客户端 - DeepSeek 与 Qwen 共用的连接池化HTTP客户端
+每个服务商一个 requests.Session（keep-alive 连接池，认证头只构建一次），
+一次解卦触发的多次调用复用同一条TLS连接；请求体与响应解析按服务商的接口格式
+（OpenAI兼容格式 / DashScope格式）统一处理，并统计请求数、新建连接数与连接复用率；
+异步调用在线程池中执行同步请求，不阻塞事件循环；
+gather_answers 并发询问多个服务商，按策略（最先返回 / 截止前最长 / 合并）选取回答并取消其余请求；
+可取消的调用（传入 cancel，gather_answers 与 hedged_chat 的请求均如此）一律走SSE流式接口，
+以便取消时关闭连接、让服务端停止生成，非流式请求在服务端生成完毕前无法中断；
+hedged_chat 先请求首选服务商，超过其近期p90延迟仍未得到合格回答时再向备用服务商发出对冲请求，先到者胜；
+stream_chat 以SSE流式接收生成内容，逐段产出增量文本，界面可边生成边显示；
+调用方传入 use_cache 时，成功的回答写入持久化回答缓存（见 response_cache），相同提示词再次请求时直接返回；
+只应对确定性的内容（如卦象解读）启用，依赖实时数据的提示词不缓存
+"""
+
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .api_config import APIConfig
+from .response_cache import ResponseCache, fingerprint, get_response_cache
+
+logger = logging.getLogger(__name__)
+
+# 接口格式
+OPENAI_STYLE = "openai"
+DASHSCOPE_STYLE = "dashscope"
+
+# 多服务商回答的选取策略：最先返回的回答 / 截止时间前最长的回答 / 合并全部回答
+ANSWER_POLICIES = ("first", "longest", "merge")
+
+# 对冲请求：近期成功请求的延迟样本数、估计p90所需的最少样本数，样本不足时的默认对冲延迟与延迟下限（秒）
+LATENCY_WINDOW = 50
+MIN_LATENCY_SAMPLES = 5
+DEFAULT_HEDGE_DELAY = 4.0
+MIN_HEDGE_DELAY = 0.5
+
+
+@dataclass
+class ProviderConfig:
+    """服务商配置"""
+    name: str
+    api_url: str
+    api_key: str
+    model: str
+    style: str = OPENAI_STYLE
+    timeout: float = 15.0
+    pool_size: int = 10
+
+
+def provider_configs() -> Dict[str, ProviderConfig]:
+    """各服务商的默认配置（密钥与地址来自 APIConfig）"""
+    deepseek = APIConfig.get_deepseek_config()
+    qwen = APIConfig.get_qwen_config()
+    return {
+        "deepseek": ProviderConfig("deepseek", deepseek["api_url"], deepseek["api_key"], "deepseek-chat", OPENAI_STYLE),
+        "qwen": ProviderConfig("qwen", qwen["api_url"], qwen["api_key"], "qwen-turbo", DASHSCOPE_STYLE),
+    }
+
+
+def build_messages(system: str, user: str) -> List[Dict[str, str]]:
+    """系统提示词 + 用户消息"""
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+
+class LLMClient:
+    """单个服务商的连接池化客户端"""
+
+    def __init__(self, config: ProviderConfig, cache: Optional[ResponseCache] = None):
+        self.config = config
+        self.cache = cache
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.pool_size)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {config.api_key}",
+            "Content-Type": "application/json",
+        })
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._cancelled = 0
+        self._seconds = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def build_payload(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                      stream: bool = False) -> Dict[str, Any]:
+        """按服务商接口格式构建请求体（stream 为真时请求SSE增量输出）"""
+        if self.config.style == DASHSCOPE_STYLE:
+            parameters = {"temperature": temperature, "max_tokens": max_tokens}
+            if stream:
+                parameters["incremental_output"] = True
+            return {
+                "model": self.config.model,
+                "input": {"messages": messages},
+                "parameters": parameters,
+            }
+        payload = {
+            "model": self.config.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def parse_response(self, result: Dict[str, Any]) -> Optional[str]:
+        """从响应中取出生成的文本"""
+        if self.config.style == DASHSCOPE_STYLE:
+            output = result.get("output", {})
+            if output.get("choices"):
+                return output["choices"][0]["message"]["content"]
+            return output.get("text")
+        if result.get("choices"):
+            return result["choices"][0]["message"]["content"]
+        return None
+
+    def parse_delta(self, event: Dict[str, Any]) -> str:
+        """从一条SSE事件中取出增量文本"""
+        if self.config.style == DASHSCOPE_STYLE:
+            output = event.get("output", {})
+            if output.get("choices"):
+                return output["choices"][0].get("message", {}).get("content") or ""
+            return output.get("text") or ""
+        if event.get("choices"):
+            return event["choices"][0].get("delta", {}).get("content") or ""
+        return ""
+
+    def _was_cancelled(self, cancel: Optional[threading.Event]) -> bool:
+        if cancel is None or not cancel.is_set():
+            return False
+        with self._lock:
+            self._cancelled += 1
+        return True
+
+    def _cache_key(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        return fingerprint(f"{self.config.name}/{self.config.model}", messages, temperature, max_tokens)
+
+    def cached(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Optional[str]:
+        """缓存中相同提示词的回答（未启用缓存或未命中时返回None）"""
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(messages, temperature, max_tokens))
+
+    def _store(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int, text: Optional[str],
+               ttl: Optional[float] = None):
+        if self.cache is not None and text:
+            self.cache.set(self._cache_key(messages, temperature, max_tokens), self.config.model, text, ttl)
+
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 800,
+             timeout: Optional[float] = None, cancel: Optional[threading.Event] = None,
+             use_cache: bool = False, ttl: Optional[float] = None) -> Optional[str]:
+        """发送对话请求并返回生成的文本；网络错误、超时与非2xx状态码以 requests 异常抛出。
+        传入 cancel 时总是改用SSE流式接口（见 stream_chat），即使调用方不需要增量输出：cancel 被置位后不再发送请求，
+        在途请求在收到下一段数据时关闭连接、服务端随之停止生成，均返回None；
+        use_cache 为真时先查回答缓存，成功的回答写入缓存（ttl 为过期时间，默认使用缓存的设置）"""
+        if self._was_cancelled(cancel):
+            return None
+        if cancel is not None:
+            text = "".join(self.stream_chat(messages, temperature, max_tokens, timeout, cancel, use_cache, ttl))
+            return None if cancel.is_set() else (text or None)
+        if use_cache:
+            text = self.cached(messages, temperature, max_tokens)
+            if text:
+                return text
+        payload = self.build_payload(messages, temperature, max_tokens)
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.config.api_url, json=payload, timeout=timeout or self.config.timeout)
+            response.raise_for_status()
+            text = self.parse_response(response.json())
+            with self._lock:
+                self._latencies.append(time.perf_counter() - start)
+            if use_cache:
+                self._store(messages, temperature, max_tokens, text, ttl)
+            return text
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._requests += 1
+                self._seconds += time.perf_counter() - start
+
+    def stream_chat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 800,
+                    timeout: Optional[float] = None, cancel: Optional[threading.Event] = None,
+                    use_cache: bool = False, ttl: Optional[float] = None) -> Iterator[str]:
+        """流式对话请求：逐段产出增量文本（timeout 为相邻两段数据之间的最长等待）；
+        错误以 requests 异常抛出，cancel 被置位时关闭连接并结束；缓存命中时一次产出完整回答"""
+        if self._was_cancelled(cancel):
+            return
+        if use_cache:
+            text = self.cached(messages, temperature, max_tokens)
+            if text:
+                yield text
+                return
+        payload = self.build_payload(messages, temperature, max_tokens, stream=True)
+        headers = {"Accept": "text/event-stream"}
+        if self.config.style == DASHSCOPE_STYLE:
+            headers["X-DashScope-SSE"] = "enable"
+        start = time.perf_counter()
+        completed = False
+        parts = []
+        try:
+            with self.session.post(self.config.api_url, json=payload, headers=headers,
+                                   timeout=timeout or self.config.timeout, stream=True) as response:
+                response.raise_for_status()
+                response.encoding = "utf-8"
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if self._was_cancelled(cancel):
+                        return
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = self.parse_delta(json.loads(data))
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            completed = True
+            if use_cache:
+                self._store(messages, temperature, max_tokens, "".join(parts), ttl)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._requests += 1
+                self._seconds += time.perf_counter() - start
+                if completed:
+                    self._latencies.append(time.perf_counter() - start)
+
+    async def achat(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 800,
+                    timeout: Optional[float] = None) -> Optional[str]:
+        """异步对话请求（在线程池中执行，连接池与同步调用共享）"""
+        return await asyncio.to_thread(self.chat, messages, temperature, max_tokens, timeout)
+
+    def latency_percentile(self, q: float = 0.9) -> Optional[float]:
+        """近期成功请求延迟的分位数（样本不足时返回None）"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def hedge_delay(self) -> float:
+        """发出对冲请求前等待的时间：近期p90延迟，样本不足时用默认值"""
+        p90 = self.latency_percentile(0.9)
+        return max(p90 if p90 is not None else DEFAULT_HEDGE_DELAY, MIN_HEDGE_DELAY)
+
+    def _opened_connections(self) -> int:
+        # urllib3 连接池记录了新建连接数（num_connections）
+        pools = self.adapter.poolmanager.pools
+        return sum(getattr(pools[key], "num_connections", 0) for key in pools.keys())
+
+    def metrics(self) -> Dict[str, Any]:
+        """请求数、新建连接数、复用的请求数与复用率、错误数、平均耗时"""
+        with self._lock:
+            requests_sent, errors, cancelled, seconds = self._requests, self._errors, self._cancelled, self._seconds
+        opened = self._opened_connections()
+        reused = max(requests_sent - opened, 0)
+        return {
+            "provider": self.config.name,
+            "requests": requests_sent,
+            "connections_opened": opened,
+            "connections_reused": reused,
+            "reuse_ratio": reused / requests_sent if requests_sent else 0.0,
+            "errors": errors,
+            "cancelled": cancelled,
+            "avg_seconds": seconds / requests_sent if requests_sent else 0.0,
+            "p90_seconds": self.latency_percentile(0.9),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_clients: Dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider: str) -> LLMClient:
+    """获取进程内共享的服务商客户端（首次调用时创建连接池）"""
+    with _clients_lock:
+        client = _clients.get(provider)
+        if client is None:
+            configs = provider_configs()
+            if provider not in configs:
+                raise ValueError(f"未知的大模型服务商: {provider}，可选: {', '.join(configs)}")
+            client = LLMClient(configs[provider], cache=get_response_cache())
+            _clients[provider] = client
+        return client
+
+
+def chat(provider: str, system: str, user: str, temperature: float = 0.7, max_tokens: int = 800,
+         timeout: Optional[float] = None, cancel: Optional[threading.Event] = None,
+         use_cache: bool = False, ttl: Optional[float] = None) -> Optional[str]:
+    """便捷调用：系统提示词 + 用户消息（use_cache 为真时读写回答缓存）"""
+    return get_client(provider).chat(build_messages(system, user), temperature, max_tokens, timeout, cancel,
+                                     use_cache, ttl)
+
+
+async def achat(provider: str, system: str, user: str, temperature: float = 0.7, max_tokens: int = 800,
+                timeout: Optional[float] = None) -> Optional[str]:
+    """便捷调用的异步版本"""
+    return await get_client(provider).achat(build_messages(system, user), temperature, max_tokens, timeout)
+
+
+def gather_answers(calls: Dict[str, Callable[[threading.Event], Optional[str]]], policy: str = "first",
+                   deadline: float = 15.0) -> List[Tuple[str, str]]:
+    """并发执行各服务商的调用（calls: 名称 -> 接收取消事件、返回回答的函数），按策略选取非空回答：
+    first 取最先返回的一个；longest 在截止时间前等待全部返回后取最长的一个；merge 返回截止前的全部回答（按 calls 顺序）。
+    策略确定后置位其余调用的取消事件并立即返回，不等待未完成的请求（调用把取消事件传给 LLMClient.chat 时，
+    请求走SSE流式接口，在途请求在收到下一段数据时关闭连接）；返回 [(名称, 回答)]，全部失败时为空列表"""
+    if policy not in ANSWER_POLICIES:
+        raise ValueError(f"未知的选取策略: {policy}，可选: {', '.join(ANSWER_POLICIES)}")
+    if not calls:
+        return []
+    cancels = {name: threading.Event() for name in calls}
+    executor = ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="llm-gather")
+    futures = {executor.submit(call, cancels[name]): name for name, call in calls.items()}
+    answers: Dict[str, str] = {}
+    pending = set(futures)
+    end = time.monotonic() + deadline
+    try:
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    logger.warning(f"{name} 调用失败: {e}")
+                    continue
+                if answer:
+                    answers[name] = answer
+            if policy == "first" and answers:
+                break
+    finally:
+        for name, cancel in cancels.items():
+            if name not in answers:
+                cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    if pending:
+        logger.info(f"未在{deadline}秒内返回的调用已取消: {', '.join(futures[future] for future in pending)}")
+    ordered = [(name, answers[name]) for name in calls if name in answers]
+    if policy == "first":
+        # 同一轮完成的多个回答按 calls 顺序取第一个
+        return ordered[:1]
+    if policy == "longest":
+        return [max(ordered, key=lambda item: len(item[1]))] if ordered else []
+    return ordered
+
+
+def hedged_chat(providers: Sequence[str], system: str, user: str, temperature: float = 0.7, max_tokens: int = 800,
+                timeout: Optional[float] = None, hedge_delay: Optional[float] = None,
+                accept: Optional[Callable[[str], bool]] = None, use_cache: bool = False,
+                ttl: Optional[float] = None) -> Tuple[Optional[str], Optional[str]]:
+    """对冲请求：按 providers 顺序先请求第一个服务商，等待 hedge_delay 秒（默认为该服务商近期p90延迟）
+    仍无合格回答、或在途请求都已失败时，立即向下一个服务商发出请求；第一个合格回答（accept 为真，默认非空）胜出，
+    其余请求取消且不等待（各请求都带取消事件，因此总是走SSE流式接口，见 LLMClient.chat）；
+    use_cache 为真时各服务商读写回答缓存。返回 (服务商, 回答)，全部失败时为 (None, None)"""
+    accept = accept or bool
+    messages = build_messages(system, user)
+    clients = [get_client(provider) for provider in providers]
+    if not clients:
+        return None, None
+    request_timeout = timeout or clients[0].config.timeout
+    cancels = [threading.Event() for _ in clients]
+    executor = ThreadPoolExecutor(max_workers=len(clients), thread_name_prefix="llm-hedge")
+    futures: Dict[Any, int] = {}
+    pending = set()
+    winner: Tuple[Optional[str], Optional[str]] = (None, None)
+
+    def launch(index: int):
+        client = clients[index]
+        future = executor.submit(client.chat, messages, temperature, max_tokens, request_timeout, cancels[index],
+                                 use_cache, ttl)
+        futures[future] = index
+        pending.add(future)
+
+    try:
+        launch(0)
+        next_index = 1
+        while pending:
+            if next_index < len(clients):
+                delay = hedge_delay if hedge_delay is not None else clients[next_index - 1].hedge_delay()
+                done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            else:
+                done, _ = wait(pending, timeout=request_timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+            for future in done:
+                pending.discard(future)
+                index = futures[future]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    logger.warning(f"{providers[index]} 调用失败: {e}")
+                    continue
+                if text and accept(text):
+                    winner = (providers[index], text)
+                    break
+            if winner[0] is not None:
+                break
+            # 超过对冲延迟仍无结果，或在途请求全部失败：向下一个服务商发出请求
+            if next_index < len(clients) and (not done or not pending):
+                if done:
+                    logger.info(f"{providers[next_index - 1]} 未返回合格回答，改用 {providers[next_index]}")
+                else:
+                    logger.info(f"{providers[next_index - 1]} 超过对冲延迟，向 {providers[next_index]} 发出对冲请求")
+                launch(next_index)
+                next_index += 1
+    finally:
+        for index, cancel in enumerate(cancels):
+            if providers[index] != winner[0]:
+                cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return winner
+
+
+def stream_chat(provider: str, system: str, user: str, temperature: float = 0.7, max_tokens: int = 800,
+                timeout: Optional[float] = None, cancel: Optional[threading.Event] = None,
+                use_cache: bool = False, ttl: Optional[float] = None) -> Iterator[str]:
+    """便捷调用的流式版本：逐段产出增量文本"""
+    return get_client(provider).stream_chat(build_messages(system, user), temperature, max_tokens, timeout, cancel,
+                                            use_cache, ttl)
+
+
+def stream_with_fallback(providers: Sequence[str], system: str, user: str,
+                         on_text: Optional[Callable[[str], None]] = None, temperature: float = 0.7,
+                         max_tokens: int = 800, timeout: Optional[float] = None, use_cache: bool = False,
+                         ttl: Optional[float] = None) -> Tuple[Optional[str], str]:
+    """按 providers 顺序流式请求，每收到一段增量即以累计文本回调 on_text；
+    某个服务商出错时改用下一个并从头生成（已收到的部分丢弃）。返回 (服务商, 完整文本)，全部失败时为 (None, "")"""
+    for provider in providers:
+        text = ""
+        try:
+            for delta in stream_chat(provider, system, user, temperature, max_tokens, timeout,
+                                     use_cache=use_cache, ttl=ttl):
+                text += delta
+                if on_text:
+                    on_text(text)
+        except Exception as e:
+            logger.warning(f"{provider} 流式调用失败: {e}")
+            continue
+        if text:
+            return provider, text
+    return None, ""
+
+
+def cache_metrics() -> Optional[Dict[str, Any]]:
+    """回答缓存的命中统计（缓存不可用时返回None）"""
+    cache = get_response_cache()
+    return cache.metrics() if cache is not None else None
+
+
+def client_metrics() -> List[Dict[str, Any]]:
+    """全部已创建客户端的连接复用统计"""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return [client.metrics() for client in clients]
@@ -0,0 +1,130 @@
+"""
+近重复段落折叠 - 建索引前用 MinHash + LSH 找出相似度超过阈值的段落
+每个段落按字符n-gram切分为shingle集合，用多组哈希函数取最小值得到MinHash签名，
+签名分段（band）后相同分段落入同一桶即成为候选，再用签名估计的Jaccard相似度确认；
+同一簇只保留最先出现的段落作为代表，其余段落ID记入代表的回溯列表
+"""
+
+import re
+import zlib
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 2^61 - 1，MinHash 线性哈希 (a * x + b) mod p 使用的梅森素数
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """选择 (分段数, 每段行数)，使LSH的候选概率曲线拐点 (1/b)^(1/r) 最接近阈值"""
+    best = (num_perm, 1)
+    best_gap = float('inf')
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        gap = abs((1 / bands) ** (1 / rows) - threshold)
+        if gap < best_gap:
+            best, best_gap = (bands, rows), gap
+    return best
+
+
+class MinHashDeduplicator:
+    """MinHash + LSH 近重复检测，支持增量加入（热加载的新段落与已有代表比较）"""
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Jaccard阈值需在(0, 1]之间: {threshold}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        # 每个分段一张桶表：分段签名字节 -> 代表键列表
+        self._buckets: List[Dict[bytes, List[Any]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[Any, np.ndarray] = {}
+        self._representatives: Dict[Any, Dict[str, Any]] = {}
+
+    def shingles(self, text: str) -> np.ndarray:
+        """字符n-gram的crc32哈希集合（空白合并后切分，短文本整体作为一个shingle）"""
+        text = _WHITESPACE_PATTERN.sub(' ', text or '').strip()
+        if len(text) <= self.shingle_size:
+            grams = {text} if text else set()
+        else:
+            grams = {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+        return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """计算MinHash签名，空文本返回None（不参与去重）"""
+        hashes = self.shingles(text)
+        if not len(hashes):
+            return None
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def find_duplicate(self, signature: np.ndarray) -> Optional[Any]:
+        """查找估计Jaccard相似度不低于阈值的已有代表，返回相似度最高者的键"""
+        candidates = set()
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(band.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def add(self, key: Any, signature: np.ndarray):
+        """将签名登记为一个簇的代表"""
+        self._signatures[key] = signature
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(band_key, []).append(key)
+
+    def deduplicate(self, items: Sequence[Dict[str, Any]], get_text: Callable[[Dict[str, Any]], str],
+                    key: str = 'id') -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """按顺序折叠近重复条目：返回 (保留的代表, 被折叠ID -> 代表ID)，
+        代表条目的 duplicates 字段记录被折叠条目的ID"""
+        kept: List[Dict[str, Any]] = []
+        collapsed: Dict[str, Any] = {}
+        for item in items:
+            signature = self.signature(get_text(item))
+            if signature is None:
+                kept.append(item)
+                continue
+            duplicate_of = self.find_duplicate(signature)
+            if duplicate_of is None:
+                self.add(item[key], signature)
+                self._representatives[item[key]] = item
+                kept.append(item)
+                continue
+            self._representatives[duplicate_of].setdefault('duplicates', []).append(item[key])
+            collapsed[item[key]] = duplicate_of
+        return kept, collapsed
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+def dedup_stats(total: int, kept: int, collapsed: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """语料收缩统计"""
+    return {
+        "passages": total,
+        "kept": kept,
+        "collapsed": len(collapsed),
+        "clusters": len(set(collapsed.values())),
+        "shrink_ratio": len(collapsed) / total if total else 0.0,
+        "threshold": threshold,
+    }
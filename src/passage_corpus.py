@@ -0,0 +1,631 @@
+"""
+统一段落语料库 - 将知识库的全部来源切分为段落，建立一份进程内共享的检索索引
+来源包括：清理后的JSONL知识库、问答集JSON、各书籍的处理结果（按句切分为约300字的段落），
+以及各系统在代码中维护的结构化知识（注册后展平为段落）
+每个段落有稳定的ID（如 jsonl:0003、qa:六爻古籍经典合集:6、book:京氏易传-汉-京房:0012），
+并携带来源类型与书名元数据；RAG问答、增强解卦、智能问答共用同一份语料和索引，
+加载与建立索引在每个进程中只执行一次；建索引前用 MinHash 折叠近重复段落，
+被折叠的段落ID仍可通过 get() 取到其代表段落；精确原文查找使用全部段落文本上的后缀数组，
+多词查询可按 AND/OR 组合在倒排索引上求交/并；入库时标注段落提到的卦名、经卦与爻位，
+按卦查段落是实体倒排表上的一次字典查找
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .knowledge_index import InvertedIndex, SegmentedIndex, tokenize, tokenize_query
+from .kb_store import open_compiled, source_fingerprint
+from .gua_entities import EntityIndex, build_entity_index, tag_text
+from .near_dedup import MinHashDeduplicator, dedup_stats
+from .startup_report import timed
+from .suffix_array import SuffixArray
+
+logger = logging.getLogger(__name__)
+
+JSONL_FILE = "complete_knowledge_base_cleaned.jsonl"
+QA_SUFFIX = "_qa.json"
+BOOK_SUFFIX = "_processed.json"
+
+# 书籍段落的目标长度（字）
+PASSAGE_LENGTH = 300
+# 近重复折叠的默认Jaccard阈值
+DEDUP_THRESHOLD = 0.8
+# 后缀数组之后追加的段落超过该数量时重建后缀数组（之前的增量段落逐个核对原文）
+SUFFIX_REBUILD_DELTA = 256
+
+# 布尔词项检索的组合方式
+MATCH_MODES = ('and', 'or')
+
+# 句末标点之后切分，标点保留在句尾
+_SENTENCE_PATTERN = re.compile(r'[^。！？；!?;\n]*[。！？；!?;\n]?')
+_TITLE_STRIP = "《》 "
+
+# 引文查询：引号包裹的原文，或不含疑问词的纯中文句子
+_QUOTE_PAIRS = {'"': '"', '“': '”', '「': '」', '『': '』', "'": "'", '‘': '’'}
+_QUOTE_BODY_PATTERN = re.compile(r'^[\u4e00-\u9fff\u3400-\u4dbf，。；：、！,;:!]+$')
+_CLAUSE_PATTERN = re.compile(r'[，。；：、！？,;:!?\s]+')
+_QUESTION_MARKERS = ('吗', '呢', '什么', '如何', '怎么', '怎样', '为何', '为什么', '哪', '请', '解释', '含义', '意思', '?', '？')
+
+
+def resolve_knowledge_base_dir() -> Optional[str]:
+    """查找知识库目录：项目根目录、上一级目录、当前工作目录"""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for path in (os.path.join(base_dir, "knowledge_base"),
+                 os.path.join(os.path.dirname(base_dir), "knowledge_base"),
+                 "knowledge_base"):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def chunk_text(text: str, max_length: int = PASSAGE_LENGTH) -> List[str]:
+    """按句切分文本并拼接为不超过max_length字的段落，超长的单句按长度硬切"""
+    chunks: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_PATTERN.findall(text or ''):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current and len(current) + len(sentence) > max_length:
+            chunks.append(current)
+            current = ""
+        while len(sentence) > max_length:
+            chunks.append(sentence[:max_length])
+            sentence = sentence[max_length:]
+        current += sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _title(filename: str, suffix: str) -> str:
+    """由文件名得到书名：去掉后缀和书名号，合并多余空白"""
+    return " ".join(filename[:-len(suffix)].strip(_TITLE_STRIP).split())
+
+
+def extract_quote(query: str) -> Optional[str]:
+    """识别引文式查询（如“天行健，君子以自强不息”、潜龙勿用），返回去掉引号的原文，否则返回None"""
+    text = (query or '').strip()
+    if len(text) >= 2 and _QUOTE_PAIRS.get(text[0]) == text[-1]:
+        inner = text[1:-1].strip()
+        return inner or None
+    if len(text) >= 4 and _QUOTE_BODY_PATTERN.match(text) and not any(m in text for m in _QUESTION_MARKERS):
+        return text
+    return None
+
+
+def passage_text(passage: Dict[str, Any]) -> str:
+    """段落的检索文本：问题（如有）+ 正文"""
+    question = passage.get('question', '')
+    return f"{question} {passage['text']}" if question else passage['text']
+
+
+def _read_records(path: str, kind: str) -> Any:
+    """读取知识库文件，优先使用新鲜的编译产物（python -m src.kb_store 生成）：
+    编译产物返回按需解码的 LazyRecord，建段落时只从映射内存解码用到的字段（书籍只解码正文，不解码原文与译文），
+    映射由记录对象持有，记录全部释放后随存储对象关闭"""
+    store = open_compiled(path)
+    if store is not None:
+        if kind == 'jsonl':
+            return list(store)
+        if kind == 'qa':
+            return dict(store.extra(), qa_pairs=list(store))
+        return store[0]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        if kind == 'jsonl':
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def jsonl_passage(record: Dict[str, Any], line_number: int) -> Dict[str, Any]:
+    """JSONL知识库的一行 -> 段落（记录自带的id并不唯一，段落ID取行号）"""
+    return {
+        'id': f"jsonl:{line_number:04d}",
+        'source': 'jsonl',
+        'book': '',
+        'question': record.get('question', ''),
+        'answer': record.get('answer', ''),
+        'text': record.get('source_text', '') or record.get('answer', ''),
+        'source_text': record.get('source_text', ''),
+        'segment_index': record.get('segment_index', 0),
+        'record_id': record.get('id', ''),
+    }
+
+
+def jsonl_passages(path: str) -> List[Dict[str, Any]]:
+    """JSONL知识库的全部段落"""
+    return [jsonl_passage(record, i) for i, record in enumerate(_read_records(path, 'jsonl'))]
+
+
+def qa_passages(path: str) -> List[Dict[str, Any]]:
+    """问答集JSON：每个问答对一个段落"""
+    data = _read_records(path, 'qa')
+    title = _title(os.path.basename(path), QA_SUFFIX)
+    book = data.get('metadata', {}).get('source', '') or f"《{title}》"
+    passages = []
+    for i, qa_pair in enumerate(data.get('qa_pairs', [])):
+        passages.append({
+            'id': f"qa:{title}:{qa_pair.get('id', i)}",
+            'source': 'qa',
+            'book': qa_pair.get('source', '') or book,
+            'question': qa_pair.get('question', ''),
+            'answer': qa_pair.get('answer', ''),
+            'text': qa_pair.get('answer', ''),
+            'category': qa_pair.get('category', ''),
+        })
+    return passages
+
+
+def book_passages(path: str, max_length: int = PASSAGE_LENGTH) -> List[Dict[str, Any]]:
+    """书籍处理结果：正文按句切分为段落"""
+    data = _read_records(path, 'book')
+    title = _title(os.path.basename(path), BOOK_SUFFIX)
+    text = data.get('processed_text', '') or data.get('raw_text', '')
+    return [
+        {
+            'id': f"book:{title}:{i:04d}",
+            'source': 'book',
+            'book': f"《{title}》",
+            'text': chunk,
+            'segment_index': i,
+        }
+        for i, chunk in enumerate(chunk_text(text, max_length))
+    ]
+
+
+def flatten_knowledge(name: str, data: Dict[str, Any], path: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+    """将嵌套的结构化知识（如风水、解梦词典）展平为段落：
+    值全为文本的字典作为一个条目，段落ID为 名称:路径"""
+    passages = []
+    leaves = {key: value for key, value in data.items() if isinstance(value, (str, list))}
+    if leaves and path:
+        parts = [f"{key}：{'、'.join(value) if isinstance(value, list) else value}" for key, value in leaves.items()]
+        passages.append({
+            'id': f"{name}:{'/'.join(path)}",
+            'source': name,
+            'book': '',
+            'question': " ".join(path),
+            'text': "\n".join(parts),
+            'path': "/".join(path),
+        })
+    for key, value in data.items():
+        if isinstance(value, dict):
+            passages.extend(flatten_knowledge(name, value, path + (key,)))
+    return passages
+
+
+class PassageCorpus:
+    """统一段落语料库：全部来源的段落 + 分段倒排索引，文件有追加或新增时增量入库
+    dedup_threshold 为近重复折叠的Jaccard阈值，设为None时不折叠"""
+
+    def __init__(self, knowledge_base_dir: str, reload_interval: float = 5.0,
+                 passage_length: int = PASSAGE_LENGTH, dedup_threshold: Optional[float] = DEDUP_THRESHOLD):
+        self.knowledge_base_dir = knowledge_base_dir
+        self.reload_interval = reload_interval
+        self.passage_length = passage_length
+        self.dedup_threshold = dedup_threshold
+        self.passages: List[Dict[str, Any]] = []
+        self.positions: Dict[str, int] = {}
+        self.index = SegmentedIndex()
+        # 卦名/经卦/爻位 -> 段落ID（入库时标注）
+        self.entities = EntityIndex()
+        self.version = 0
+        # 整体重建的次数，用于判断派生结构（后缀数组）是否仍对应当前段落列表
+        self._generation = 0
+
+        # 近重复折叠：被折叠的段落ID -> 代表段落ID
+        self.deduplicator: Optional[MinHashDeduplicator] = None
+        self.collapsed: Dict[str, str] = {}
+
+        # 精确原文查找的后缀数组：(构建时的段落列表, 后缀数组)，首次查找时构建，整体重建后失效
+        self._suffix_state: Optional[Tuple[List[Dict[str, Any]], SuffixArray]] = None
+        self._suffix_lock = threading.Lock()
+
+        # 代码中注册的结构化知识：名称 -> 段落，整体重建时一并保留
+        self._registered: Dict[str, List[Dict[str, Any]]] = {}
+        # 热加载状态：JSONL已读取的字节数与记录数（非空行数，即下一条记录的行号）、其他源文件的 (大小, 修改时间)
+        self._jsonl_offset = 0
+        self._jsonl_records = 0
+        self._file_states: Dict[str, Tuple[int, int]] = {}
+        self._last_reload_check = time.monotonic()
+        self._lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+
+        self.load()
+
+    @property
+    def jsonl_path(self) -> str:
+        return os.path.join(self.knowledge_base_dir, JSONL_FILE)
+
+    def source_files(self) -> List[str]:
+        """全部源文件（问答集与书籍，按文件名排序，保证段落顺序稳定）"""
+        if not os.path.isdir(self.knowledge_base_dir):
+            return []
+        return [
+            os.path.join(self.knowledge_base_dir, filename)
+            for filename in sorted(os.listdir(self.knowledge_base_dir))
+            if filename.endswith((QA_SUFFIX, BOOK_SUFFIX))
+        ]
+
+    @staticmethod
+    def _file_state(path: str) -> Tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def fingerprint(self) -> str:
+        """全部源文件的指纹，供持久化的派生索引判断是否过期"""
+        return source_fingerprint([self.jsonl_path] + self.source_files())
+
+    def _file_passages(self, path: str) -> List[Dict[str, Any]]:
+        if path.endswith(QA_SUFFIX):
+            return qa_passages(path)
+        return book_passages(path, self.passage_length)
+
+    def _load_sources(self) -> Tuple[List[Dict[str, Any]], int, int, Dict[str, Tuple[int, int]]]:
+        """读取全部源文件，返回 (段落, JSONL已读字节数, JSONL记录数, 文件状态)"""
+        passages: List[Dict[str, Any]] = []
+        jsonl_offset = 0
+        jsonl_records = 0
+        if os.path.exists(self.jsonl_path):
+            jsonl_offset = os.path.getsize(self.jsonl_path)
+            try:
+                passages.extend(jsonl_passages(self.jsonl_path))
+                jsonl_records = len(passages)
+            except Exception as e:
+                logger.error(f"加载JSONL知识库失败: {e}")
+
+        file_states = {}
+        for path in self.source_files():
+            try:
+                file_states[path] = self._file_state(path)
+                passages.extend(self._file_passages(path))
+            except Exception as e:
+                logger.error(f"加载知识库文件失败 {os.path.basename(path)}: {e}")
+
+        for registered in self._registered.values():
+            passages.extend(registered)
+        return passages, jsonl_offset, jsonl_records, file_states
+
+    def load(self):
+        """加载全部来源并建立基础索引段"""
+        start = time.perf_counter()
+        passages, jsonl_offset, jsonl_records, file_states = self._load_sources()
+        passages = self._unique(passages, set())
+        deduplicator = MinHashDeduplicator(self.dedup_threshold) if self.dedup_threshold else None
+        collapsed: Dict[str, str] = {}
+        if deduplicator is not None:
+            passages, collapsed = deduplicator.deduplicate(passages, passage_text)
+        segment = self._build_segment(passages, 0)
+        index = SegmentedIndex()
+        index.set_base(segment)
+        entities = build_entity_index(self._tag_passages(passages))
+
+        with self._lock:
+            self.passages = passages
+            self.positions = {passage['id']: i for i, passage in enumerate(passages)}
+            self.positions.update((passage_id, self.positions[rep]) for passage_id, rep in collapsed.items())
+            self.deduplicator = deduplicator
+            self.collapsed = collapsed
+            self.index = index
+            self.entities = entities
+            self._suffix_state = None
+            self._generation += 1
+            self._jsonl_offset = jsonl_offset
+            self._jsonl_records = jsonl_records
+            self._file_states = file_states
+            self.version += 1
+
+        counts = Counter(passage['source'] for passage in passages)
+        logger.info(f"段落语料库加载完成，共{len(passages)}个段落 {dict(counts)}，"
+                    f"{len(segment.postings)}个词项，耗时{time.perf_counter() - start:.2f}秒")
+        if deduplicator is not None:
+            stats = self.dedup_stats()
+            logger.info(f"近重复折叠：{stats['passages']}个段落折叠为{stats['kept']}个，"
+                        f"{stats['clusters']}个重复簇，语料收缩{stats['shrink_ratio']:.1%}")
+
+    def dedup_stats(self) -> Dict[str, Any]:
+        """近重复折叠统计：原始段落数、保留数、折叠数、重复簇数与收缩比例"""
+        return dedup_stats(len(self.passages) + len(self.collapsed), len(self.passages),
+                           self.collapsed, self.dedup_threshold)
+
+    @staticmethod
+    def _unique(passages: Iterable[Dict[str, Any]], seen: set) -> List[Dict[str, Any]]:
+        """按段落ID去重，保留首次出现的段落"""
+        unique = []
+        for passage in passages:
+            if passage['id'] not in seen:
+                seen.add(passage['id'])
+                unique.append(passage)
+        return unique
+
+    @staticmethod
+    def _tag_passages(passages: Sequence[Dict[str, Any]]) -> Sequence[Dict[str, Any]]:
+        """标注段落提到的卦名、经卦与爻位（写入 entities 字段）"""
+        for passage in passages:
+            passage['entities'] = tag_text(passage_text(passage))
+        return passages
+
+    @staticmethod
+    def _build_segment(passages: Sequence[Dict[str, Any]], start_id: int) -> InvertedIndex:
+        segment = InvertedIndex()
+        for offset, passage in enumerate(passages):
+            segment.add_text(start_id + offset, passage_text(passage))
+        segment.finalize()
+        return segment
+
+    def add_passages(self, passages: Sequence[Dict[str, Any]]) -> int:
+        """追加段落（已存在的ID跳过，与已有段落近重复的折叠到其代表），
+        作为增量段立即可检索，返回实际新增的段落数"""
+        with self._lock:
+            new_passages = self._unique(passages, set(self.positions))
+            collapsed: Dict[str, str] = {}
+            if self.deduplicator is not None:
+                new_passages, collapsed = self.deduplicator.deduplicate(new_passages, passage_text)
+            if new_passages:
+                start_id = len(self.passages)
+                segment = self._build_segment(new_passages, start_id)
+                # 先追加段落再发布索引段，查询读到的记录ID总在段落列表范围内
+                self.passages = self.passages + new_passages
+                for offset, passage in enumerate(new_passages):
+                    self.positions[passage['id']] = start_id + offset
+                self.index.add_segment(segment)
+                for passage in self._tag_passages(new_passages):
+                    self.entities.add(passage['id'], passage['entities'])
+            for passage_id, rep in collapsed.items():
+                self.positions[passage_id] = self.positions[rep]
+            self.collapsed.update(collapsed)
+            if not new_passages:
+                return 0
+            self.version += 1
+        logger.info(f"新增{len(new_passages)}个段落，当前共{len(self.passages)}个")
+        return len(new_passages)
+
+    def register_knowledge(self, name: str, data: Dict[str, Any]) -> int:
+        """注册代码中维护的结构化知识，展平为段落后入库（同名只注册一次）"""
+        if name in self._registered:
+            return 0
+        passages = flatten_knowledge(name, data)
+        self._registered[name] = passages
+        return self.add_passages(passages)
+
+    def check_for_updates(self):
+        """按间隔检查源文件，有追加或新增内容时在后台线程入库，不阻塞当前查询"""
+        now = time.monotonic()
+        if now - self._last_reload_check < self.reload_interval:
+            return
+        self._last_reload_check = now
+        if self._reload_thread is not None and self._reload_thread.is_alive():
+            return
+        if self._has_changes():
+            self._reload_thread = threading.Thread(target=self._ingest_updates, daemon=True)
+            self._reload_thread.start()
+
+    def _has_changes(self) -> bool:
+        try:
+            jsonl_size = os.path.getsize(self.jsonl_path) if os.path.exists(self.jsonl_path) else 0
+            states = {path: self._file_state(path) for path in self.source_files()}
+        except OSError:
+            return False
+        return jsonl_size != self._jsonl_offset or states != self._file_states
+
+    def _ingest_updates(self):
+        """读取JSONL新追加的行和新增的源文件；已有文件被改写或删除时整体重建"""
+        try:
+            states = {path: self._file_state(path) for path in self.source_files()}
+            if any(path not in states or states[path] != state for path, state in self._file_states.items()):
+                self._reload_all()
+                return
+
+            passages: List[Dict[str, Any]] = []
+            jsonl_offset = self._jsonl_offset
+            jsonl_records = self._jsonl_records
+            if os.path.exists(self.jsonl_path):
+                size = os.path.getsize(self.jsonl_path)
+                if size < jsonl_offset:
+                    self._reload_all()
+                    return
+                with open(self.jsonl_path, 'rb') as f:
+                    f.seek(jsonl_offset)
+                    chunk = f.read(size - jsonl_offset)
+                # 只处理完整的行，写入中的最后一行留待下次读取；与 jsonl_passages 一样只为非空行编号
+                complete = chunk[:chunk.rfind(b'\n') + 1]
+                lines = [line for line in complete.decode('utf-8').splitlines() if line.strip()]
+                passages.extend(jsonl_passage(json.loads(line), jsonl_records + i) for i, line in enumerate(lines))
+                jsonl_offset += len(complete)
+                jsonl_records += len(lines)
+
+            for path in states:
+                if path not in self._file_states:
+                    passages.extend(self._file_passages(path))
+
+            self.add_passages(passages)
+            self._jsonl_offset = jsonl_offset
+            self._jsonl_records = jsonl_records
+            self._file_states = states
+        except Exception as e:
+            logger.error(f"热加载知识库失败: {e}")
+
+    def _reload_all(self):
+        """重新加载全部来源，构建完成后整体替换，期间查询继续使用旧索引"""
+        self.load()
+        logger.info(f"知识库文件已改写，重新加载完成，共{len(self.passages)}个段落")
+
+    def _source_filter(self, sources: Optional[Sequence[str]]) -> Optional[Callable[[int], bool]]:
+        if not sources:
+            return None
+        passages = self.passages
+        allowed = set(sources)
+        return lambda doc_id: doc_id < len(passages) and passages[doc_id]['source'] in allowed
+
+    def search(self, query: str, top_k: int = 5,
+               sources: Optional[Sequence[str]] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """BM25检索，返回 (段落, 得分)；sources 限定来源类型（如 ['qa', 'book']）"""
+        return self.search_many([query], top_k, sources)[0]
+
+    def search_many(self, queries: Sequence[str], top_k: int = 5,
+                    sources: Optional[Sequence[str]] = None) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """批量BM25检索（单条查询走MaxScore剪枝，多条查询合并遍历倒排列表）"""
+        self.check_for_updates()
+        passages = self.passages
+        doc_filter = self._source_filter(sources)
+        if len(queries) == 1:
+            batch_hits = [self.index.search(tokenize_query(queries[0]), top_k, doc_filter=doc_filter)]
+        else:
+            batch_hits = self.index.search_many([tokenize_query(query) for query in queries], top_k,
+                                                doc_filter=doc_filter)
+        return [
+            [(passages[doc_id], score) for doc_id, score in hits if doc_id < len(passages)]
+            for hits in batch_hits
+        ]
+
+    def suffix_array(self) -> Tuple[List[Dict[str, Any]], SuffixArray]:
+        """取得后缀数组及其覆盖的段落列表；尚未构建、语料整体重建或增量过多时重新构建"""
+        with self._suffix_lock:
+            state = self._suffix_state
+            if state is None or len(self.passages) - len(state[0]) > SUFFIX_REBUILD_DELTA:
+                generation, passages = self._generation, self.passages
+                state = (passages, SuffixArray([passage_text(passage) for passage in passages]))
+                with self._lock:
+                    # 构建期间语料被整体重建时不保存，下次查找重新构建
+                    if generation == self._generation:
+                        self._suffix_state = state
+            return state
+
+    def find_occurrences(self, phrase: str, limit: Optional[int] = None,
+                         sources: Optional[Sequence[str]] = None) -> List[Tuple[Dict[str, Any], int]]:
+        """精确短语查找：后缀数组二分定位全部出现位置，返回 (段落, 检索文本内的首次出现偏移)，按段落顺序排列；
+        后缀数组构建之后追加的段落逐个核对原文"""
+        self.check_for_updates()
+        indexed, suffix_array = self.suffix_array()
+        hits = [(indexed[doc], offset) for doc, offset in suffix_array.first_occurrences(phrase)]
+        for passage in self.passages[len(indexed):]:
+            offset = passage_text(passage).find(phrase)
+            if offset >= 0:
+                hits.append((passage, offset))
+
+        if sources:
+            allowed = set(sources)
+            hits = [hit for hit in hits if hit[0]['source'] in allowed]
+        return hits[:limit] if limit is not None else hits
+
+    def find(self, phrase: str, limit: Optional[int] = None,
+             sources: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """精确子串查找，返回包含短语的段落（按段落顺序）"""
+        return [passage for passage, _ in self.find_occurrences(phrase, limit, sources)]
+
+    def find_quote(self, quote: str, limit: Optional[int] = None,
+                   sources: Optional[Sequence[str]] = None) -> List[Tuple[Dict[str, Any], int]]:
+        """引文查找：先整句精确匹配；找不到时按标点切分为分句，返回包含全部分句的段落
+        （偏移为第一个分句的位置），以容忍古籍版本间的标点差异"""
+        hits = self.find_occurrences(quote, limit, sources)
+        if hits:
+            return hits
+        clauses = [clause for clause in _CLAUSE_PATTERN.split(quote) if len(clause) >= 2]
+        if len(clauses) < 2:
+            return []
+        matched: Optional[Dict[str, Tuple[Dict[str, Any], int]]] = None
+        for clause in sorted(clauses, key=len, reverse=True):
+            clause_hits = {passage['id']: (passage, offset) for passage, offset in self.find_occurrences(clause, None, sources)}
+            if matched is None:
+                matched = clause_hits
+            else:
+                matched = {pid: matched[pid] for pid in matched if pid in clause_hits}
+            if not matched:
+                return []
+        first_clause = clauses[0]
+        hits = [(passage, passage_text(passage).find(first_clause)) for passage, _ in matched.values()]
+        hits.sort(key=lambda hit: self.positions.get(hit[0]['id'], 0))
+        return hits[:limit] if limit is not None else hits
+
+    def _word_documents(self, word: str, passages: List[Dict[str, Any]],
+                        doc_filter: Optional[Callable[[int], bool]]) -> set:
+        """包含某个词的段落序号：倒排列表求交得到候选（多字词用二字组），再核对原文"""
+        terms = [term for term in tokenize(word) if len(term) > 1] or tokenize(word)
+        if not terms:
+            return set()
+        return {
+            doc_id for doc_id in self.index.matching_documents(terms)
+            if doc_id < len(passages) and (doc_filter is None or doc_filter(doc_id))
+            and word in passage_text(passages[doc_id])
+        }
+
+    def match_terms(self, query: str, limit: Optional[int] = None, sources: Optional[Sequence[str]] = None,
+                    mode: str = 'and') -> List[Tuple[Dict[str, Any], float]]:
+        """布尔词项检索：查询按空白切分为词，'and' 要求段落包含全部词，'or' 包含任一词，
+        命中段落按BM25得分排序，返回 (段落, 得分)"""
+        if mode not in MATCH_MODES:
+            raise ValueError(f"未知的组合方式: {mode}，可选: {', '.join(MATCH_MODES)}")
+        self.check_for_updates()
+        passages = self.passages
+        doc_filter = self._source_filter(sources)
+        # 长词的候选更少，先求交可尽早得到空集
+        words = sorted(set(query.split()), key=len, reverse=True)
+        matched: Optional[set] = None
+        for word in words:
+            doc_ids = self._word_documents(word, passages, doc_filter)
+            if matched is None:
+                matched = doc_ids
+            elif mode == 'and':
+                matched &= doc_ids
+            else:
+                matched |= doc_ids
+            if mode == 'and' and not matched:
+                return []
+        if not matched:
+            return []
+        top_k = min(limit, len(matched)) if limit is not None else len(matched)
+        hits = self.index.search(tokenize(query), top_k, doc_filter=matched.__contains__)
+        return [(passages[doc_id], score) for doc_id, score in hits]
+
+    def passages_about(self, gua: Optional[str] = None, line: Optional[str] = None, trigram: Optional[str] = None,
+                       limit: Optional[int] = None, sources: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """按实体查段落：同时提到给定卦名（如"屯卦"）、爻位（如"初九"）、经卦（如"坎"）的段落，按入库顺序"""
+        self.check_for_updates()
+        allowed = set(sources) if sources else None
+        passages = []
+        for passage_id in self.entities.query(gua=gua, line=line, trigram=trigram):
+            passage = self.get(passage_id)
+            if passage is None or (allowed is not None and passage['source'] not in allowed):
+                continue
+            passages.append(passage)
+            if limit is not None and len(passages) >= limit:
+                break
+        return passages
+
+    def get(self, passage_id: str) -> Optional[Dict[str, Any]]:
+        """按段落ID获取段落（被折叠的ID返回其代表段落）"""
+        position = self.positions.get(passage_id)
+        return self.passages[position] if position is not None else None
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+
+_shared_corpora: Dict[str, PassageCorpus] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_corpus(knowledge_base_dir: Optional[str] = None, reload_interval: float = 5.0) -> PassageCorpus:
+    """获取进程内共享的段落语料库（同一知识库目录只加载一次，各系统共用）"""
+    knowledge_base_dir = knowledge_base_dir or resolve_knowledge_base_dir() or "knowledge_base"
+    key = os.path.abspath(knowledge_base_dir)
+    with _shared_lock:
+        corpus = _shared_corpora.get(key)
+        if corpus is None:
+            with timed("段落语料库"):
+                corpus = PassageCorpus(knowledge_base_dir, reload_interval=reload_interval)
+            _shared_corpora[key] = corpus
+        return corpus
+
+
+def clear_shared_corpora():
+    """清空进程内共享的语料库（基准测试需要在干净状态下测量加载开销）"""
+    with _shared_lock:
+        _shared_corpora.clear()
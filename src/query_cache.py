@@ -0,0 +1,147 @@
+"""
+检索结果缓存 - 有容量上限的 LRU + TTL 缓存
+以规范化后的问题文本、top_k 和语料库版本为键，知识库目录下文件的指纹（大小 + 修改时间）变化时自动失效，
+语料库在内存中新增段落（版本号递增）后旧条目不再命中，由LRU淘汰；
+并记录命中/未命中次数，便于评估缓存容量
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# 检索构建产物，不参与指纹计算（生成它们不应使缓存失效）
+_GENERATED_DIRS = {"compiled"}
+_GENERATED_SUFFIXES = (".npz", ".tmp")
+
+_PUNCTUATION_PATTERN = re.compile(r'[？?！!。，,、；;：:"“”\'‘’（）()《》【】]+')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def knowledge_base_fingerprint(knowledge_base_dir: str) -> str:
+    """计算知识库目录下全部源文件的指纹"""
+    entries = []
+    if knowledge_base_dir and os.path.isdir(knowledge_base_dir):
+        for root, dirs, files in os.walk(knowledge_base_dir):
+            dirs[:] = sorted(d for d in dirs if d not in _GENERATED_DIRS)
+            for filename in sorted(files):
+                if filename.endswith(_GENERATED_SUFFIXES):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append(f"{os.path.relpath(path, knowledge_base_dir)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.md5("\n".join(entries).encode('utf-8')).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本：全半角统一、英文小写、去除标点、合并空白"""
+    text = unicodedata.normalize('NFKC', question or '').lower()
+    text = _PUNCTUATION_PATTERN.sub('', text)
+    return _WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+class QueryCache:
+    """线程安全的 LRU + TTL 缓存，知识库指纹变化时整体清空"""
+
+    def __init__(self, max_size: int = 256, ttl: float = 3600.0,
+                 fingerprint_func: Optional[Callable[[], str]] = None,
+                 check_interval: float = 5.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fingerprint_func = fingerprint_func
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = fingerprint_func() if fingerprint_func else None
+        self._last_check = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(question: str, top_k: int, version: int = 0) -> Tuple[str, int, int]:
+        """缓存键：规范化问题文本 + top_k + 语料库版本（PassageCorpus.version）"""
+        return normalize_question(question), top_k, version
+
+    def _check_fingerprint(self):
+        """按间隔检查知识库指纹，变化时清空缓存（调用方需持有锁）"""
+        if self.fingerprint_func is None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        fingerprint = self.fingerprint_func()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，未命中或已过期时返回None"""
+        with self._lock:
+            self._check_fingerprint()
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_shared_caches: Dict[Tuple[str, str], QueryCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_query_cache(name: str, knowledge_base_dir: str, max_size: int = 256, ttl: float = 3600.0) -> QueryCache:
+    """获取进程内共享的缓存（同一知识库目录的多个系统实例共用，重复创建实例时缓存不丢失）"""
+    key = (name, os.path.abspath(knowledge_base_dir or ''))
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = QueryCache(max_size=max_size, ttl=ttl,
+                               fingerprint_func=lambda: knowledge_base_fingerprint(knowledge_base_dir))
+            _shared_caches[key] = cache
+        return cache
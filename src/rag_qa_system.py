@@ -5,10 +5,15 @@ RAG问答系统 - 基于周易理论的智能问答
 
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
-import json
 import os
 from datetime import datetime
 import logging
+import threading
+
+from .knowledge_index import SegmentedIndex
+from .vector_retrieval import SparseVectorIndex
+from .passage_corpus import PassageCorpus, extract_quote, get_shared_corpus, jsonl_passage, passage_text
+from .query_cache import get_query_cache
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -59,109 +64,209 @@ class AnswerWithRAGContextStringPrompt:
 class RAGKnowledgeBase:
     """RAG知识库管理器"""
     
-    def __init__(self, knowledge_base_path: str = "knowledge_base"):
+    # 检索模式：bm25 为倒排索引，tfidf 为预计算的稀疏向量矩阵
+    RETRIEVAL_MODES = ("bm25", "tfidf")
+    # 只检索周易知识库的段落（共享语料库中还有智能问答注册的风水、解梦、日常知识）
+    KNOWLEDGE_SOURCES = ('jsonl', 'qa', 'book')
+    VECTOR_INDEX_FILE = "tfidf_index.npz"
+    
+    def __init__(self, knowledge_base_path: str = "knowledge_base", retrieval_mode: str = "bm25",
+                 reload_interval: float = 5.0):
+        if retrieval_mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索模式: {retrieval_mode}")
         self.knowledge_base_path = knowledge_base_path
-        self.knowledge_data = []
+        self.retrieval_mode = retrieval_mode
+        self.reload_interval = reload_interval
+        self.corpus: Optional[PassageCorpus] = None
+        self.vector_index: Optional[SparseVectorIndex] = None
+        self._vector_version = 0
+        self._vector_thread: Optional[threading.Thread] = None
+        
         self.load_knowledge_base()
     
+    @property
+    def knowledge_data(self) -> List[Dict]:
+        """统一语料库中的全部段落"""
+        return self.corpus.passages if self.corpus is not None else []
+    
+    @property
+    def version(self) -> int:
+        """语料库版本：文件热加载、追加段落或注册结构化知识后递增"""
+        return self.corpus.version if self.corpus is not None else 0
+    
+    @property
+    def index(self) -> SegmentedIndex:
+        """统一语料库的共享倒排索引"""
+        return self.corpus.index if self.corpus is not None else SegmentedIndex()
+    
     def load_knowledge_base(self):
-        """加载知识库数据"""
+        """加载知识库数据：使用进程内共享的段落语料库（JSONL、问答集、书籍），只在首次使用时加载和建索引"""
         try:
-            # 加载清理后的知识库
-            cleaned_file = os.path.join(self.knowledge_base_path, "complete_knowledge_base_cleaned.jsonl")
-            if os.path.exists(cleaned_file):
-                with open(cleaned_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if line.strip():
-                            self.knowledge_data.append(json.loads(line))
-                logger.info(f"成功加载知识库，共{len(self.knowledge_data)}条记录")
-            else:
-                logger.warning("未找到清理后的知识库文件")
+            if not os.path.isdir(self.knowledge_base_path):
+                logger.warning("未找到知识库目录")
+                return
+            self.corpus = get_shared_corpus(self.knowledge_base_path, self.reload_interval)
+            logger.info(f"成功加载知识库，共{len(self.corpus)}个段落")
+            if self.retrieval_mode == "tfidf":
+                self.load_vector_index()
         except Exception as e:
             logger.error(f"加载知识库失败: {e}")
     
+    def add_passages(self, records: List[Dict]):
+        """追加JSONL格式的新记录，作为增量段立即可检索（TF-IDF模式下在后台重新编码矩阵）"""
+        if not records or self.corpus is None:
+            return
+        start = len(self.corpus)
+        passages = [dict(jsonl_passage(record, start + i), id=f"added:{start + i:04d}")
+                    for i, record in enumerate(records)]
+        self.corpus.add_passages(passages)
+        self.check_vector_index()
+    
+    def check_for_updates(self):
+        """检查知识库文件的追加与新增（由共享语料库在后台入库）"""
+        if self.corpus is None:
+            return
+        self.corpus.check_for_updates()
+        self.check_vector_index()
+    
+    def load_vector_index(self):
+        """加载知识库目录下的TF-IDF矩阵，源文件或段落数变化时重新编码"""
+        corpus = self.corpus
+        version = corpus.version
+        passages = corpus.passages
+        self.vector_index = SparseVectorIndex.load_or_build(
+            os.path.join(self.knowledge_base_path, self.VECTOR_INDEX_FILE),
+            corpus.fingerprint(),
+            len(passages),
+            lambda: [passage_text(passage) for passage in passages]
+        )
+        self._vector_version = version
+    
+    def check_vector_index(self):
+        """TF-IDF模式下，语料库有新段落时在后台重新编码矩阵，完成前继续使用旧矩阵"""
+        if self.retrieval_mode != "tfidf" or self.corpus.version == self._vector_version:
+            return
+        if self._vector_thread is not None and self._vector_thread.is_alive():
+            return
+        self._vector_thread = threading.Thread(target=self.load_vector_index, daemon=True)
+        self._vector_thread.start()
+    
     def search_relevant_context(self, question: str, top_k: int = 5) -> List[Dict]:
         """搜索相关问题上下文"""
-        relevant_contexts = []
-        
-        # 简单的关键词匹配搜索
-        question_keywords = self.extract_keywords(question)
-        
-        for item in self.knowledge_data:
-            score = self.calculate_relevance_score(question_keywords, item)
-            if score > 0.1:  # 相关性阈值
-                relevant_contexts.append({
-                    'content': item.get('answer', ''),
-                    'source': item.get('source_text', ''),
-                    'score': score,
-                    'segment_index': item.get('segment_index', 0)
-                })
-        
-        # 按相关性排序并返回top_k
-        relevant_contexts.sort(key=lambda x: x['score'], reverse=True)
-        return relevant_contexts[:top_k]
-    
-    def extract_keywords(self, text: str) -> List[str]:
-        """提取关键词"""
-        # 周易相关关键词
-        iching_keywords = [
-            '乾', '坤', '震', '巽', '坎', '离', '艮', '兑',
-            '卦', '爻', '变爻', '世爻', '应爻', '飞神', '伏神',
-            '五行', '阴阳', '八卦', '六十四卦', '京氏易传',
-            '预测', '占卜', '吉凶', '旺衰', '生克'
-        ]
-        
-        keywords = []
-        for keyword in iching_keywords:
-            if keyword in text:
-                keywords.append(keyword)
-        
-        return keywords
+        return self.search_relevant_context_many([question], top_k)[0]
     
-    def calculate_relevance_score(self, question_keywords: List[str], item: Dict) -> float:
-        """计算相关性得分"""
-        score = 0.0
-        content = item.get('answer', '') + ' ' + item.get('source_text', '')
-        
-        for keyword in question_keywords:
-            if keyword in content:
-                score += 1.0
+    def search_relevant_context_many(self, questions: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """批量搜索相关上下文：全部问题一起切分，一次遍历语料为所有问题打分"""
+        if self.corpus is None:
+            return [[] for _ in questions]
+        self.check_for_updates()
+        if self.retrieval_mode == "tfidf" and self.vector_index is not None:
+            # 稀疏矩阵-向量乘法为全部段落打分
+            passages = self.corpus.passages
+            allowed = set(self.KNOWLEDGE_SOURCES)
+            doc_filter = lambda doc_id: doc_id < len(passages) and passages[doc_id]['source'] in allowed
+            batch_hits = [
+                [(passages[doc_id], score) for doc_id, score in hits]
+                for hits in self.vector_index.search_many(questions, top_k, doc_filter=doc_filter)
+            ]
+        else:
+            # 按字的一元/二元组切分问题，BM25排序，只访问倒排列表中包含查询词项的段落
+            batch_hits = self.corpus.search_many(questions, top_k, sources=self.KNOWLEDGE_SOURCES)
+        contexts = [self._format_hits(hits) for hits in batch_hits]
         
-        # 根据关键词密度调整得分
-        if score > 0:
-            score = score / len(question_keywords)
-        
-        return score
+        # 引文式问题（粘贴的原文句子）用后缀数组精确定位，原文所在段落排在最前
+        for i, question in enumerate(questions):
+            quote = extract_quote(question)
+            if quote:
+                contexts[i] = self._merge_exact_hits(self.corpus.find_quote(quote, top_k, self.KNOWLEDGE_SOURCES),
+                                                     contexts[i], top_k)
+        return contexts
+    
+    def _merge_exact_hits(self, exact_hits: List, contexts: List[Dict], top_k: int) -> List[Dict]:
+        """精确命中的段落置前（标记 exact_match 与原文偏移），其余名额由相关性检索结果补足"""
+        if not exact_hits:
+            return contexts
+        scores = {ctx['passage_id']: ctx['score'] for ctx in contexts}
+        merged = []
+        for passage, offset in exact_hits:
+            ctx = self._format_hits([(passage, scores.get(passage['id'], 0.0))])[0]
+            ctx['exact_match'] = True
+            ctx['match_offset'] = offset
+            merged.append(ctx)
+        exact_ids = {ctx['passage_id'] for ctx in merged}
+        merged.extend(ctx for ctx in contexts if ctx['passage_id'] not in exact_ids)
+        return merged[:top_k]
+    
+    def _format_hits(self, hits: List) -> List[Dict]:
+        """将 (段落, 得分) 转换为上下文条目"""
+        return [
+            {
+                'content': passage.get('answer') or passage['text'],
+                'source': passage.get('source_text') or passage['book'] or passage['source'],
+                'score': score,
+                'segment_index': passage.get('segment_index', 0),
+                'passage_id': passage['id'],
+                'book': passage['book']
+            }
+            for passage, score in hits
+        ]
 
 
 class IChingRAGSystem:
     """周易RAG问答系统"""
     
-    def __init__(self, knowledge_base_path: str = "knowledge_base"):
-        self.knowledge_base = RAGKnowledgeBase(knowledge_base_path=knowledge_base_path)
+    def __init__(self, knowledge_base_path: str = "knowledge_base", retrieval_mode: str = "bm25"):
+        self.knowledge_base = RAGKnowledgeBase(knowledge_base_path=knowledge_base_path, retrieval_mode=retrieval_mode)
         self.prompt_template = AnswerWithRAGContextStringPrompt()
+        # 检索结果缓存：进程内共享，知识库文件变化或语料库新增段落时自动失效
+        self.query_cache = get_query_cache(f"rag_{retrieval_mode}", knowledge_base_path)
     
-    def answer_question(self, question: str) -> Dict[str, Any]:
+    def answer_question(self, question: str, top_k: int = 5) -> Dict[str, Any]:
         """回答用户问题"""
         try:
-            # 1. 搜索相关上下文
-            relevant_contexts = self.knowledge_base.search_relevant_context(question)
-            
-            if not relevant_contexts:
-                return self._generate_no_context_answer(question)
+            # 1. 搜索相关上下文（相同问题直接复用缓存的检索结果）
+            cache_key = self.query_cache.make_key(question, top_k, self.knowledge_base.version)
+            relevant_contexts = self.query_cache.get(cache_key)
+            if relevant_contexts is None:
+                relevant_contexts = self.knowledge_base.search_relevant_context(question, top_k)
+                self.query_cache.set(cache_key, relevant_contexts)
             
-            # 2. 构建上下文
-            context_text = self._build_context_text(relevant_contexts)
-            
-            # 3. 生成答案
-            answer = self._generate_answer(question, context_text, relevant_contexts)
-            
-            return answer
+            return self._answer_with_contexts(question, relevant_contexts)
             
         except Exception as e:
             logger.error(f"回答问题失败: {e}")
             return self._generate_error_answer(str(e))
     
+    def answer_questions(self, questions: List[str], top_k: int = 5) -> List[Dict[str, Any]]:
+        """批量回答问题：未命中缓存的问题合并为一次批量检索"""
+        try:
+            version = self.knowledge_base.version
+            cache_keys = [self.query_cache.make_key(question, top_k, version) for question in questions]
+            contexts = [self.query_cache.get(key) for key in cache_keys]
+            
+            pending = [i for i, ctx in enumerate(contexts) if ctx is None]
+            if pending:
+                batch = self.knowledge_base.search_relevant_context_many([questions[i] for i in pending], top_k)
+                for i, relevant_contexts in zip(pending, batch):
+                    contexts[i] = relevant_contexts
+                    self.query_cache.set(cache_keys[i], relevant_contexts)
+        except Exception as e:
+            logger.error(f"批量检索失败: {e}")
+            return [self._generate_error_answer(str(e)) for _ in questions]
+        
+        return [self._answer_with_contexts(question, ctx) for question, ctx in zip(questions, contexts)]
+    
+    def _answer_with_contexts(self, question: str, relevant_contexts: List[Dict]) -> Dict[str, Any]:
+        """基于检索到的上下文生成答案"""
+        if not relevant_contexts:
+            return self._generate_no_context_answer(question)
+        
+        # 2. 构建上下文
+        context_text = self._build_context_text(relevant_contexts)
+        
+        # 3. 生成答案
+        return self._generate_answer(question, context_text, relevant_contexts)
+    
     def _build_context_text(self, contexts: List[Dict]) -> str:
         """构建上下文文本"""
         context_parts = []
@@ -258,12 +363,13 @@ def main():
         "如何结合传统周易和现代预测？"
     ]
     
-    for i, question in enumerate(test_questions, 1):
+    # 批量检索全部示例问题
+    answers = rag_system.answer_questions(test_questions)
+    
+    for i, (question, answer) in enumerate(zip(test_questions, answers), 1):
         print(f"\n问题 {i}: {question}")
         print("-" * 30)
         
-        answer = rag_system.answer_question(question)
-        
         print(f"分步分析: {answer['step_by_step_analysis']}")
         print(f"推理总结: {answer['reasoning_summary']}")
         print(f"最终答案: {answer['final_answer']}")
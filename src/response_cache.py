@@ -0,0 +1,178 @@
+"""
+大模型回答缓存 - 以提示词指纹为键、持久化在 cache/ 下 SQLite 数据库中的回答缓存
+键为 模型 + 对话消息（系统提示词与用户提示词）+ temperature/max_tokens 的 sha256 摘要，
+同一卦象、同一问题重复生成时直接返回已有回答；条目有过期时间，总数超过上限时按最近访问时间淘汰（LRU）。
+数据库使用 WAL 模式与忙等待超时，多个 Streamlit 进程可同时读写；缓存出错只记录日志，不影响调用本身
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache")
+CACHE_FILE = "llm_responses.sqlite3"
+
+# 默认过期时间（秒）与条目数上限
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+# 等待其他进程释放写锁的最长时间（毫秒）
+BUSY_TIMEOUT_MS = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access);
+"""
+
+
+def fingerprint(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """提示词指纹：模型、对话消息与生成参数的 sha256 摘要"""
+    material = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite 回答缓存（每个线程一个连接）"""
+
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path or os.path.join(CACHE_DIR, CACHE_FILE)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0, "errors": 0}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, key: str) -> Optional[str]:
+        """取出未过期的回答并刷新访问时间；不存在或已过期时返回None"""
+        now = time.time()
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT response, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            if row[1] <= now:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._count("expired")
+                self._count("misses")
+                return None
+            connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._count("hits")
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"读取回答缓存失败: {e}")
+            self._count("errors")
+            return None
+
+    def set(self, key: str, model: str, response: str, ttl: Optional[float] = None):
+        """写入回答，超过条目数上限时淘汰最久未访问的条目"""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, now, expires_at, now),
+            )
+            self._count("stores")
+            self._evict(connection)
+        except sqlite3.Error as e:
+            logger.warning(f"写入回答缓存失败: {e}")
+            self._count("errors")
+
+    def _evict(self, connection: sqlite3.Connection):
+        (entries,) = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if entries <= self.max_entries:
+            return
+        cursor = connection.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+            (entries - self.max_entries,),
+        )
+        self._count("evictions", cursor.rowcount)
+
+    def purge_expired(self) -> int:
+        """删除全部过期条目，返回删除数"""
+        try:
+            cursor = self._connection().execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            self._count("expired", cursor.rowcount)
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"清理回答缓存失败: {e}")
+            self._count("errors")
+            return 0
+
+    def clear(self):
+        """清空缓存"""
+        try:
+            self._connection().execute("DELETE FROM responses")
+        except sqlite3.Error as e:
+            logger.warning(f"清空回答缓存失败: {e}")
+            self._count("errors")
+
+    def metrics(self) -> Dict[str, Any]:
+        """本进程的命中、未命中、写入、淘汰次数与命中率，以及数据库中的条目数"""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        try:
+            (entries,) = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()
+        except sqlite3.Error:
+            entries = None
+        counters.update({
+            "lookups": lookups,
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+        })
+        return counters
+
+
+_cache: Optional[ResponseCache] = None
+_cache_unavailable = False
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取进程内共享的回答缓存（数据库无法打开时返回None，调用方不使用缓存）"""
+    global _cache, _cache_unavailable
+    with _cache_lock:
+        if _cache is None and not _cache_unavailable:
+            try:
+                _cache = ResponseCache()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"回答缓存不可用: {e}")
+                _cache_unavailable = True
+        return _cache
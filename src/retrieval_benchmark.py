@@ -0,0 +1,233 @@
+"""
+检索基准测试 - 对知识库的各条检索路径测量延迟、吞吐、召回率与索引内存
+输入为标注好的问题集（问题 -> 期望命中的段落ID），逐条（批量路径按批）执行检索并统计：
+p50/p95/p99 延迟、每秒查询数、recall@k、MRR，以及加载索引期间的内存峰值（tracemalloc），
+结果写为JSON，便于在不同版本之间对比回归
+
+问题集格式（JSON）：
+    {"questions": [{"question": "用九，见群龙无首", "expected": ["book:京氏易传-汉-京房:0000"]}, ...]}
+
+用法：
+    python -m src.retrieval_benchmark                                  # 使用 docs/data/retrieval_questions.json
+    python -m src.retrieval_benchmark --targets rag_bm25 divination --top-k 10 --output output/retrieval_benchmark.json
+"""
+
+import os
+import json
+import time
+import argparse
+import logging
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .passage_corpus import clear_shared_corpora, get_shared_corpus, resolve_knowledge_base_dir
+from .query_cache import get_query_cache
+from .rag_qa_system import RAGKnowledgeBase
+from .enhanced_divination_system import EnhancedDivinationSystem
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUESTIONS = os.path.join("docs", "data", "retrieval_questions.json")
+DEFAULT_OUTPUT = os.path.join("output", "retrieval_benchmark.json")
+
+# 检索函数：(问题, top_k) -> 按排名排列的段落ID
+SearchFunc = Callable[[str, int], List[str]]
+# 批量检索函数：(问题列表, top_k) -> 每个问题按排名排列的段落ID
+BatchSearchFunc = Callable[[List[str], int], List[List[str]]]
+
+# 批量检索路径每批的问题数
+RAG_BATCH_SIZE = 8
+
+
+def _rag_target(retrieval_mode: str) -> Callable[[str], SearchFunc]:
+    def factory(knowledge_base_dir: str) -> SearchFunc:
+        knowledge_base = RAGKnowledgeBase(knowledge_base_dir, retrieval_mode=retrieval_mode)
+        return lambda question, top_k: [
+            ctx['passage_id'] for ctx in knowledge_base.search_relevant_context(question, top_k)
+        ]
+    return factory
+
+
+def _rag_batch_target(knowledge_base_dir: str) -> BatchSearchFunc:
+    """批量检索路径（问题按 RAG_BATCH_SIZE 条一批合并遍历）"""
+    knowledge_base = RAGKnowledgeBase(knowledge_base_dir)
+    return lambda questions, top_k: [
+        [ctx['passage_id'] for ctx in contexts]
+        for contexts in knowledge_base.search_relevant_context_many(questions, top_k)
+    ]
+
+
+def _divination_target(knowledge_base_dir: str) -> SearchFunc:
+    """增强解卦系统的知识检索（每次查询前清空结果缓存，测量的是未命中缓存的检索）"""
+    system = EnhancedDivinationSystem()
+    cache = get_query_cache("divination", system.knowledge_base_dir or knowledge_base_dir)
+
+    def search(question: str, top_k: int) -> List[str]:
+        cache.clear()
+        return [result['passage_id'] for result in system.search_knowledge(question, top_k)]
+    return search
+
+
+def _exact_target(knowledge_base_dir: str) -> SearchFunc:
+    """统一语料库的后缀数组精确查找"""
+    corpus = get_shared_corpus(knowledge_base_dir)
+    return lambda question, top_k: [passage['id'] for passage in corpus.find(question, top_k)]
+
+
+# 可测试的检索路径，新的索引模式在此登记即可参与对比
+TARGETS: Dict[str, Callable[[str], Any]] = {
+    "rag_bm25": _rag_target("bm25"),
+    "rag_tfidf": _rag_target("tfidf"),
+    "rag_batch": _rag_batch_target,
+    "divination": _divination_target,
+    "exact_phrase": _exact_target,
+}
+
+# 以批量方式调用的检索路径（返回 BatchSearchFunc）及其批大小
+BATCH_SIZES: Dict[str, int] = {
+    "rag_batch": RAG_BATCH_SIZE,
+}
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """读取标注问题集，兼容顶层为列表或 {"questions": [...]} 两种格式"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    questions = data.get('questions', []) if isinstance(data, dict) else data
+    return [item for item in questions if item.get('question') and item.get('expected')]
+
+
+def evaluate_rankings(rankings: Sequence[List[str]], expected: Sequence[Sequence[str]], k: int) -> Dict[str, float]:
+    """计算 recall@k 与 MRR（期望ID中第一个出现在结果中的排名的倒数）"""
+    recalls, reciprocal_ranks = [], []
+    for ranked, relevant in zip(rankings, expected):
+        relevant = set(relevant)
+        top = ranked[:k]
+        recalls.append(len(relevant.intersection(top)) / len(relevant))
+        rank = next((i for i, passage_id in enumerate(top, 1) if passage_id in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    return {
+        "recall_at_k": float(np.mean(recalls)) if recalls else 0.0,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+    }
+
+
+def latency_summary(latencies: Sequence[float]) -> Dict[str, float]:
+    """延迟分位数（毫秒）"""
+    values = np.asarray(latencies) * 1000
+    if not len(values):
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99),
+            "mean": float(values.mean()), "max": float(values.max())}
+
+
+def benchmark_target(name: str, questions: List[Dict[str, Any]], knowledge_base_dir: str,
+                     top_k: int = 5, repeat: int = 1, warmup: int = 1) -> Dict[str, Any]:
+    """对单条检索路径执行基准测试：冷启动加载（记录内存峰值）-> 预热 -> 逐条计时；
+    批量路径按批计时，每条问题的延迟为批次耗时除以批内问题数"""
+    clear_shared_corpora()
+    tracemalloc.start()
+    start = time.perf_counter()
+    search = TARGETS[name](knowledge_base_dir)
+    load_seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 期望ID可能已被近重复折叠，统一换算为代表段落的ID
+    corpus = get_shared_corpus(knowledge_base_dir)
+    expected = [
+        [(corpus.get(passage_id) or {'id': passage_id})['id'] for passage_id in item['expected']]
+        for item in questions
+    ]
+
+    batch_size = BATCH_SIZES.get(name, 1)
+    texts = [item['question'] for item in questions]
+    if batch_size > 1:
+        if warmup:
+            search(texts[:batch_size], top_k)
+    else:
+        for text in texts[:warmup]:
+            search(text, top_k)
+
+    latencies: List[float] = []
+    rankings: List[List[str]] = []
+    total_start = time.perf_counter()
+    for _ in range(repeat):
+        rankings = []
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i:i + batch_size]
+            query_start = time.perf_counter()
+            ranked = search(batch, top_k) if batch_size > 1 else [search(batch[0], top_k)]
+            elapsed = time.perf_counter() - query_start
+            latencies.extend([elapsed / len(batch)] * len(batch))
+            rankings.extend(ranked)
+    total_seconds = time.perf_counter() - total_start
+
+    result = {
+        "latency_ms": latency_summary(latencies),
+        "qps": len(latencies) / total_seconds if total_seconds > 0 else 0.0,
+        "batch_size": batch_size,
+        "load_seconds": load_seconds,
+        "index_memory_mb": current / 1024 / 1024,
+        "peak_memory_mb": peak / 1024 / 1024,
+        "passages": len(corpus),
+    }
+    result.update(evaluate_rankings(rankings, expected, top_k))
+    return result
+
+
+def run_benchmark(questions_path: str = DEFAULT_QUESTIONS, targets: Optional[Sequence[str]] = None,
+                  top_k: int = 5, repeat: int = 1, knowledge_base_dir: Optional[str] = None) -> Dict[str, Any]:
+    """运行全部（或指定）检索路径的基准测试"""
+    knowledge_base_dir = knowledge_base_dir or resolve_knowledge_base_dir() or "knowledge_base"
+    questions = load_questions(questions_path)
+    results = {}
+    for name in targets or TARGETS:
+        if name not in TARGETS:
+            raise ValueError(f"未知的检索路径: {name}，可选: {', '.join(TARGETS)}")
+        logger.info(f"基准测试: {name}")
+        results[name] = benchmark_target(name, questions, knowledge_base_dir, top_k, repeat)
+    return {
+        "created_at": datetime.now().isoformat(),
+        "question_set": questions_path,
+        "questions": len(questions),
+        "top_k": top_k,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def main():
+    """主函数 - 运行检索基准测试并写出JSON结果"""
+    parser = argparse.ArgumentParser(description="知识库检索基准测试")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="标注问题集JSON")
+    parser.add_argument("--targets", nargs="*", choices=list(TARGETS), help="要测试的检索路径（默认全部）")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="问题集重复执行的轮数")
+    parser.add_argument("--knowledge-base", default=None, help="知识库目录")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果JSON路径")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmark(args.questions, args.targets, args.top_k, args.repeat, args.knowledge_base)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"检索基准测试（{report['questions']}个问题，top_k={report['top_k']}）")
+    print("=" * 50)
+    for name, result in report["results"].items():
+        latency = result["latency_ms"]
+        print(f"{name:14s} p50={latency['p50']:.2f}ms p95={latency['p95']:.2f}ms p99={latency['p99']:.2f}ms "
+              f"qps={result['qps']:.0f} recall@k={result['recall_at_k']:.3f} mrr={result['mrr']:.3f} "
+              f"peak={result['peak_memory_mb']:.1f}MB")
+    print(f"结果已写入: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+启动耗时报告 - 记录各子系统首次初始化的耗时
+各系统改为首次使用时才创建，创建过程用 timed() 包裹并登记耗时，
+应用可据此展示冷启动时每个子系统（语料库、解卦系统、问答系统等）各花了多少时间
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+_timings: List[Dict[str, float]] = []
+_lock = threading.Lock()
+_process_start = time.perf_counter()
+
+
+def record(name: str, seconds: float):
+    """登记一个子系统的初始化耗时"""
+    with _lock:
+        _timings.append({
+            "name": name,
+            "seconds": seconds,
+            "since_start": time.perf_counter() - _process_start,
+        })
+    logger.info(f"{name}初始化完成，耗时{seconds:.2f}秒")
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """计时上下文：退出时登记耗时（初始化失败时不登记）"""
+    start = time.perf_counter()
+    yield
+    record(name, time.perf_counter() - start)
+
+
+def startup_report() -> List[Dict[str, float]]:
+    """按完成顺序返回各子系统的初始化耗时"""
+    with _lock:
+        return [dict(timing) for timing in _timings]
+
+
+def format_report() -> str:
+    """文本形式的启动耗时报告"""
+    timings = startup_report()
+    if not timings:
+        return "尚未初始化任何子系统"
+    # 子系统可能嵌套初始化（如解卦系统内加载语料库），耗时不做合计
+    return "\n".join(f"{timing['name']}: {timing['seconds']:.2f}秒（进程启动后{timing['since_start']:.2f}秒完成）"
+                     for timing in timings)
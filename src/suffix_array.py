@@ -0,0 +1,94 @@
+"""
+后缀数组 - 在拼接后的语料文本上精确查找原文短语
+全部段落文本以分隔符相连后，用 NumPy 前缀倍增法构建后缀数组（O(n log² n)），
+查询时对后缀数组二分查找，每次比较最多 m 个字符，耗时 O(m log n)，与段落数量无关；
+命中位置通过段落起始偏移表二分换算为 (段落序号, 段内偏移)
+"""
+
+import logging
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 段落之间的分隔符，不会出现在查询短语中，匹配因此不会跨越段落
+SEPARATOR = '\x00'
+
+
+def build_suffix_array(codes: np.ndarray) -> np.ndarray:
+    """前缀倍增法构建后缀数组：每轮按 (前k个字符的排名, 其后k个字符的排名) 排序，直到排名互不相同"""
+    n = len(codes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int32)
+    rank = np.unique(codes, return_inverse=True)[1].astype(np.int64)
+    suffixes = np.argsort(rank, kind='stable')
+    k = 1
+    while rank.max() < n - 1 and k < n:
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - k] = rank[k:]
+        suffixes = np.lexsort((second, rank))
+        first_sorted, second_sorted = rank[suffixes], second[suffixes]
+        changed = (first_sorted[1:] != first_sorted[:-1]) | (second_sorted[1:] != second_sorted[:-1])
+        rank = np.empty(n, dtype=np.int64)
+        rank[suffixes] = np.concatenate(([0], np.cumsum(changed)))
+        k *= 2
+    return suffixes.astype(np.int32)
+
+
+class SuffixArray:
+    """多段落文本上的后缀数组，支持精确短语查找并返回段落内偏移"""
+
+    def __init__(self, texts: Sequence[str]):
+        self.text = SEPARATOR.join(texts) + SEPARATOR
+        lengths = np.fromiter((len(text) + 1 for text in texts), dtype=np.int64, count=len(texts))
+        self.starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        codes = np.frombuffer(self.text.encode('utf-32-le'), dtype=np.uint32)
+        self.suffixes = build_suffix_array(codes)
+        logger.info(f"后缀数组构建完成，共{len(texts)}个段落，{len(self.text)}个字符")
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.starts)
+
+    def _bound(self, phrase: str, upper: bool) -> int:
+        """二分查找：前m个字符 >= phrase（upper时为 > phrase）的第一个后缀位置"""
+        text, suffixes, m = self.text, self.suffixes, len(phrase)
+        lo, hi = 0, len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = int(suffixes[mid])
+            prefix = text[start:start + m]
+            if prefix < phrase or (upper and prefix == phrase):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, phrase: str) -> Tuple[int, int]:
+        """以phrase开头的后缀在后缀数组中的区间 [lo, hi)"""
+        if not phrase or SEPARATOR in phrase:
+            return 0, 0
+        return self._bound(phrase, False), self._bound(phrase, True)
+
+    def count(self, phrase: str) -> int:
+        """短语在语料中出现的次数"""
+        lo, hi = self.range(phrase)
+        return hi - lo
+
+    def occurrences(self, phrase: str) -> List[Tuple[int, int]]:
+        """短语的全部出现位置 (段落序号, 段内偏移)，按段落与偏移排序"""
+        lo, hi = self.range(phrase)
+        if lo >= hi:
+            return []
+        positions = np.sort(self.suffixes[lo:hi].astype(np.int64))
+        docs = np.searchsorted(self.starts, positions, side='right') - 1
+        return list(zip(docs.tolist(), (positions - self.starts[docs]).tolist()))
+
+    def first_occurrences(self, phrase: str) -> List[Tuple[int, int]]:
+        """包含短语的各段落及其首次出现的偏移，按段落顺序排序"""
+        first: List[Tuple[int, int]] = []
+        for doc, offset in self.occurrences(phrase):
+            if not first or first[-1][0] != doc:
+                first.append((doc, offset))
+        return first
@@ -0,0 +1,215 @@
+"""
+稀疏向量检索引擎 - 预计算的TF-IDF稀疏矩阵
+知识库中每条记录只编码一次，以CSR格式（data / indices / indptr）保存为 .npz 文件
+查询时一次稀疏矩阵-向量乘法即可为全部记录打分，再用 np.argpartition 选出top_k
+"""
+
+import os
+import zlib
+import logging
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .knowledge_index import tokenize, tokenize_query
+
+logger = logging.getLogger(__name__)
+
+
+class SparseVectorIndex:
+    """哈希特征 + TF-IDF 的稀疏向量索引"""
+
+    def __init__(self, n_features: int = 2 ** 18):
+        self.n_features = n_features
+        self.data = np.zeros(0, dtype=np.float32)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.idf = np.ones(n_features, dtype=np.float32)
+        self.fingerprint = ""
+        self._row_ids = np.zeros(0, dtype=np.int32)
+        self._column_order: Optional[np.ndarray] = None
+        self._column_ptr: Optional[np.ndarray] = None
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.indptr) - 1
+
+    def _hash_terms(self, terms: List[str]) -> Dict[int, int]:
+        """词项哈希到固定维度的特征空间（crc32在不同进程间保持一致）"""
+        counts: Dict[int, int] = Counter()
+        for term, tf in Counter(terms).items():
+            counts[zlib.crc32(term.encode('utf-8')) % self.n_features] += tf
+        return counts
+
+    def build(self, texts: Sequence[str], fingerprint: str = ""):
+        """对全部记录编码，生成按行L2归一化的TF-IDF CSR矩阵"""
+        rows = [self._hash_terms(tokenize(text)) for text in texts]
+
+        doc_freq = np.zeros(self.n_features, dtype=np.float64)
+        for row in rows:
+            doc_freq[list(row.keys())] += 1
+        self.idf = (np.log((1 + len(rows)) / (1 + doc_freq)) + 1).astype(np.float32)
+
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for row in rows:
+            features = sorted(row)
+            weights = np.array([1 + np.log(row[f]) for f in features], dtype=np.float32) * self.idf[features]
+            norm = np.linalg.norm(weights)
+            indices.extend(features)
+            data.extend((weights / norm).tolist() if norm > 0 else weights.tolist())
+            indptr.append(len(indices))
+
+        self.data = np.asarray(data, dtype=np.float32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.fingerprint = fingerprint
+        self._prepare()
+        logger.info(f"TF-IDF矩阵编码完成，共{self.n_docs}条记录，非零元素{len(self.data)}个")
+
+    def _prepare(self):
+        """展开每个非零元素所属的行号，供矩阵-向量乘法使用"""
+        self._row_ids = np.repeat(np.arange(self.n_docs, dtype=np.int32), np.diff(self.indptr))
+        self._column_order = None
+        self._column_ptr = None
+
+    def encode_query(self, text: str) -> np.ndarray:
+        """将查询编码为归一化的稠密TF-IDF向量"""
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        for feature, tf in self._hash_terms(tokenize_query(text)).items():
+            vector[feature] = (1 + np.log(tf)) * self.idf[feature]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def scores(self, query_vector: np.ndarray) -> np.ndarray:
+        """稀疏矩阵-向量乘法：一次向量化运算得到全部记录的余弦相似度"""
+        return np.bincount(self._row_ids, weights=self.data * query_vector[self.indices],
+                           minlength=self.n_docs)
+
+    def search(self, text: str, top_k: int = 5,
+               doc_filter: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """检索与查询最相似的top_k条记录；doc_filter 在选出top_k之前过滤记录"""
+        if self.n_docs == 0:
+            return []
+        scores = self.scores(self.encode_query(text))
+        if doc_filter is not None:
+            # 只对得分非零的记录调用过滤函数
+            candidates = np.flatnonzero(scores > 0)
+            scores[candidates[~self._filter_mask(candidates, doc_filter)]] = 0
+        return self._top_k(scores, top_k)
+
+    @staticmethod
+    def _filter_mask(doc_ids: np.ndarray, doc_filter: Callable[[int], bool]) -> np.ndarray:
+        return np.fromiter((doc_filter(int(doc_id)) for doc_id in doc_ids), dtype=bool, count=len(doc_ids))
+
+    def _top_k(self, scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """用 np.argpartition 选出得分最高的top_k条记录"""
+        k = min(top_k, self.n_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in top if scores[doc_id] > 0]
+
+    def _columns(self):
+        """按特征列重排非零元素（CSC视图），供批量检索按特征取出整列"""
+        if self._column_order is None:
+            self._column_order = np.argsort(self.indices, kind='stable')
+            self._column_ptr = np.searchsorted(self.indices[self._column_order], np.arange(self.n_features + 1))
+        return self._column_order, self._column_ptr
+
+    def search_many(self, texts: Sequence[str], top_k: int = 5,
+                    doc_filter: Optional[Callable[[int], bool]] = None) -> List[List[Tuple[int, float]]]:
+        """批量检索：按批内去重后的特征取出整列，只为出现在这些列中的 (查询, 记录) 对累加得分，
+        开销与查询词项的倒排长度成正比，而不是 查询数 × 记录数；doc_filter 在选出top_k之前过滤记录"""
+        results: List[List[Tuple[int, float]]] = [[] for _ in texts]
+        if self.n_docs == 0:
+            return results
+        order, column_ptr = self._columns()
+
+        query_weights: Dict[int, List[Tuple[int, float]]] = {}
+        for query_id, text in enumerate(texts):
+            features = self._hash_terms(tokenize_query(text))
+            weights = {f: (1 + np.log(tf)) * self.idf[f] for f, tf in features.items()}
+            norm = np.sqrt(sum(w * w for w in weights.values()))
+            if norm == 0:
+                continue
+            for feature, weight in weights.items():
+                query_weights.setdefault(feature, []).append((query_id, weight / norm))
+
+        query_parts, doc_parts, value_parts = [], [], []
+        for feature, queries in query_weights.items():
+            column = order[column_ptr[feature]:column_ptr[feature + 1]]
+            if not len(column):
+                continue
+            query_ids = np.array([q for q, _ in queries], dtype=np.int64)
+            weights = np.array([w for _, w in queries], dtype=np.float32)
+            query_parts.append(np.repeat(query_ids, len(column)))
+            doc_parts.append(np.tile(self._row_ids[column].astype(np.int64), len(query_ids)))
+            value_parts.append(np.outer(weights, self.data[column]).ravel())
+        if not query_parts:
+            return results
+
+        # (查询, 记录) 编码为一个整数键，相同键的得分累加；键有序，同一查询的记录相邻
+        keys = np.concatenate(query_parts) * self.n_docs + np.concatenate(doc_parts)
+        touched, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=np.concatenate(value_parts))
+        touched_queries = touched // self.n_docs
+        touched_docs = touched % self.n_docs
+        if doc_filter is not None:
+            unique_docs, doc_inverse = np.unique(touched_docs, return_inverse=True)
+            keep = self._filter_mask(unique_docs, doc_filter)[doc_inverse]
+            touched_queries, touched_docs, sums = touched_queries[keep], touched_docs[keep], sums[keep]
+        bounds = np.searchsorted(touched_queries, np.arange(len(texts) + 1))
+        for query_id in range(len(texts)):
+            lo, hi = bounds[query_id], bounds[query_id + 1]
+            if hi > lo:
+                results[query_id] = self._top_k_sparse(touched_docs[lo:hi], sums[lo:hi], top_k)
+        return results
+
+    @staticmethod
+    def _top_k_sparse(doc_ids: np.ndarray, scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """在被访问到的记录中选出得分最高的top_k条（得分相同按记录号）"""
+        k = min(top_k, len(doc_ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((doc_ids[top], -scores[top]))]
+        return [(int(doc_ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path: str):
+        """保存为 .npz 文件"""
+        np.savez(path, data=self.data, indices=self.indices, indptr=self.indptr, idf=self.idf,
+                 n_features=np.int64(self.n_features), fingerprint=np.str_(self.fingerprint))
+
+    @classmethod
+    def load(cls, path: str) -> "SparseVectorIndex":
+        """从 .npz 文件加载，无需重新切分语料"""
+        with np.load(path) as archive:
+            index = cls(n_features=int(archive['n_features']))
+            index.data = archive['data']
+            index.indices = archive['indices']
+            index.indptr = archive['indptr']
+            index.idf = archive['idf']
+            index.fingerprint = str(archive['fingerprint'])
+        index._prepare()
+        return index
+
+    @classmethod
+    def load_or_build(cls, path: str, fingerprint: str, n_docs: int,
+                      get_texts: Callable[[], Sequence[str]]) -> "SparseVectorIndex":
+        """指纹一致时直接加载持久化矩阵，否则取出全部文本重新编码并保存"""
+        if os.path.exists(path):
+            try:
+                index = cls.load(path)
+                if index.fingerprint == fingerprint and index.n_docs == n_docs:
+                    logger.info(f"已加载TF-IDF矩阵: {path}")
+                    return index
+            except Exception as e:
+                logger.warning(f"加载TF-IDF矩阵失败，将重新编码: {e}")
+
+        index = cls()
+        index.build(get_texts(), fingerprint)
+        try:
+            index.save(path)
+        except OSError as e:
+            logger.warning(f"保存TF-IDF矩阵失败: {e}")
+        return index
@@ -0,0 +1,46 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src import casting, hexagram
+
+
+def _get_yao_type(coin_results):
+    """app.get_yao_type 的规则：阳面数 3/2/1/0 -> 老阳/少阳/少阴/老阴"""
+    return {3: "老阳", 2: "少阳", 1: "少阴", 0: "老阴"}[sum(coin_results)]
+
+
+def test_line_by_heads_matches_get_yao_type():
+    for heads in range(4):
+        coins = [1] * heads + [0] * (3 - heads)
+        assert casting._LINE_BY_HEADS[heads] == hexagram.YAO_VALUES[_get_yao_type(coins)]
+
+
+def test_casting_is_deterministic_and_leaves_the_global_rng_alone():
+    state = random.getstate()
+    first = casting.cast_reading("今年事业如何", "2026-10-16")
+    assert random.getstate() == state
+    assert casting.stable_seed("2026-10-16", "今年事业如何") == casting.reading_seed("今年事业如何", "2026-10-16")
+    assert casting.cast_lines([casting.reading_seed("今年事业如何", "2026-10-16")])[0].tolist() == first["lines"]
+
+    questions = [f"问题{i}" for i in range(50)]
+    lines = casting.cast_lines([casting.reading_seed(q, "2026-10-16") for q in questions])
+    assert len({tuple(row) for row in lines.tolist()}) > 1
+
+
+def test_toss_coins_matches_cast_lines():
+    lines = casting.cast_lines([casting.reading_seed("婚姻", "2026-01-01")])[0]
+    for index in range(6):
+        coins = casting.toss_coins("婚姻", index, "2026-01-01")
+        assert hexagram.YAO_VALUES[_get_yao_type(coins)] == lines[index]
+
+
+def test_batch_matches_single_casts_across_threads():
+    questions = [f"问题{i}" for i in range(200)]
+    batch = casting.cast_readings(questions, "2026-10-16")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        singles = list(executor.map(lambda q: casting.cast_reading(q, "2026-10-16"), questions))
+    assert batch["lines"].tolist() == [single["lines"] for single in singles]
+    assert batch["primary"].tolist() == [single["primary"] for single in singles]
+    assert np.isin(batch["lines"], [6, 7, 8, 9]).all()
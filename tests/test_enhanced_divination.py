@@ -0,0 +1,23 @@
+import pytest
+
+from src import enhanced_divination_system
+from src.enhanced_divination_system import EnhancedDivinationSystem
+
+
+@pytest.fixture
+def divination(monkeypatch):
+    # 不加载知识库：变爻校验与变卦计算不依赖语料
+    monkeypatch.setattr(enhanced_divination_system, "resolve_knowledge_base_dir", lambda: None)
+    return EnhancedDivinationSystem()
+
+
+@pytest.mark.parametrize("moving_lines", [[7], [0], [-1], [1, 7], [2.5], ["3"], [True]])
+def test_changing_gua_analysis_rejects_invalid_moving_lines(divination, moving_lines):
+    with pytest.raises(ValueError, match="无效的变爻位置"):
+        divination.get_changing_gua_analysis("乾卦", "111111", moving_lines)
+
+
+def test_changing_gua_analysis_accepts_valid_moving_lines(divination):
+    result = divination.get_changing_gua_analysis("乾卦", "111111", [6, 1, 1])
+    assert result["moving_lines"] == [1, 6]
+    assert len(result["moving_line_texts"]) == 2
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src import hexagram
+
+
+def _code(name):
+    return hexagram.name_to_code(name)
+
+
+def test_king_wen_table_covers_all_64_hexagrams_once():
+    assert sorted(hexagram.CODE_BY_NUMBER[1:].tolist()) == list(range(64))
+    assert len(set(hexagram.GUA_NAMES)) == 64
+    assert hexagram.KING_WEN_NUMBER[hexagram.CODE_BY_NUMBER[1:]].tolist() == list(range(1, 65))
+
+
+@pytest.mark.parametrize("name, number, symbol, upper, lower", [
+    ("乾卦", 1, "111111", "乾", "乾"),
+    ("坤卦", 2, "000000", "坤", "坤"),
+    ("屯卦", 3, "100010", "坎", "震"),
+    ("蒙卦", 4, "010001", "艮", "坎"),
+    ("泰卦", 11, "111000", "坤", "乾"),
+    ("既济卦", 63, "101010", "坎", "离"),
+    ("未济卦", 64, "010101", "离", "坎"),
+])
+def test_king_wen_entries(name, number, symbol, upper, lower):
+    code = hexagram.symbol_to_code(symbol)
+    info = hexagram.describe(code)
+    assert (info["id"], info["name"], info["upper_trigram"], info["lower_trigram"]) == (number, name, upper, lower)
+    assert hexagram.gua_name(symbol) == name
+    assert hexagram.name_to_code(name[:-1]) == code
+    assert hexagram.code_to_symbol(code) == symbol
+
+
+@pytest.mark.parametrize("name, cuo, zong, hu", [
+    ("乾卦", "坤卦", "乾卦", "乾卦"),
+    ("屯卦", "鼎卦", "蒙卦", "剥卦"),
+    ("泰卦", "否卦", "否卦", "归妹卦"),
+    ("咸卦", "损卦", "恒卦", "姤卦"),
+    ("既济卦", "未济卦", "未济卦", "未济卦"),
+])
+def test_cuo_zong_hu(name, cuo, zong, hu):
+    code = _code(name)
+    assert hexagram.NAMES[hexagram.CUO[code]] == cuo
+    assert hexagram.NAMES[hexagram.ZONG[code]] == zong
+    assert hexagram.NAMES[hexagram.HU[code]] == hu
+
+
+def test_relations_match_line_by_line_definitions():
+    for code in range(64):
+        lines = [code >> i & 1 for i in range(6)]
+        assert hexagram.CUO[code] == sum((1 - line) << i for i, line in enumerate(lines))
+        assert hexagram.ZONG[code] == sum(line << i for i, line in enumerate(reversed(lines)))
+        hu_lines = lines[1:4] + lines[2:5]
+        assert hexagram.HU[code] == sum(line << i for i, line in enumerate(hu_lines))
+        for mask in (0, 1, 0b100100, 63):
+            related = hexagram.relations(code, mask)
+            assert related["changed"]["code"] == code ^ mask
+            assert [related[kind]["code"] for kind in ("hu", "cuo", "zong")] == \
+                [hexagram.HU[code], hexagram.CUO[code], hexagram.ZONG[code]]
+
+
+def test_changed_hexagram_flips_moving_lines():
+    assert hexagram.relations(_code("乾卦"), 0b000001)["changed"]["name"] == "姤卦"
+    assert hexagram.relations(_code("坤卦"), 0b000001)["changed"]["name"] == "复卦"
+    assert hexagram.relations(_code("乾卦"), 63)["changed"]["name"] == "坤卦"
+
+
+def test_line_titles():
+    assert hexagram.line_titles(_code("屯卦")) == ["初九", "六二", "六三", "六四", "九五", "上六"]
+
+
+def test_evaluate_cast_reads_moving_lines_bottom_up():
+    result = hexagram.evaluate_cast(["老阳", "少阳", "少阳", "少阳", "少阳", "少阴"])
+    assert result["primary_name"] == "夬卦"
+    assert result["moving_lines"] == [1]
+    assert result["changed_name"] == "大过卦"
+    batch = hexagram.evaluate_casts(np.array([[9, 7, 7, 7, 7, 8], [6, 8, 8, 8, 8, 8]]))
+    assert batch["primary_names"].tolist() == ["夬卦", "坤卦"]
+    assert batch["changed_names"].tolist() == ["大过卦", "复卦"]
@@ -0,0 +1,51 @@
+import json
+import os
+
+from src.kb_store import (JSONL_TEXT_FIELDS, CompiledStore, compile_source, compile_store, compiled_path,
+                          open_compiled)
+
+RECORDS = [
+    {"id": "qa_0000", "question": "乾卦是什么", "answer": "乾为天", "source_text": "乾：元亨利贞。", "segment_index": 0},
+    {"id": "qa_0001", "question": "", "answer": "坤为地", "source_text": "", "tags": ["坤", "地"]},
+]
+
+
+def _write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def test_compiled_store_round_trips_records_and_extra(tmp_path):
+    path = compile_store(RECORDS, str(tmp_path / "kb.kbs"), JSONL_TEXT_FIELDS, extra={"source": "《测试》"})
+    store = CompiledStore(path)
+    try:
+        assert len(store) == 2
+        assert [dict(record) for record in store] == RECORDS
+        assert store[-1]["tags"] == ["坤", "地"]
+        assert store.text(0, "source_text") == "乾：元亨利贞。"
+        assert store.extra() == {"source": "《测试》"}
+    finally:
+        store.close()
+
+
+def test_open_compiled_falls_back_when_the_source_changes(tmp_path):
+    source = str(tmp_path / "kb.jsonl")
+    _write_jsonl(source, RECORDS)
+    assert open_compiled(source) is None
+
+    compile_source(source)
+    assert os.path.exists(compiled_path(source))
+    store = open_compiled(source)
+    assert store is not None and store[0]["answer"] == "乾为天"
+    store.close()
+
+    # 大小不变的改写：修改时间按纳秒比较，仍判定为过期
+    stat = os.stat(source)
+    with open(source, "r+", encoding="utf-8") as f:
+        content = f.read()
+        f.seek(0)
+        f.write(content.replace("乾为天", "天为乾"))
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert os.path.getsize(source) == stat.st_size
+    assert open_compiled(source) is None
@@ -0,0 +1,97 @@
+import math
+import random
+
+import pytest
+
+from src.knowledge_index import InvertedIndex, SegmentedIndex, tokenize, tokenize_query
+
+ALPHABET = "乾坤震巽坎离艮兑卦爻阴阳五行吉凶"
+
+TEXTS = ["乾卦元亨利贞", "坤卦元亨利牝马之贞", "屯卦元亨利贞勿用有攸往", "客厅风水布局"]
+
+
+def _segment(texts, start_id):
+    segment = InvertedIndex()
+    for offset, text in enumerate(texts):
+        segment.add_text(start_id + offset, text)
+    segment.finalize()
+    return segment
+
+
+def _index(texts):
+    index = SegmentedIndex()
+    index.set_base(_segment(texts, 0))
+    return index
+
+
+def test_postings_list_documents_in_id_order_with_term_frequencies():
+    segment = _segment(["乾乾卦", "坤卦", "乾坤"], 0)
+    assert segment.get_postings("乾") == [(0, 2), (2, 1)]
+    assert segment.get_postings("卦") == [(0, 1), (1, 1)]
+    assert segment.get_postings("震") == []
+
+
+def test_search_only_returns_documents_containing_query_terms():
+    index = _index(TEXTS)
+    assert [doc_id for doc_id, _ in index.search(tokenize_query("屯卦"), top_k=10)] == [2, 0, 1]
+    assert index.search(tokenize_query("震巽"), top_k=10) == []
+    assert index.matching_documents(["元亨", "贞"]) == [0, 1, 2]
+    assert index.matching_documents(["元亨", "风水"]) == []
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_maxscore_search_matches_exhaustive_scoring(seed):
+    rng = random.Random(seed)
+    texts = ["".join(rng.choices(ALPHABET, k=rng.randint(5, 60))) for _ in range(rng.randint(20, 200))]
+    index = SegmentedIndex(merge_threshold=100)
+    split = len(texts) // 2
+    index.set_base(_segment(texts[:split], 0))
+    # 增量段的平均长度与基础段不同，覆盖上界按长度比放大的情形
+    index.add_segment(_segment([text * 2 for text in texts[split:]], split))
+
+    for _ in range(10):
+        query = "".join(rng.choices(ALPHABET, k=rng.randint(1, 8)))
+        top_k = rng.randint(1, 10)
+        pruned = index.search(tokenize_query(query), top_k)
+        exhaustive = index.search_many([tokenize_query(query)], top_k)[0]
+        assert [doc_id for doc_id, _ in pruned] == [doc_id for doc_id, _ in exhaustive]
+        assert [score for _, score in pruned] == pytest.approx([score for _, score in exhaustive])
+
+
+def test_tokenize_splits_chinese_into_unigrams_and_bigrams():
+    assert tokenize("乾卦 BM25") == ["乾", "卦", "乾卦", "bm25"]
+    assert tokenize_query("什么是乾卦") == ["乾", "卦", "是乾", "乾卦"]
+
+
+def _bm25(texts, query, k1=1.5, b=0.75):
+    """按定义逐条计算BM25得分，作为参照"""
+    docs = [tokenize(text) for text in texts]
+    avg_length = sum(map(len, docs)) / len(docs)
+    scores = {}
+    for doc_id, doc in enumerate(docs):
+        score = 0.0
+        for term in set(query):
+            tf = doc.count(term)
+            doc_freq = sum(term in other for other in docs)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - doc_freq + 0.5) / (doc_freq + 0.5))
+            score += query.count(term) * idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_length))
+        if score > 0:
+            scores[doc_id] = score
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+@pytest.mark.parametrize("query", ["元亨利贞", "坤卦", "勿用有攸往", "风水布局", "乾坤"])
+def test_bm25_scores_match_the_definition(query):
+    index = _index(TEXTS)
+    terms = tokenize_query(query)
+    expected = _bm25(TEXTS, terms)
+    hits = index.search(terms, top_k=10)
+    assert [doc_id for doc_id, _ in hits] == [doc_id for doc_id, _ in expected]
+    assert [score for _, score in hits] == pytest.approx([score for _, score in expected])
+
+
+def test_bm25_prefers_shorter_documents_for_the_same_term_frequency():
+    index = _index(["乾卦", "乾卦之后还有很多不相关的文字内容"])
+    assert [doc_id for doc_id, _ in index.search(tokenize_query("乾卦"), top_k=2)] == [0, 1]
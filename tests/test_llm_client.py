@@ -0,0 +1,222 @@
+import json
+import threading
+import time
+
+import pytest
+
+from src import llm_client
+from src.llm_client import DASHSCOPE_STYLE, OPENAI_STYLE, LLMClient, ProviderConfig, build_messages
+
+MESSAGES = build_messages("你是易经专家", "乾卦是什么")
+
+
+class FakeResponse:
+    def __init__(self, body=None, lines=()):
+        self.body = body
+        self.lines = list(lines)
+        self.encoding = None
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+    def iter_lines(self, chunk_size=None, decode_unicode=False):
+        yield from self.lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.posts = []
+
+    def post(self, url, json=None, timeout=None, **kwargs):
+        self.posts.append((url, json, kwargs))
+        return self.response
+
+    def close(self):
+        pass
+
+
+def _client(style=OPENAI_STYLE, response=None, name="fake"):
+    client = LLMClient(ProviderConfig(name, "https://example.invalid/v1", "key", "model", style))
+    client.session = FakeSession(response)
+    return client
+
+
+def test_payload_and_response_follow_each_provider_format():
+    openai = _client(OPENAI_STYLE)
+    payload = openai.build_payload(MESSAGES, 0.5, 100)
+    assert payload == {"model": "model", "messages": MESSAGES, "temperature": 0.5, "max_tokens": 100}
+    assert openai.parse_response({"choices": [{"message": {"content": "乾为天"}}]}) == "乾为天"
+
+    dashscope = _client(DASHSCOPE_STYLE)
+    payload = dashscope.build_payload(MESSAGES, 0.5, 100, stream=True)
+    assert payload["input"] == {"messages": MESSAGES}
+    assert payload["parameters"] == {"temperature": 0.5, "max_tokens": 100, "incremental_output": True}
+    assert dashscope.parse_response({"output": {"text": "坤为地"}}) == "坤为地"
+
+
+def test_client_reuses_one_session_and_counts_requests():
+    pooled = LLMClient(ProviderConfig("fake", "https://example.invalid/v1", "key", "model", pool_size=4))
+    assert pooled.session.headers["Authorization"] == "Bearer key"
+    assert pooled.session.get_adapter("https://example.invalid/v1") is pooled.adapter
+
+    client = _client(response=FakeResponse({"choices": [{"message": {"content": "乾为天"}}]}))
+    assert [client.chat(MESSAGES) for _ in range(3)] == ["乾为天"] * 3
+    assert len(client.session.posts) == 3
+    metrics = client.metrics()
+    assert (metrics["requests"], metrics["errors"]) == (3, 0)
+
+
+def test_get_client_returns_the_shared_instance(monkeypatch):
+    client = _client(name="shared")
+    monkeypatch.setitem(llm_client._clients, "shared", client)
+    assert llm_client.get_client("shared") is client
+
+
+def _answer_after(delay, text, cancelled=None):
+    """模拟服务商调用：delay 秒后返回 text，期间被取消则返回None（并记录到 cancelled）"""
+    def call(cancel):
+        if cancel.wait(delay):
+            if cancelled is not None:
+                cancelled.append(text)
+            return None
+        return text
+    return call
+
+
+def test_gather_answers_first_returns_fastest_and_cancels_the_rest():
+    cancelled = []
+    answers = llm_client.gather_answers({
+        "deepseek": _answer_after(0.5, "较慢但更长的回答", cancelled),
+        "qwen": _answer_after(0.01, "快的回答"),
+    }, policy="first", deadline=5)
+    assert answers == [("qwen", "快的回答")]
+    time.sleep(0.05)
+    assert cancelled == ["较慢但更长的回答"]
+
+
+def test_gather_answers_longest_and_merge_wait_for_all_answers():
+    calls = {"deepseek": _answer_after(0.1, "较慢但更长的回答"), "qwen": _answer_after(0.01, "快的回答")}
+    assert llm_client.gather_answers(calls, policy="longest", deadline=5) == [("deepseek", "较慢但更长的回答")]
+    assert llm_client.gather_answers(calls, policy="merge", deadline=5) == [
+        ("deepseek", "较慢但更长的回答"), ("qwen", "快的回答")]
+
+
+def test_gather_answers_drops_failures_and_calls_past_the_deadline():
+    def failing(cancel):
+        raise RuntimeError("服务不可用")
+
+    cancelled = []
+    answers = llm_client.gather_answers({
+        "failing": failing,
+        "slow": _answer_after(5, "超时的回答", cancelled),
+        "ok": _answer_after(0.01, "回答"),
+    }, policy="merge", deadline=0.2)
+    assert answers == [("ok", "回答")]
+    time.sleep(0.05)
+    assert cancelled == ["超时的回答"]
+    with pytest.raises(ValueError):
+        llm_client.gather_answers({}, policy="fastest")
+
+
+class SlowClient(LLMClient):
+    """按固定延迟返回回答的客户端，记录调用与取消"""
+
+    def __init__(self, name, delay, text=None, error=None):
+        super().__init__(ProviderConfig(name, "https://example.invalid/v1", "key", "model"))
+        self.delay, self.text, self.error = delay, text, error
+        self.calls = 0
+        self.cancelled = False
+
+    def chat(self, messages, temperature=0.7, max_tokens=800, timeout=None, cancel=None, use_cache=False, ttl=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        if cancel is not None and cancel.wait(self.delay):
+            self.cancelled = True
+            return None
+        return self.text
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    def install(**clients):
+        for name, client in clients.items():
+            monkeypatch.setitem(llm_client._clients, name, client)
+        return clients
+    return install
+
+
+def test_hedged_chat_sends_a_hedge_after_the_delay_and_cancels_the_loser(providers):
+    clients = providers(primary=SlowClient("primary", 2, "首选的回答"), backup=SlowClient("backup", 0.01, "备用的回答"))
+    assert llm_client.hedged_chat(["primary", "backup"], "系统", "问题", hedge_delay=0.05) == ("backup", "备用的回答")
+    time.sleep(0.05)
+    assert clients["primary"].cancelled
+
+
+def test_hedged_chat_does_not_hedge_a_fast_primary(providers):
+    clients = providers(primary=SlowClient("primary", 0.01, "首选的回答"), backup=SlowClient("backup", 0.01, "备用的回答"))
+    assert llm_client.hedged_chat(["primary", "backup"], "系统", "问题", hedge_delay=1) == ("primary", "首选的回答")
+    assert clients["backup"].calls == 0
+
+
+def test_hedged_chat_falls_back_at_once_on_failure_or_rejected_answer(providers):
+    providers(broken=SlowClient("broken", 0, error=RuntimeError("503")), short=SlowClient("short", 0.01, "短"),
+              backup=SlowClient("backup", 0.01, "足够长的备用回答"))
+    start = time.monotonic()
+    assert llm_client.hedged_chat(["broken", "backup"], "系统", "问题", hedge_delay=5) == ("backup", "足够长的备用回答")
+    assert llm_client.hedged_chat(["short", "backup"], "系统", "问题", hedge_delay=5,
+                                  accept=lambda text: len(text) > 2) == ("backup", "足够长的备用回答")
+    assert time.monotonic() - start < 1
+
+
+def _sse(*events):
+    return [f"data: {json.dumps(event, ensure_ascii=False)}" for event in events] + ["", "data: [DONE]"]
+
+
+def test_stream_chat_yields_deltas_for_each_provider_format():
+    openai = _client(OPENAI_STYLE, FakeResponse(lines=_sse(
+        {"choices": [{"delta": {"content": "乾为"}}]}, {"choices": [{"delta": {}}]}, {"choices": [{"delta": {"content": "天"}}]})))
+    assert list(openai.stream_chat(MESSAGES)) == ["乾为", "天"]
+    assert openai.session.posts[0][1]["stream"] is True
+
+    dashscope = _client(DASHSCOPE_STYLE, FakeResponse(lines=_sse({"output": {"text": "坤为"}}, {"output": {"text": "地"}})))
+    assert list(dashscope.stream_chat(MESSAGES)) == ["坤为", "地"]
+    assert dashscope.session.posts[0][2]["headers"]["X-DashScope-SSE"] == "enable"
+
+
+def test_cancelled_stream_closes_the_response():
+    response = FakeResponse(lines=_sse(*({"choices": [{"delta": {"content": "字"}}]} for _ in range(10))))
+    client = _client(OPENAI_STYLE, response)
+    cancel = threading.Event()
+    received = []
+    for delta in client.stream_chat(MESSAGES, cancel=cancel):
+        received.append(delta)
+        if len(received) == 2:
+            cancel.set()
+    assert received == ["字", "字"] and response.closed
+    assert client.metrics()["cancelled"] == 1
+
+
+def test_stream_with_fallback_restarts_on_the_next_provider(monkeypatch):
+    class BrokenResponse(FakeResponse):
+        def iter_lines(self, chunk_size=None, decode_unicode=False):
+            yield _sse({"choices": [{"delta": {"content": "半句"}}]})[0]
+            raise ConnectionError("连接中断")
+
+    monkeypatch.setitem(llm_client._clients, "broken", _client(OPENAI_STYLE, BrokenResponse(), "broken"))
+    monkeypatch.setitem(llm_client._clients, "backup", _client(DASHSCOPE_STYLE, FakeResponse(
+        lines=_sse({"output": {"text": "完整"}}, {"output": {"text": "回答"}})), "backup"))
+    shown = []
+    assert llm_client.stream_with_fallback(["broken", "backup"], "系统", "问题", shown.append) == ("backup", "完整回答")
+    assert shown == ["半句", "完整", "完整回答"]
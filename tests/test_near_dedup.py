@@ -0,0 +1,38 @@
+import pytest
+
+from src.near_dedup import MinHashDeduplicator, dedup_stats
+
+BASE = "乾卦元亨利贞。初九潜龙勿用。九二见龙在田利见大人。九三君子终日乾乾夕惕若厉无咎。九四或跃在渊无咎。九五飞龙在天利见大人。上九亢龙有悔。用九见群龙无首吉。"
+
+
+def _items(texts):
+    return [{"id": f"p{i}", "text": text} for i, text in enumerate(texts)]
+
+
+def test_near_duplicates_collapse_to_the_first_passage():
+    texts = [BASE, BASE[:-1] + "！", "坤卦元亨利牝马之贞。君子有攸往先迷后得主利。", BASE]
+    deduplicator = MinHashDeduplicator(threshold=0.8)
+    kept, collapsed = deduplicator.deduplicate(_items(texts), lambda item: item["text"])
+
+    assert [item["id"] for item in kept] == ["p0", "p2"]
+    assert collapsed == {"p1": "p0", "p3": "p0"}
+    assert kept[0]["duplicates"] == ["p1", "p3"]
+    assert dedup_stats(4, len(kept), collapsed, 0.8)["clusters"] == 1
+
+
+def test_dissimilar_and_empty_passages_are_kept():
+    texts = [BASE, BASE[:len(BASE) // 2] + "坤卦元亨利牝马之贞君子有攸往先迷后得主利西南得朋", "", ""]
+    kept, collapsed = MinHashDeduplicator(threshold=0.8).deduplicate(_items(texts), lambda item: item["text"])
+    assert len(kept) == 4 and collapsed == {}
+
+
+def test_signature_similarity_estimates_jaccard():
+    deduplicator = MinHashDeduplicator(threshold=0.5, num_perm=256)
+    a, b = set(deduplicator.shingles(BASE)), set(deduplicator.shingles(BASE[:60]))
+    estimate = float((deduplicator.signature(BASE) == deduplicator.signature(BASE[:60])).mean())
+    assert estimate == pytest.approx(len(a & b) / len(a | b), abs=0.1)
+
+
+def test_threshold_must_be_in_range():
+    with pytest.raises(ValueError):
+        MinHashDeduplicator(threshold=0)
@@ -0,0 +1,24 @@
+import json
+
+from src.passage_corpus import JSONL_FILE, PassageCorpus
+
+
+def _record(i):
+    return json.dumps({"id": f"qa_{i:04d}", "question": f"问题{i}", "answer": f"第{i}条不同的回答内容{'甲乙丙丁'[i % 4] * i}"},
+                      ensure_ascii=False)
+
+
+def test_hot_reload_numbers_jsonl_records_like_a_full_load(tmp_path):
+    path = tmp_path / JSONL_FILE
+    path.write_text(_record(0) + "\n\n" + _record(1) + "\n", encoding="utf-8")
+    corpus = PassageCorpus(str(tmp_path), reload_interval=0, dedup_threshold=None)
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\n" + _record(2) + "\n" + _record(3) + "\n")
+    corpus._ingest_updates()
+    ingested = [(passage["id"], passage["question"]) for passage in corpus.passages]
+
+    corpus._reload_all()
+    reloaded = [(passage["id"], passage["question"]) for passage in corpus.passages]
+    assert ingested == reloaded
+    assert [passage_id for passage_id, _ in reloaded] == ["jsonl:0000", "jsonl:0001", "jsonl:0002", "jsonl:0003"]
@@ -0,0 +1,64 @@
+import json
+
+from src.rag_qa_system import IChingRAGSystem, RAGKnowledgeBase
+from src.vector_retrieval import SparseVectorIndex
+
+
+def _write_knowledge_base(directory, records):
+    with open(directory / "complete_knowledge_base_cleaned.jsonl", "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def test_tfidf_filters_registered_knowledge_before_top_k(tmp_path):
+    _write_knowledge_base(tmp_path, [
+        {"id": f"qa_{i:04d}", "question": f"第{i}卦的含义", "answer": f"乾卦第{i}爻，风水与阴阳五行相关，布局讲究生克"}
+        for i in range(6)
+    ])
+    kb = RAGKnowledgeBase(str(tmp_path), retrieval_mode="tfidf")
+    kb.corpus.register_knowledge("fengshui", {
+        "客厅": {f"布局{i}": f"客厅风水布局第{i}条：客厅布局要明亮宽敞" for i in range(10)},
+    })
+    kb.check_vector_index()
+    if kb._vector_thread is not None:
+        kb._vector_thread.join()
+
+    contexts = kb.search_relevant_context("客厅风水布局", top_k=5)
+    assert len(contexts) == 5
+    assert all(ctx["passage_id"].startswith("jsonl:") for ctx in contexts)
+
+    kb.retrieval_mode = "bm25"
+    assert len(kb.search_relevant_context("客厅风水布局", top_k=5)) == len(contexts)
+
+
+def test_cached_question_sees_passages_added_afterwards(tmp_path):
+    _write_knowledge_base(tmp_path, [
+        {"id": f"qa_{i:04d}", "question": f"第{i}卦的含义", "answer": f"乾卦第{i}爻的解释"} for i in range(3)
+    ])
+    system = IChingRAGSystem(str(tmp_path))
+    question = "坤卦六二爻辞"
+    system.answer_question(question)
+    system.answer_question(question)
+    assert system.query_cache.stats()["hits"] == 1
+
+    system.knowledge_base.add_passages([
+        {"question": "坤卦六二", "answer": "坤卦六二：直方大，不习无不利。", "source_text": "新增的坤卦六二爻辞"},
+    ])
+    after = system.answer_question(question)
+    assert any("新增的坤卦六二爻辞" in source for source in after["relevant_sources"])
+
+
+def test_sparse_search_filters_only_scored_documents():
+    index = SparseVectorIndex()
+    index.build(["乾卦元亨利贞", "坤卦元亨", "客厅风水布局", "梦见蛇"])
+    checked = []
+
+    def doc_filter(doc_id):
+        checked.append(doc_id)
+        return doc_id != 0
+
+    hits = index.search("乾卦坤卦", top_k=5, doc_filter=doc_filter)
+    assert [doc_id for doc_id, _ in hits] == [1]
+    assert sorted(checked) == [0, 1]
+    batch_hits = index.search_many(["乾卦坤卦"], top_k=5, doc_filter=lambda doc_id: doc_id != 0)[0]
+    assert [doc_id for doc_id, _ in batch_hits] == [1]
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from src.llm_client import LLMClient, ProviderConfig, build_messages
+from src.response_cache import ResponseCache, fingerprint
+
+MESSAGES = build_messages("你是易经专家", "乾卦是什么")
+
+
+def test_entries_expire_after_their_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl=60)
+    cache.set("default", "model", "默认过期时间")
+    cache.set("expired", "model", "已过期", ttl=-1)
+    assert cache.get("default") == "默认过期时间"
+    assert cache.get("expired") is None
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["expired"], metrics["entries"]) == (1, 1, 1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", "model", "甲")
+    time.sleep(0.01)
+    cache.set("b", "model", "乙")
+    time.sleep(0.01)
+    assert cache.get("a") == "甲"
+    time.sleep(0.01)
+    cache.set("c", "model", "丙")
+    assert [cache.get(key) for key in ("a", "b", "c")] == ["甲", None, "丙"]
+    assert cache.metrics()["evictions"] == 1
+    cache.clear()
+    assert cache.metrics()["entries"] == 0
+
+
+def test_fingerprint_covers_model_messages_and_parameters():
+    key = fingerprint("deepseek/chat", MESSAGES, 0.7, 800)
+    assert key == fingerprint("deepseek/chat", [dict(message) for message in MESSAGES], 0.7, 800)
+    assert len({key, fingerprint("qwen/turbo", MESSAGES, 0.7, 800), fingerprint("deepseek/chat", MESSAGES, 0.8, 800),
+                fingerprint("deepseek/chat", build_messages("你是易经专家", "坤卦是什么"), 0.7, 800)}) == 4
+
+
+def test_client_uses_the_cache_only_when_asked(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    client = LLMClient(ProviderConfig("fake", "https://example.invalid/v1", "key", "model"), cache=cache)
+    client._store(MESSAGES, 0.7, 800, "乾为天")
+    requests_sent = []
+
+    def post(*args, **kwargs):
+        requests_sent.append(args)
+        raise OSError("offline")
+
+    client.session.post = post
+    assert client.chat(MESSAGES, use_cache=True) == "乾为天"
+    assert requests_sent == []
+    with pytest.raises(OSError):
+        client.chat(MESSAGES)
+    assert len(requests_sent) == 1
@@ -0,0 +1,53 @@
+import json
+import random
+
+import pytest
+
+from src.passage_corpus import JSONL_FILE, PassageCorpus
+from src.suffix_array import SuffixArray
+
+
+def _all_occurrences(texts, phrase):
+    """用 str.find 逐段查找全部（可重叠的）出现位置，作为参照"""
+    hits = []
+    for doc, text in enumerate(texts):
+        offset = text.find(phrase)
+        while offset >= 0:
+            hits.append((doc, offset))
+            offset = text.find(phrase, offset + 1)
+    return hits
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_occurrences_match_str_find(seed):
+    rng = random.Random(seed)
+    texts = ["".join(rng.choices("乾坤元亨利贞", k=rng.randint(0, 40))) for _ in range(rng.randint(1, 30))]
+    suffix_array = SuffixArray(texts)
+    for _ in range(20):
+        phrase = "".join(rng.choices("乾坤元亨利贞", k=rng.randint(1, 4)))
+        expected = _all_occurrences(texts, phrase)
+        assert suffix_array.occurrences(phrase) == expected
+        assert suffix_array.count(phrase) == len(expected)
+        assert suffix_array.first_occurrences(phrase) == [
+            (doc, texts[doc].find(phrase)) for doc in sorted({doc for doc, _ in expected})
+        ]
+
+
+def test_matches_never_span_passages():
+    suffix_array = SuffixArray(["潜龙", "勿用"])
+    assert suffix_array.occurrences("龙勿") == []
+    assert suffix_array.occurrences("") == []
+
+
+def test_corpus_find_occurrences_matches_str_find(tmp_path):
+    answers = ["初九：潜龙勿用。", "九二：见龙在田，利见大人。", "潜龙勿用，阳在下也。"]
+    with open(tmp_path / JSONL_FILE, "w", encoding="utf-8") as f:
+        for i, answer in enumerate(answers):
+            f.write(json.dumps({"id": f"qa_{i}", "question": "", "answer": answer}, ensure_ascii=False) + "\n")
+    corpus = PassageCorpus(str(tmp_path), dedup_threshold=None)
+    corpus.add_passages([{"id": "added:0", "source": "jsonl", "book": "", "text": "用九：见群龙无首，吉。潜龙勿用"}])
+
+    for phrase in ("潜龙勿用", "见", "群龙无首", "飞龙"):
+        expected = [(passage["id"], passage["text"].find(phrase))
+                    for passage in corpus.passages if phrase in passage["text"]]
+        assert [(passage["id"], offset) for passage, offset in corpus.find_occurrences(phrase)] == expected